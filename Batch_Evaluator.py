@@ -0,0 +1,725 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Batch_Evaluator.py
+
+DESCRIPTION
+    Batched AEP evaluation of many layouts against one or many wind roses
+    ============================================================
+
+    Same Jensen (PARK) wake model and nearest-neighbour power curve look
+    up as getAEP in the GA scripts, but broadcast over a whole population
+    of layouts at once. The farm power of every layout for every wind
+    instance is computed a single time and then weighted by as many
+    wind roses as needed, so scoring against all the yearly wind files
+    costs the same as scoring against one.
+
+    Typical use:
+
+        power_curve = loadPowerCurve('power_curve.csv')
+        tables      = preProcessing(power_curve, turb_diam=100)
+        years, wind = binWindEnsemble(sorted(glob.glob('wind_data_20*.csv')))
+        result      = ensembleAEP(layouts, wind, tables)
+        result['min'], result['p90']
+"""
+
+# Module List
+import numpy  as np
+import pandas as pd
+from collections        import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import os
+
+
+# direction 'slices' in degrees
+slices_drct   = np.roll(np.arange(10, 361, 10, dtype=np.float32), 1)
+## slices_drct   = [360, 10.0, 20.0.......340, 350]
+n_slices_drct = slices_drct.shape[0]
+
+# speed 'slices'
+slices_sped   = np.arange(0.0, 31.0, 2.0, dtype=np.float32)
+n_slices_sped = slices_sped.shape[0] - 1
+
+# Wake decay constant kw for the offshore case
+kw = 0.05
+
+# bytes per (target, source) turbine pair alive at the peak of a wake
+# evaluation: three float32 temporaries and one bool mask
+bytes_per_pair = 13
+
+# bytes per (layout, wind instance, turbine) of a tile at the power look
+# up: rotated x and y, summed deficit, effective speed and power (float32)
+# and the int64 look up indices
+bytes_per_turbine = 28
+
+# Everything the batched evaluator needs besides the layouts and the wind
+# rose. Built once by preProcessing and shared by every call.
+EvalTables = namedtuple('EvalTables', ['n_wind_instances', 'wind_drct', 'wind_sped',
+                                       'cos_dir', 'sin_dir', 'C_t', 'wake_coef',
+                                       'power_curve', 'turb_rad'])
+
+
+def loadPowerCurve(power_curve_file_name):
+    """
+    Returns a 2D numpy array with cols Wind Speed (m/s),
+    Thrust Coeffecient (non dimensional), Power (MW)
+    """
+    powerCurve = pd.read_csv(power_curve_file_name, sep=',')
+    powerCurve = powerCurve.to_numpy(dtype = np.float32)
+    return(powerCurve)
+
+
+def searchSorted(lookup, sample_array):
+    """"Returns lookup indices for closest values w.r.t sample_array elements"""
+
+    lookup_middles = lookup[1:] - np.diff(lookup.astype('f'))/2
+    idx1 = np.searchsorted(lookup_middles, sample_array)
+    indices = np.arange(lookup.shape[0])[idx1]
+    return indices
+
+
+def binWindArrays(drct, sped):
+    """
+    Bins raw direction and speed samples into the (36,15) wind instance
+    probabilities. Same bins as binWindResourceData in Farm_Evaluator.py
+    (directions must be exact multiples of 10 in 10..360, speeds in
+    [0,30)), but counted with a single bincount instead of 540 masks.
+    """
+    drct = np.asarray(drct, dtype=np.float32)
+    sped = np.asarray(sped, dtype=np.float32)
+
+    # row 0 is 360 deg, row k is 10*k deg
+    drct_idx = np.floor(drct/10).astype(np.int64)
+    valid    = (drct_idx*10 == drct) & (drct_idx >= 1) & (drct_idx <= 36)
+    sped_idx = np.floor(sped/2).astype(np.int64)
+    valid   &= (sped >= 0) & (sped < slices_sped[-1])
+
+    bins = (drct_idx[valid] % n_slices_drct)*n_slices_sped + sped_idx[valid]
+    binned_wind = np.bincount(bins, minlength=n_slices_drct*n_slices_sped)
+    binned_wind = binned_wind.reshape(n_slices_drct, n_slices_sped).astype(np.float32)
+
+    wind_inst_freq = binned_wind/np.sum(binned_wind)
+    return(wind_inst_freq)
+
+
+def binWindResourceData(wind_data):
+    """
+    Returns the (36,15) wind instance probabilities for a wind data csv
+    file name or an already loaded DataFrame with 'drct', 'sped' columns.
+    """
+    if isinstance(wind_data, str):
+        wind_data = pd.read_csv(wind_data, usecols=['drct', 'sped'])
+    return(binWindArrays(wind_data['drct'].to_numpy(), wind_data['sped'].to_numpy()))
+
+
+def binWindEnsemble(wind_data_file_names, max_workers=None):
+    """
+    Loads and bins several wind data files concurrently.
+
+    :param
+        wind_data_file_names - list of wind data csv files, e.g. one per year
+        max_workers          - threads used for reading, default one per file
+
+    :return
+        (names, wind_stack) where names are the file base names without
+        extension and wind_stack has shape (n_years, 36, 15)
+    """
+    wind_data_file_names = list(wind_data_file_names)
+    names = [os.path.splitext(os.path.basename(f))[0] for f in wind_data_file_names]
+    if max_workers is None:
+        max_workers = max(1, len(wind_data_file_names))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        stack = list(pool.map(binWindResourceData, wind_data_file_names))
+
+    return(names, np.stack(stack))
+
+
+def preProcessing(power_curve, turb_diam=100):
+    """
+    Doing preprocessing to avoid the same repeating calculations.
+    Unlike preProcessing in the GA scripts nothing is stacked per turbine,
+    the evaluator broadcasts instead, so the tables work for any number
+    of turbines.
+    """
+    # Create wind instances, ordered like the flattened (36,15) wind rose
+    # i.e. [1.,360.],[3.,360.],[5.,360.]...[25.,350.],[27.,350.],29.,350.]
+    wind_sped = (slices_sped[:-1] + slices_sped[1:])/2
+    wind_drct = np.repeat(slices_drct, n_slices_sped)
+    wind_sped = np.tile(wind_sped, n_slices_drct).astype(np.float32)
+    n_wind_instances = wind_sped.shape[0]
+
+    # So that the wind flow direction aligns with the +ve x-axis.
+    # Convert inflow wind direction from degrees to radians
+    wind_drcts = np.radians(wind_drct - 90)
+    cos_dir = np.cos(wind_drcts).astype(np.float32)
+    sin_dir = np.sin(wind_drcts).astype(np.float32)
+
+    # thrust coeff. of the closest matching wind speed, and the constant
+    # part of the Jensen deficit it gives
+    indices   = searchSorted(power_curve[:,0], wind_sped)
+    C_t       = power_curve[indices,1]
+    wake_coef = (1 - np.sqrt(1 - C_t)).astype(np.float32)
+
+    return(EvalTables(n_wind_instances, wind_drct, wind_sped, cos_dir, sin_dir,
+                      C_t, wake_coef, power_curve, np.float32(turb_diam/2)))
+
+
+def subsetTables(tables, indices):
+    """
+    Returns EvalTables restricted to the wind instances at indices, e.g.
+    for a reduced wind rose. Power curve and turbine radius are shared.
+    """
+    indices = np.asarray(indices)
+    return(tables._replace(n_wind_instances = indices.shape[0],
+                           wind_drct = tables.wind_drct[indices],
+                           wind_sped = tables.wind_sped[indices],
+                           cos_dir   = tables.cos_dir[indices],
+                           sin_dir   = tables.sin_dir[indices],
+                           C_t       = tables.C_t[indices],
+                           wake_coef = tables.wake_coef[indices]))
+
+
+def chooseTiles(n_layouts, n_wind_instances, n_turbs, memory_budget=None):
+    """
+    Tile sizes (layouts, wind instances, target turbines) keeping the
+    working set of one tile, (layouts, instances, targets, n_turbs) wake
+    temporaries plus the (layouts, instances, n_turbs) arrays of the
+    tile, within memory_budget bytes. Whole turbine rows and whole wind
+    roses are kept as long as possible, layouts are split first. None
+    means one tile for everything. Every size is at least 1, so a
+    budget below the smallest tile gets the smallest tile.
+    """
+    n_layouts = max(1, n_layouts)
+    if memory_budget is None:
+        return(n_layouts, n_wind_instances, n_turbs)
+
+    budget   = max(0, int(memory_budget))
+    per_inst = n_turbs*(bytes_per_turbine + n_turbs*bytes_per_pair)
+    tile_p = min(n_layouts, budget//(n_wind_instances*per_inst))
+    if tile_p >= 1:
+        return(tile_p, n_wind_instances, n_turbs)
+    tile_i = min(n_wind_instances, budget//per_inst)
+    if tile_i >= 1:
+        return(1, tile_i, n_turbs)
+    tile_t = (budget - n_turbs*bytes_per_turbine)//(n_turbs*bytes_per_pair)
+    return(1, 1, max(1, min(n_turbs, tile_t)))
+
+
+def _wakeSums(layouts, tables, tile_t):
+    """
+    Sum over the upstream turbines of (r/(r + kw*x))**4, the squared
+    deficits without wake_coef, for a tile of layouts against a tile of
+    wind instances, tile_t target turbines at a time. It depends on the
+    wind direction only, not on the speed.
+
+    :return
+        (sums (n_layouts, n_wind_instances, n_turbs), bytes of the arrays
+        alive at the peak)
+    """
+    turb_rad = tables.turb_rad
+    n_turbs  = layouts.shape[1]
+
+    # downwind(x) & crosswind(y) coordinates, shape (n_layouts, n_inst, n_turbs)
+    cos_dir = tables.cos_dir[np.newaxis,:,np.newaxis]
+    sin_dir = tables.sin_dir[np.newaxis,:,np.newaxis]
+    turb_x  = layouts[:,np.newaxis,:,0]
+    turb_y  = layouts[:,np.newaxis,:,1]
+    rotate_x = turb_x*cos_dir - turb_y*sin_dir
+    rotate_y = turb_x*sin_dir + turb_y*cos_dir
+
+    sped_deficit_eff = np.zeros(rotate_x.shape, dtype=np.float32)
+    peak_bytes = 0
+    for t0 in range(0, n_turbs, tile_t):
+        targets = slice(t0, t0 + tile_t)
+
+        # x_dist[..,i,j], y_dist[..,i,j] - offset of target i from source j
+        x_dist = rotate_x[...,targets,np.newaxis] - rotate_x[...,np.newaxis,:]
+        y_dist = np.abs(rotate_y[...,targets,np.newaxis] - rotate_y[...,np.newaxis,:])
+
+        # Jensen's model. No wake effect of a turbine on itself, either j not
+        # upstream or i outside of the wake region of j
+        wake_rad  = kw*x_dist
+        wake_rad += turb_rad
+        in_wake   = x_dist > 0
+        in_wake  &= y_dist <= wake_rad
+        peak_bytes = max(peak_bytes, x_dist.nbytes + y_dist.nbytes + wake_rad.nbytes
+                         + in_wake.nbytes + rotate_x.nbytes + rotate_y.nbytes
+                         + sped_deficit_eff.nbytes)
+        del x_dist
+
+        # deficit/wake_coef = (r/(r + kw*x))**2, squared for the sum of sqrs.
+        # y_dist is reused as the buffer
+        sped_deficit = y_dist
+        sped_deficit.fill(0.0)
+        np.divide(turb_rad, wake_rad, out=sped_deficit, where=in_wake)
+        del wake_rad, in_wake
+        np.square(sped_deficit, out=sped_deficit)
+        np.square(sped_deficit, out=sped_deficit)
+
+        # Total speed deficit from all upstream turbs, using sqrt of sum of sqrs
+        sped_deficit_eff[...,targets] = np.sum(sped_deficit, axis=-1)
+        del sped_deficit, y_dist
+
+    return(sped_deficit_eff, peak_bytes)
+
+
+def _turbinePower(sped_deficit_eff, tables):
+    """
+    Turbine power (MW) from _wakeSums of the same wind instances,
+    overwriting them with the speed deficits.
+
+    :return
+        (turbine power (n_layouts, n_wind_instances, n_turbs), bytes of
+        the arrays alive at the peak)
+    """
+    sped_deficit_eff *= np.square(tables.wake_coef)[np.newaxis,:,np.newaxis]
+    np.sqrt(sped_deficit_eff, out=sped_deficit_eff)
+    wind_sped_eff = tables.wind_sped[np.newaxis,:,np.newaxis]*(1.0 - sped_deficit_eff)
+
+    # Estimate power from power_curve look up for wind_sped_eff
+    indices = searchSorted(tables.power_curve[:,0], wind_sped_eff.ravel())
+    power   = tables.power_curve[indices,2].reshape(wind_sped_eff.shape)
+    return(power, sped_deficit_eff.nbytes + wind_sped_eff.nbytes + indices.nbytes + power.nbytes)
+
+
+def _farmPowerTile(layouts, tables, tile_t):
+    """
+    Farm power for a tile of layouts against a tile of wind instances
+    (tables already restricted to them), wake deficits being summed for
+    tile_t target turbines at a time.
+
+    :return
+        (turbine power (n_layouts, n_wind_instances, n_turbs), bytes of
+        the arrays alive at the peak)
+    """
+    sums, loop_bytes    = _wakeSums(layouts, tables, tile_t)
+    power, lookup_bytes = _turbinePower(sums, tables)
+    return(power, max(loop_bytes, lookup_bytes))
+
+
+def farmPowerBatch(layouts, tables, memory_budget=None, return_stats=False,
+                   per_turbine=False):
+    """
+    Farm power (MW) of each layout for each wind instance.
+
+    :param
+        layouts       - array (n_layouts, n_turbs, 2) or a single (n_turbs, 2) layout
+        tables        - EvalTables from preProcessing
+        memory_budget - bytes allowed for the evaluation: the result array
+                        plus the working set of one tile. The work is
+                        tiled over layouts, wind instances and target
+                        turbines to stay within it, down to one target
+                        turbine of one layout for one wind instance.
+                        None for no tiling.
+        return_stats  - also return a dict with the tile sizes, the number
+                        of tiles and 'peak_bytes', the largest working set
+                        (arrays of one tile plus the result) used
+        per_turbine   - keep the power of every turbine instead of summing
+
+    :return
+        array (n_layouts, n_wind_instances), or (n_wind_instances,) for a
+        single layout, with a trailing n_turbs axis if per_turbine.
+        (power, stats) if return_stats.
+    """
+    layouts = np.asarray(layouts, dtype=np.float32)
+    single  = layouts.ndim == 2
+    if single:
+        layouts = layouts[np.newaxis]
+    n_layouts, n_turbs = layouts.shape[:2]
+    n_wind_instances   = tables.n_wind_instances
+
+    power = np.zeros((n_layouts, n_wind_instances) + ((n_turbs,) if per_turbine else ()),
+                     dtype=np.float32)
+    if memory_budget is not None:
+        memory_budget = memory_budget - power.nbytes
+    tile_p, tile_i, tile_t = chooseTiles(n_layouts, n_wind_instances, n_turbs, memory_budget)
+
+    peak_bytes = 0
+    n_tiles    = 0
+    for i0 in range(0, n_wind_instances, tile_i):
+        instances   = np.arange(i0, min(i0 + tile_i, n_wind_instances))
+        tile_tables = tables if instances.shape[0] == n_wind_instances \
+                      else subsetTables(tables, instances)
+        for p0 in range(0, n_layouts, tile_p):
+            tile_power, tile_bytes = _farmPowerTile(layouts[p0:p0+tile_p], tile_tables, tile_t)
+            power[p0:p0+tile_p, instances] = tile_power if per_turbine \
+                                             else np.sum(tile_power, axis=-1)
+            peak_bytes = max(peak_bytes, tile_bytes)
+            n_tiles   += 1
+
+    stats = {'tile_layouts'  : tile_p,
+             'tile_instances': tile_i,
+             'tile_turbines' : tile_t,
+             'n_tiles'       : n_tiles,
+             'peak_bytes'    : peak_bytes + power.nbytes}
+    if single:
+        power = power[0]
+    return((power, stats) if return_stats else power)
+
+
+def _wakeTerms(x_dist, y_dist, turb_rad):
+    """
+    (deficit/wake_coef)**2 = (r/(r + kw*x))**4 where the target is in the
+    wake of the source, 0 elsewhere. x_dist, y_dist are target - source.
+    """
+    wake_rad = turb_rad + kw*x_dist
+    with np.errstate(divide='ignore', invalid='ignore'):
+        q = np.where((x_dist > 0) & (y_dist <= wake_rad), turb_rad/wake_rad, 0.0)
+    q = np.square(q)
+    return(np.square(q))
+
+
+def relocationPower(layout, turbine, candidates, tables, memory_budget=None):
+    """
+    Farm power (MW) per wind instance of a layout with one turbine moved
+    to each of K candidate positions, in one pass.
+
+    Only the wake terms involving the moved turbine change, so the
+    wakes among the other n-1 turbines are summed once and each candidate
+    costs O(n_wind_instances*n_turbs) instead of a full
+    O(n_wind_instances*n_turbs**2) evaluation.
+
+    :param
+        layout        - (n_turbs, 2) turbine coordinates
+        turbine       - index of the turbine to move
+        candidates    - (K, 2) positions to try
+        tables        - EvalTables from preProcessing
+        memory_budget - bytes, candidates are processed in chunks to stay
+                        within it. None for a single chunk.
+
+    :return
+        array (K, n_wind_instances)
+    """
+    layout     = np.asarray(layout, dtype=np.float32)
+    candidates = np.asarray(candidates, dtype=np.float32).reshape(-1, 2)
+    turb_rad   = tables.turb_rad
+    n_turbs    = layout.shape[0]
+    n_cands    = candidates.shape[0]
+    n_wind_instances = tables.n_wind_instances
+
+    cos_dir = tables.cos_dir[:,np.newaxis]
+    sin_dir = tables.sin_dir[:,np.newaxis]
+    rotate_x = layout[:,0]*cos_dir - layout[:,1]*sin_dir
+    rotate_y = layout[:,0]*sin_dir + layout[:,1]*cos_dir
+
+    # wakes among the other turbines, (n_wind_instances, n_turbs)
+    base = _wakeTerms(rotate_x[:,:,np.newaxis] - rotate_x[:,np.newaxis,:],
+                      np.abs(rotate_y[:,:,np.newaxis] - rotate_y[:,np.newaxis,:]), turb_rad)
+    base[:,:,turbine] = 0.0
+    base = np.sum(base, axis=-1)
+
+    chunk = n_cands
+    if memory_budget is not None:
+        chunk = max(1, int(memory_budget)//(4*bytes_per_pair*n_wind_instances*n_turbs))
+
+    wake_coef = tables.wake_coef[np.newaxis,:,np.newaxis]
+    wind_sped = tables.wind_sped[np.newaxis,:,np.newaxis]
+    power = np.zeros((n_cands, n_wind_instances), dtype=np.float32)
+    for c0 in range(0, n_cands, chunk):
+        cand = candidates[c0:c0+chunk]
+        cand_x = cand[:,0,np.newaxis]*tables.cos_dir - cand[:,1,np.newaxis]*tables.sin_dir
+        cand_y = cand[:,0,np.newaxis]*tables.sin_dir + cand[:,1,np.newaxis]*tables.cos_dir
+        x_dist = rotate_x[np.newaxis] - cand_x[:,:,np.newaxis]
+        y_dist = np.abs(rotate_y[np.newaxis] - cand_y[:,:,np.newaxis])
+
+        # candidate as source on every other turbine, and as target of them
+        deficit_sq = base[np.newaxis] + _wakeTerms(x_dist, y_dist, turb_rad)
+        as_target  = _wakeTerms(-x_dist, y_dist, turb_rad)
+        as_target[:,:,turbine] = 0.0
+        deficit_sq[:,:,turbine] = np.sum(as_target, axis=-1)
+
+        wind_sped_eff = wind_sped*(1.0 - wake_coef*np.sqrt(deficit_sq))
+        indices = searchSorted(tables.power_curve[:,0], wind_sped_eff.ravel())
+        power[c0:c0+chunk] = np.sum(tables.power_curve[indices,2].reshape(wind_sped_eff.shape), axis=-1)
+
+    return(power)
+
+
+def relocationAEP(layout, turbine, candidates, wind_inst_freq, tables, memory_budget=None):
+    """
+    AEP (GWh) of the layout with turbine moved to each of the (K, 2)
+    candidate positions. Returns (K,), or (K, n_years) for a stack of
+    wind roses. See relocationPower.
+    """
+    farm_pwr = relocationPower(layout, turbine, candidates, tables, memory_budget)
+    return(powerToAEP(farm_pwr, wind_inst_freq))
+
+
+def powerToAEP(farm_pwr, wind_inst_freq):
+    """
+    Weights farm power (.., n_wind_instances) by one wind rose, (36,15) or
+    (540,), or a stack of them (n_years, 36, 15). Returns AEP in GWh with
+    shape (..,) or (.., n_years), a stack of one year included.
+    """
+    wind_inst_freq = np.asarray(wind_inst_freq, dtype=np.float64)
+    n_wind_instances = farm_pwr.shape[-1]
+    if wind_inst_freq.ndim == 3:
+        weights = wind_inst_freq.reshape(-1, n_wind_instances).T
+    else:
+        weights = wind_inst_freq.reshape(n_wind_instances)
+
+    # year_hours = 8760.0, convert MWh to GWh
+    AEP = 8760.0*np.matmul(farm_pwr.astype(np.float64), weights)/1e3
+    return(AEP)
+
+
+def getAEPBatch(layouts, wind_inst_freq, tables, memory_budget=None):
+    """
+    Calculates AEP (GWh) of every layout. Vectorised over layouts.
+
+    :param
+        layouts        - (n_layouts, n_turbs, 2) or a single (n_turbs, 2)
+        wind_inst_freq - (36,15) wind rose or (n_years,36,15) stack
+        tables         - EvalTables from preProcessing
+        memory_budget  - bytes, see farmPowerBatch
+
+    :return
+        AEP with shape (n_layouts,) or (n_layouts, n_years); the layout
+        axis is dropped for a single layout
+    """
+    farm_pwr = farmPowerBatch(layouts, tables, memory_budget)
+    return(powerToAEP(farm_pwr, wind_inst_freq))
+
+
+def lossBreakdown(layouts, wind_inst_freq, tables, memory_budget=None):
+    """
+    AEP with per turbine and per direction detail, from the same single
+    evaluation pass (the per turbine powers are simply not summed away).
+    Losses are against the same turbine standing alone in free stream.
+
+    :param
+        layouts        - (n_layouts, n_turbs, 2) or a single (n_turbs, 2)
+        wind_inst_freq - wind rose matching tables, (36,15) or reduced
+        tables         - EvalTables from preProcessing
+        memory_budget  - bytes, see farmPowerBatch
+
+    :return
+        dict, all in GWh, the layout axis dropped for a single layout
+        'aep'            (n_layouts,)
+        'turbine_aep'    (n_layouts, n_turbs)
+        'turbine_loss'   (n_layouts, n_turbs) wake loss of every turbine
+        'direction_loss' (n_layouts, 36) wake loss of the farm per wind
+                         direction, rows ordered like slices_drct
+        'free_aep'       AEP of one turbine in free stream
+    """
+    turb_pwr = farmPowerBatch(layouts, tables, memory_budget, per_turbine=True)
+    single   = turb_pwr.ndim == 2
+    if single:
+        turb_pwr = turb_pwr[np.newaxis]
+    wind_inst_freq = np.asarray(wind_inst_freq, dtype=np.float64).ravel()
+
+    # free stream power of one turbine in every wind instance
+    indices  = searchSorted(tables.power_curve[:,0], tables.wind_sped)
+    free_pwr = tables.power_curve[indices,2].astype(np.float64)
+
+    # energy (GWh) of every turbine in every instance, and what it lost
+    energy = 8760.0*wind_inst_freq[np.newaxis,:,np.newaxis]*turb_pwr/1e3
+    lost   = 8760.0*wind_inst_freq*free_pwr/1e3
+    lost   = lost[np.newaxis,:,np.newaxis] - energy
+
+    # instance -> direction row, row 0 is 360 deg
+    drct_row = (np.round(tables.wind_drct/10).astype(np.int64)) % n_slices_drct
+    to_drct  = np.zeros((tables.n_wind_instances, n_slices_drct))
+    to_drct[np.arange(tables.n_wind_instances), drct_row] = 1.0
+
+    result = {'aep'           : np.sum(energy, axis=(1, 2)),
+              'turbine_aep'   : np.sum(energy, axis=1),
+              'turbine_loss'  : np.sum(lost, axis=1),
+              'direction_loss': np.matmul(np.sum(lost, axis=2), to_drct),
+              'free_aep'      : float(8760.0*np.sum(wind_inst_freq*free_pwr)/1e3)}
+    if single:
+        for k in ('aep', 'turbine_aep', 'turbine_loss', 'direction_loss'):
+            result[k] = result[k][0]
+    return(result)
+
+
+class BatchEvaluator:
+    """
+    evaluate(layouts) -> AEP callable bound to one wind rose and tables,
+    as expected by GA_Engine.run_ga. breakdown(layouts) gives the
+    lossBreakdown dict instead, progressive(layouts, thresholds) the
+    progressiveAEP one and relocation(layout, turbine, candidates) the
+    relocationAEP one.
+    """
+
+    def __init__(self, wind_inst_freq, tables, memory_budget=None):
+        self.wind_inst_freq = wind_inst_freq
+        self.tables         = tables
+        self.memory_budget  = memory_budget
+
+    def __call__(self, layouts):
+        return(getAEPBatch(layouts, self.wind_inst_freq, self.tables, self.memory_budget))
+
+    def breakdown(self, layouts):
+        return(lossBreakdown(layouts, self.wind_inst_freq, self.tables, self.memory_budget))
+
+    def progressive(self, layouts, thresholds):
+        return(progressiveAEP(layouts, thresholds, self.wind_inst_freq, self.tables,
+                              memory_budget=self.memory_budget))
+
+    def relocation(self, layout, turbine, candidates):
+        return(relocationAEP(layout, turbine, candidates, self.wind_inst_freq, self.tables,
+                             self.memory_budget))
+
+
+def upperBoundPower(tables):
+    """
+    Per turbine power bound (MW) for every wind instance: the largest
+    power curve value at any speed up to the free stream speed.
+    """
+    power_curve = tables.power_curve
+    indices     = searchSorted(power_curve[:,0], tables.wind_sped)
+    return(np.maximum.accumulate(power_curve[:,2])[indices])
+
+
+def progressiveAEP(layouts, thresholds, wind_inst_freq, tables, chunk_size=2,
+                   memory_budget=None, return_stats=False):
+    """
+    AEP of layouts that can still beat a threshold, giving up on the others
+    as early as possible.
+
+    The wake geometry of a layout depends on the wind direction only, so
+    the work goes direction by direction: the sums of the wake terms are
+    computed once per direction and give the power at all its speeds.
+    Directions are processed in chunks in descending order of their
+    upper bound, the sum of probability x upperBoundPower over their
+    speeds. After each chunk the partial AEP plus the bound of the
+    directions left is compared with the threshold; layouts that cannot
+    exceed it are rejected and not evaluated further. Instances that
+    cannot produce power are never evaluated. A layout that is not
+    rejected costs about one pass of the wake geometry per direction, a
+    fifteenth of a full evaluation with 15 speeds.
+
+    :param
+        layouts        - (n_layouts, n_turbs, 2) or a single (n_turbs, 2)
+        thresholds     - AEP (GWh) to beat, scalar or one per layout
+        wind_inst_freq - wind rose matching tables
+        tables         - EvalTables from preProcessing
+        chunk_size     - wind directions per step
+        memory_budget  - bytes for the working set of one tile of a step,
+                         tiled over its layouts, instances and target
+                         turbines as chosen by chooseTiles
+        return_stats   - also return a dict with the number of tiles and
+                         'peak_bytes', the largest working set used
+
+    :return
+        dict with, per layout, 'aep' (exact, NaN if rejected), 'rejected'
+        (bool), 'instances' (number of wind instances evaluated) and
+        'mass' (fraction of the wind rose probability accounted for, 1 for
+        a layout that is not rejected). (result, stats) if return_stats.
+    """
+    layouts = np.asarray(layouts, dtype=np.float32)
+    single  = layouts.ndim == 2
+    if single:
+        layouts = layouts[np.newaxis]
+    n_layouts, n_turbs = layouts.shape[:2]
+    thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.float64), (n_layouts,))
+    wind_inst_freq = np.asarray(wind_inst_freq, dtype=np.float64).ravel()
+
+    # instances grouped by direction, the most energetic directions first,
+    # and the bound on what is left after each of them (GWh)
+    weight = wind_inst_freq*upperBoundPower(tables)
+    drcts, first, direction = np.unique(tables.wind_drct, return_index=True, return_inverse=True)
+    drct_weight = np.bincount(direction, weight, minlength=drcts.shape[0])
+    order     = np.argsort(-drct_weight, kind='stable')
+    order     = order[drct_weight[order] > 0]
+    remaining = 8760.0*n_turbs*(np.sum(drct_weight[order]) - np.cumsum(drct_weight[order]))/1e3
+    total     = np.sum(wind_inst_freq)
+    idle_mass = np.sum(wind_inst_freq[weight <= 0])/total
+
+    partial   = np.zeros(n_layouts)
+    used      = np.zeros(n_layouts, dtype=np.int64)
+    mass      = np.zeros(n_layouts)
+    rejected  = np.zeros(n_layouts, dtype=bool)
+    active    = np.ones(n_layouts, dtype=bool)
+    peak_bytes = 0
+    n_tiles    = 0
+    for start in range(0, order.shape[0], chunk_size):
+        chunk     = order[start:start+chunk_size]
+        end       = start + chunk.shape[0]
+        instances = np.nonzero(np.isin(direction, chunk) & (weight > 0))[0]
+
+        # tiles over the instances of the chunk, the wake sums of a tile
+        # being computed once for each of its directions
+        members = np.nonzero(active)[0]
+        tile_p, tile_i, tile_t = chooseTiles(members.shape[0], instances.shape[0], n_turbs,
+                                             memory_budget)
+        for i0 in range(0, instances.shape[0], tile_i):
+            tile_inst = instances[i0:i0+tile_i]
+            tile_drct, position = np.unique(direction[tile_inst], return_inverse=True)
+            drct_tables = subsetTables(tables, first[tile_drct])
+            inst_tables = subsetTables(tables, tile_inst)
+            for p0 in range(0, members.shape[0], tile_p):
+                tile = members[p0:p0+tile_p]
+                sums, sum_bytes    = _wakeSums(layouts[tile], drct_tables, tile_t)
+                power, power_bytes = _turbinePower(sums[:,position], inst_tables)
+                peak_bytes = max(peak_bytes, sum_bytes, sums.nbytes + power_bytes)
+                partial[tile] += powerToAEP(np.sum(power, axis=-1), wind_inst_freq[tile_inst])
+                n_tiles += 1
+        used[active] += instances.shape[0]
+        mass[active] += np.sum(wind_inst_freq[instances])/total
+
+        reject    = active & (partial + remaining[end-1] <= thresholds)
+        rejected |= reject
+        active   &= ~reject
+        if not np.any(active):
+            break
+    mass[~rejected] += idle_mass
+
+    result = {'aep'      : np.where(rejected, np.nan, partial),
+              'rejected' : rejected,
+              'instances': used,
+              'mass'     : mass}
+    stats  = {'n_tiles'   : n_tiles,
+              'peak_bytes': peak_bytes}
+    if single:
+        result = {k: v[0] for k, v in result.items()}
+    return((result, stats) if return_stats else result)
+
+
+def ensembleAEP(layouts, wind_stack, tables, percentile=10, memory_budget=None):
+    """
+    Evaluates layouts against every wind rose of an ensemble in one pass.
+
+    :param
+        layouts    - (n_layouts, n_turbs, 2) or a single (n_turbs, 2)
+        wind_stack - (n_years, 36, 15) from binWindEnsemble
+        tables     - EvalTables from preProcessing
+        percentile - percentile across years reported as 'p90'. The default
+                     10 gives the AEP exceeded in 90% of the years.
+        memory_budget - bytes, see farmPowerBatch
+
+    :return
+        dict with 'per_year' (.., n_years) and 'mean', 'min', 'max',
+        'spread' (max - min), 'p90' each of shape (..,)
+    """
+    per_year = getAEPBatch(layouts, wind_stack, tables, memory_budget)
+    per_year = np.atleast_1d(per_year)
+
+    result = {'per_year': per_year,
+              'mean'    : np.mean(per_year, axis=-1),
+              'min'     : np.min(per_year, axis=-1),
+              'max'     : np.max(per_year, axis=-1),
+              'p90'     : np.percentile(per_year, percentile, axis=-1)}
+    result['spread'] = result['max'] - result['min']
+    return(result)
+
+
+if __name__ == "__main__":
+
+    import glob
+
+    power_curve = loadPowerCurve('power_curve.csv')
+    tables      = preProcessing(power_curve)
+    years, wind_stack = binWindEnsemble(sorted(glob.glob('wind_data_20*.csv')))
+
+    layouts = np.stack([pd.read_csv('Arrangement_'+str(i)+'.csv').to_numpy(dtype = np.float32)
+                        for i in range(10)])
+    result  = ensembleAEP(layouts, wind_stack, tables)
+
+    print('years :', years)
+    for i in range(layouts.shape[0]):
+        print('Arrangement_%d  mean %.4f  min %.4f  p90 %.4f  spread %.4f GWh'
+              % (i, result['mean'][i], result['min'][i], result['p90'][i], result['spread'][i]))
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Bulk_Scorer.py
+
+DESCRIPTION
+    Scores many layout files at once
+    ============================================================
+
+    Farm_Evaluator.py scores one layout per run (and its getTurbLoc
+    always reads final_sol.csv, whatever it is given). scoreLayouts
+    takes
+
+    - a glob pattern, e.g. 'Arrangement_*.csv',
+    - a directory, every csv in it,
+    - a packed archive: .npz of (n_turbs, 2) arrays, .npy of a
+      (n_layouts, n_turbs, 2) array, or .zip of csv files,
+
+    reads the csv files on a thread pool, checks both constraints with
+    the semantics of Farm_Evaluator.checkConstraints (every turbine at
+    least 50 m inside the farm, every pair at least 4 diameters apart)
+    for all layouts at once, and scores all of them in one
+    Batch_Evaluator.getAEPBatch call per number of turbines. The result
+    is a DataFrame sorted with feasible layouts first, best AEP first.
+
+    python Bulk_Scorer.py "Arrangement_*.csv" -o scores.csv
+"""
+
+# Module List
+import numpy  as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+import glob
+import io
+import os
+import time
+import zipfile
+
+from Batch_Evaluator import getAEPBatch
+
+
+farm_size   = 4000.0
+bound_clrnc = 50.0
+
+
+def readLayout(source):
+    """(n_turbs, 2) coordinates from the x,y columns of a csv file or buffer"""
+    df = pd.read_csv(source, sep=',', encoding='utf-8-sig')
+    return(df[['x', 'y']].to_numpy(dtype = np.float64))
+
+
+def _layoutError(layout):
+    """Why an array is not a (n_turbs, 2) layout that can be scored, None if it is"""
+    if layout.ndim != 2 or layout.shape[1] != 2:
+        return('ValueError: expected (n_turbs, 2) coordinates, got shape %s' % (layout.shape,))
+    if layout.shape[0] == 0:
+        return('ValueError: no turbines')
+    if not np.all(np.isfinite(layout)):
+        return('ValueError: non-finite coordinates')
+    return(None)
+
+
+def _describe(error):
+    return('%s: %s' % (type(error).__name__, error))
+
+
+def _timedRead(source):
+    start = time.perf_counter()
+    try:
+        return(readLayout(source), None, time.perf_counter() - start)
+    except Exception as error:
+        return(None, _describe(error), time.perf_counter() - start)
+
+
+def _readArchive(source, max_workers=None):
+    """Layouts of a .npz, .npy or .zip archive as loadLayouts entries"""
+    start = time.perf_counter()
+    if source.endswith('.zip'):
+        with zipfile.ZipFile(source) as archive:
+            names   = sorted(n for n in archive.namelist() if n.endswith('.csv'))
+            buffers = [io.BytesIO(archive.read(n)) for n in names]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return([(name,) + result for name, result in zip(names, pool.map(_timedRead, buffers))])
+    if source.endswith('.npz'):
+        with np.load(source) as archive:
+            layouts = [(name, np.asarray(archive[name], dtype=np.float64)) for name in archive.files]
+    else:
+        stack   = np.load(source).astype(np.float64)
+        layouts = [('%s[%d]' % (os.path.basename(source), i), layout)
+                   for i, layout in enumerate(stack)]
+    seconds = (time.perf_counter() - start)/max(1, len(layouts))
+    return([(name, layout, None, seconds) for name, layout in layouts])
+
+
+def loadLayouts(source, max_workers=None):
+    """
+    Reads every layout of a glob, directory or archive. A file or array
+    that cannot be read, or is not a (n_turbs, 2) layout with at least
+    one turbine, gets no layout and an error message.
+
+    :return
+        list of (name, layout or None, error message or None, seconds)
+    """
+    if os.path.isdir(source) or not source.endswith(('.npz', '.npy', '.zip')):
+        files = sorted(glob.glob(os.path.join(source, '*.csv') if os.path.isdir(source) else source))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            loaded = [(f,) + result for f, result in zip(files, pool.map(_timedRead, files))]
+    else:
+        start = time.perf_counter()
+        try:
+            loaded = _readArchive(source, max_workers)
+        except Exception as error:
+            loaded = [(source, None, _describe(error), time.perf_counter() - start)]
+
+    for k, (name, layout, error, seconds) in enumerate(loaded):
+        error = error if layout is None else _layoutError(layout)
+        if error is not None:
+            loaded[k] = (name, None, error, seconds)
+    return(loaded)
+
+
+def checkConstraintsBatch(layouts, turb_diam=100):
+    """
+    Vectorized Farm_Evaluator.checkConstraints for (n_layouts, n_turbs, 2)
+    layouts.
+
+    :return
+        dict of (n_layouts,) arrays: 'perimeter_ok', 'proximity_ok',
+        'min_clearance' (m to the farm boundary, negative outside) and
+        'min_spacing' (m between the closest two turbines)
+    """
+    layouts   = np.asarray(layouts, dtype=np.float64)
+    n_turbs   = layouts.shape[1]
+    clearance = np.min(np.minimum(layouts, farm_size - layouts), axis=(1, 2))
+    dist2 = np.sum(np.square(layouts[:,:,np.newaxis] - layouts[:,np.newaxis]), axis=-1)
+    dist2[:,np.arange(n_turbs),np.arange(n_turbs)] = np.inf
+    spacing = np.sqrt(np.min(dist2, axis=(1, 2)))
+    return({'perimeter_ok' : clearance >= bound_clrnc,
+            'proximity_ok' : spacing >= 4*turb_diam,
+            'min_clearance': clearance,
+            'min_spacing'  : spacing})
+
+
+def scoreLayouts(source, wind_inst_freq, tables, max_workers=None, memory_budget=None):
+    """
+    Loads, checks and scores every layout of source.
+
+    :param
+        source         - glob pattern, directory or .npz/.npy/.zip archive
+        wind_inst_freq - (36,15) wind rose
+        tables         - EvalTables from Batch_Evaluator.preProcessing
+        max_workers    - threads reading csv files
+        memory_budget  - bytes, see Batch_Evaluator.getAEPBatch
+
+    :return
+        DataFrame with one row per layout: name, n_turbs, aep (GWh),
+        feasible, perimeter_ok, proximity_ok, min_clearance, min_spacing,
+        load_seconds, eval_seconds (its share of the batched call) and
+        error for files that could not be read or hold no layout, which
+        are neither checked nor scored
+    """
+    loaded = loadLayouts(source, max_workers)
+    rows   = [{'name': name, 'n_turbs': np.nan if layout is None else layout.shape[0],
+               'aep': np.nan, 'feasible': False, 'perimeter_ok': False, 'proximity_ok': False,
+               'min_clearance': np.nan, 'min_spacing': np.nan, 'load_seconds': seconds,
+               'eval_seconds': np.nan, 'error': error}
+              for name, layout, error, seconds in loaded]
+
+    # one batch per farm size
+    groups = {}
+    for k, (name, layout, error, seconds) in enumerate(loaded):
+        if layout is not None:
+            groups.setdefault(layout.shape[0], []).append(k)
+    for n_turbs, members in groups.items():
+        layouts = np.stack([loaded[k][1] for k in members])
+        checks  = checkConstraintsBatch(layouts, turb_diam=2*float(tables.turb_rad))
+        start   = time.perf_counter()
+        aep     = np.atleast_1d(getAEPBatch(layouts, wind_inst_freq, tables, memory_budget))
+        seconds = (time.perf_counter() - start)/len(members)
+        for j, k in enumerate(members):
+            rows[k].update({'aep': float(aep[j]), 'eval_seconds': seconds,
+                            'feasible': bool(checks['perimeter_ok'][j] and checks['proximity_ok'][j]),
+                            **{key: value[j].item() for key, value in checks.items()}})
+
+    table = pd.DataFrame(rows, columns=list(rows[0]) if rows else None)
+    if not rows:
+        return(table)
+    return(table.sort_values(['feasible', 'aep'], ascending=False, ignore_index=True))
+
+
+if __name__ == "__main__":
+
+    import argparse
+    from Batch_Evaluator import loadPowerCurve, binWindResourceData, preProcessing
+
+    parser = argparse.ArgumentParser(description='Scores many layout files at once')
+    parser.add_argument('source', help='glob pattern, directory or .npz/.npy/.zip archive')
+    parser.add_argument('--wind', default='wind_data_combined.csv')
+    parser.add_argument('--power-curve', default='power_curve.csv')
+    parser.add_argument('-o', '--output', help='csv file for the table')
+    args = parser.parse_args()
+
+    power_curve    = loadPowerCurve(args.power_curve)
+    tables         = preProcessing(power_curve, turb_diam=100)
+    wind_inst_freq = binWindResourceData(args.wind)
+
+    table = scoreLayouts(args.source, wind_inst_freq, tables)
+    if args.output:
+        table.to_csv(args.output, index=False)
+    print(table.to_string())
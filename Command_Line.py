@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Command_Line.py
+
+DESCRIPTION
+    One command line entry point for scoring, wind binning and optimizing
+    ============================================================
+
+    python Command_Line.py evaluate  "Arrangement_*.csv" -o scores.csv
+    python Command_Line.py bin-wind  wind_data_2007.csv wind_data_2008.csv --combine -o rose.npy
+    python Command_Line.py optimize  --x 0.8 --no-of-mutation-tries 200 --seed 1 \\
+                                     --max-seconds 3600 --state run.npz -o sol.csv
+    python Command_Line.py optimize  --config settings.json
+    python Command_Line.py benchmark --layouts 50
+    python Command_Line.py resume    run.npz --iterations 500
+    python Command_Line.py serve     --socket /tmp/aep.sock
+    python Command_Line.py warm-up
+
+    optimize runs GA_Engine.run_ga with any of its settings as flags, on
+    top of an optional json config file, and with --state saves the
+    final population, settings and random state so that resume can carry
+    on where it stopped. Wind options take a wind data csv or a rose
+    saved by bin-wind (.npy).
+
+    numpy, pandas and the evaluators are only imported by the subcommand
+    that needs them, so --help answers at once.
+"""
+
+# Module List
+import argparse
+import json
+import sys
+import time
+
+
+# GA_Engine.default_settings keys and their types, kept here so that
+# building the parser needs no numpy
+setting_types = {
+    'no_of_turbines'         : int,
+    'mu'                     : int,
+    'x'                      : float,
+    'c'                      : int,
+    'iterations'             : int,
+    'Dm'                     : float,
+    'tries_retaining_parents': int,
+    'tries_changing_parents' : int,
+    'no_of_mutation_tries'   : int,
+    'no_retained'            : int,
+    'mutation_rate'          : float,
+    'turbine_rate'           : float,
+    'adapt_factor'           : float,
+    'Dm_min'                 : float,
+    'Dm_max'                 : float,
+    'mutation_mode'          : str,
+    'crossover_mode'         : str,
+    'align_parents'          : bool,
+    'screen_factor'          : int,
+    'track_loss'             : bool,
+}
+
+
+def _flag(value):
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return(True)
+    if value.lower() in ('0', 'false', 'no', 'off'):
+        return(False)
+    raise argparse.ArgumentTypeError('expected true or false, got %r' % value)
+
+
+def _addWindOptions(parser):
+    parser.add_argument('--wind', default='wind_data_combined.csv',
+                        help='wind data csv, or a (36,15) rose saved by bin-wind')
+    parser.add_argument('--power-curve', default='power_curve.csv')
+
+
+def _loadModel(args):
+    """(wind_inst_freq, tables) from the wind options"""
+    import numpy as np
+    from Batch_Evaluator import loadPowerCurve, binWindResourceData, preProcessing
+
+    tables = preProcessing(loadPowerCurve(args.power_curve), turb_diam=100)
+    if args.wind.endswith('.npy'):
+        wind_inst_freq = np.load(args.wind)
+        if wind_inst_freq.ndim != 2:
+            sys.exit('%s holds %d wind roses, bin them with --combine' % (args.wind, len(wind_inst_freq)))
+    else:
+        wind_inst_freq = binWindResourceData(args.wind)
+    return(wind_inst_freq, tables)
+
+
+def _settings(args):
+    """GA settings: config file first, flags on top"""
+    from GA_Engine import default_settings
+
+    settings = {}
+    if args.config:
+        with open(args.config) as f:
+            settings.update(json.load(f))
+    for name in setting_types:
+        value = getattr(args, name)
+        if value is not None:
+            settings[name] = value
+    merged = dict(default_settings, **settings)
+    if merged['c'] > merged['mu']:
+        sys.exit('tournament size c = %d is larger than the population, mu = %d'
+                 % (merged['c'], merged['mu']))
+    return(settings)
+
+
+def saveState(file_name, settings, population, rng, iterations_done, args):
+    """Population, settings and random state of an optimize run as .npz"""
+    import numpy as np
+    meta = {'settings': settings, 'rng': rng.bit_generator.state,
+            'iterations_done': iterations_done,
+            'wind': args.wind, 'power_curve': args.power_curve}
+    np.savez(file_name, meta=json.dumps(meta), **population)
+
+
+def loadState(file_name):
+    """(meta dict, population dict, rng) saved by saveState"""
+    import numpy as np
+    with np.load(file_name) as state:
+        meta       = json.loads(str(state['meta']))
+        population = {k: state[k] for k in state.files if k != 'meta'}
+    rng = np.random.default_rng()
+    rng.bit_generator.state = meta['rng']
+    return(meta, population, rng)
+
+
+def _buildEvaluator(args, settings):
+    """
+    The evaluator of a GA run, built once so that the starting population
+    is scored with the same model, at the same fidelity, as the run
+    """
+    wind_inst_freq, tables = _loadModel(args)
+    if args.fidelity:
+        from Wind_Fidelity import MultiFidelityEvaluator
+        return(MultiFidelityEvaluator(wind_inst_freq, tables, settings.get('no_of_turbines', 50)))
+    from Evaluator_Registry import AutoEvaluator
+    return(AutoEvaluator(wind_inst_freq, tables, backend=args.backend))
+
+
+def _runGA(args, settings, rng, initial, iterations_done, evaluate):
+    from GA_Engine      import run_ga, save_solution
+    from Run_Controller import RunController
+
+    controller = None
+    if args.max_seconds or args.max_evaluations or args.checkpoint:
+        controller = RunController(max_seconds=args.max_seconds,
+                                   max_evaluations=args.max_evaluations,
+                                   checkpoint_file=args.checkpoint)
+
+    result = run_ga(settings, evaluate, rng=rng, initial=initial, verbose=not args.quiet,
+                    controller=controller)
+    save_solution(result['best_layout'], args.output)
+    print('best AEP %.6f GWh written to %s' % (result['best_aep'], args.output))
+    if args.state:
+        saveState(args.state, settings, result['population'], rng,
+                  iterations_done + len(result['solution_values']), args)
+        print('run state saved to', args.state)
+
+
+def cmdEvaluate(args):
+    from Bulk_Scorer import scoreLayouts
+
+    wind_inst_freq, tables = _loadModel(args)
+    start = time.perf_counter()
+    table = scoreLayouts(args.source, wind_inst_freq, tables)
+    if args.output:
+        table.to_csv(args.output, index=False)
+    print(table.to_string(max_rows=args.top))
+    print('%d layouts in %.3f s' % (len(table), time.perf_counter() - start))
+
+
+def cmdBinWind(args):
+    import numpy  as np
+    import pandas as pd
+    from Batch_Evaluator import binWindResourceData, binWindEnsemble
+
+    if args.combine:
+        frames = [pd.read_csv(f, usecols=['drct', 'sped']) for f in args.files]
+        rose   = binWindResourceData(pd.concat(frames, ignore_index=True))
+    elif len(args.files) == 1:
+        rose   = binWindResourceData(args.files[0])
+    else:
+        names, rose = binWindEnsemble(args.files)
+    if args.output:
+        np.save(args.output, rose)
+        print('wind rose', rose.shape, 'saved to', args.output)
+    else:
+        np.savetxt(sys.stdout, rose.reshape(-1, rose.shape[-1]), fmt='%.6g')
+
+
+def cmdOptimize(args):
+    import numpy as np
+    from GA_Engine import default_settings, generate_random_locations, \
+                          initialize_generation_by_files
+
+    settings = _settings(args)
+    rng      = np.random.default_rng(args.seed)
+    evaluate = _buildEvaluator(args, settings)
+    initial  = None
+    if args.initial:
+        import glob
+        files = sorted(f for pattern in args.initial for f in glob.glob(pattern))
+        if not files:
+            sys.exit('no file matches --initial ' + ' '.join(args.initial))
+        coords, aep = initialize_generation_by_files(files, evaluate)
+
+        # the mu best files, topped up with random layouts
+        mu     = settings.get('mu', default_settings['mu'])
+        best   = np.argsort(-aep, kind='stable')[:mu]
+        coords, aep = coords[best], aep[best]
+        if coords.shape[0] < mu:
+            n_turbs = settings.get('no_of_turbines', default_settings['no_of_turbines'])
+            fresh   = np.stack([generate_random_locations(rng, n_turbs)
+                                for i in range(mu - coords.shape[0])])
+            coords  = np.concatenate([coords, fresh])
+            aep     = np.concatenate([aep, np.atleast_1d(evaluate(fresh))])
+        initial = (coords, aep)
+    _runGA(args, settings, rng, initial, 0, evaluate)
+
+
+def cmdResume(args):
+    meta, population, rng = loadState(args.state_file)
+    settings = dict(meta['settings'])
+    if args.iterations is not None:
+        settings['iterations'] = args.iterations
+    args.wind        = args.wind or meta['wind']
+    args.power_curve = args.power_curve or meta['power_curve']
+    args.state       = args.state or args.state_file
+    print('resuming after', meta['iterations_done'], 'generations')
+
+    # the saved AEP may come from another wind rose or fidelity level
+    evaluate = _buildEvaluator(args, settings)
+    population['aep'] = evaluate(population['coords'])
+    _runGA(args, settings, rng, population, meta['iterations_done'], evaluate)
+
+
+def cmdBenchmark(args):
+    import numpy as np
+    from GA_Engine          import generate_random_locations
+    from Evaluator_Registry import backends, chooseBackend
+
+    wind_inst_freq, tables = _loadModel(args)
+    rng     = np.random.default_rng(0)
+    layouts = np.stack([generate_random_locations(rng, args.turbines) for i in range(args.layouts)])
+
+    for name, backend in backends.items():
+        if backend.supports and not backend.supports(args.turbines):
+            continue
+        try:
+            backend.function(layouts[:1], wind_inst_freq, tables, None)   # compile / warm up
+        except ImportError as error:
+            print('%-9s unavailable (%s)' % (name, error))
+            continue
+        best = np.inf
+        for repeat in range(args.repeats):
+            start = time.perf_counter()
+            backend.function(layouts, wind_inst_freq, tables, None)
+            best  = min(best, time.perf_counter() - start)
+        print('%-9s %8.1f layouts/s  (%d layouts of %d turbines, best of %d)'
+              % (name, args.layouts/best, args.layouts, args.turbines, args.repeats))
+    print('automatic choice:', chooseBackend(args.turbines, args.layouts, wind_inst_freq, tables))
+    if 'Threaded_Evaluator' in sys.modules:
+        _printJit(sys.modules['Threaded_Evaluator'].jitStatistics())
+
+
+def _printJit(stats):
+    for name, kernel in stats.items():
+        print('%-15s %7.3f s at start up (%s)' % (name, kernel['seconds'],
+              'loaded from cache' if kernel['cache_hits'] else 'compiled'))
+
+
+def cmdWarmUp(args):
+    try:
+        from Threaded_Evaluator import warmUp
+    except ImportError as error:
+        sys.exit('nothing to compile: %s' % error)
+    _printJit(warmUp())
+
+
+def cmdServe(args):
+    import asyncio
+    from Batch_Evaluator   import BatchEvaluator
+    from Evaluation_Server import EvaluationServer
+
+    server = EvaluationServer(BatchEvaluator(*_loadModel(args)), args.window, args.max_batch)
+    print('serving on', args.socket or '%s:%d' % (args.host, args.port))
+    try:
+        asyncio.run(server.serve(args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        print(json.dumps(server.snapshot(), indent=1))
+
+
+def buildParser():
+    parser = argparse.ArgumentParser(prog='Command_Line.py',
+                                     description='Wind farm layout scoring and optimization')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('evaluate', help='score layout files')
+    p.add_argument('source', help='glob pattern, directory or .npz/.npy/.zip archive')
+    p.add_argument('-o', '--output', help='csv file for the results table')
+    p.add_argument('--top', type=int, default=None, help='rows to print')
+    _addWindOptions(p)
+    p.set_defaults(handler=cmdEvaluate)
+
+    p = commands.add_parser('bin-wind', help='bin wind data into a (36,15) wind rose')
+    p.add_argument('files', nargs='+', help='wind data csv files')
+    p.add_argument('--combine', action='store_true',
+                   help='one rose from all files instead of one per file')
+    p.add_argument('-o', '--output', help='.npy file, printed if omitted')
+    p.set_defaults(handler=cmdBinWind)
+
+    def addRunOptions(p):
+        _addWindOptions(p)
+        p.add_argument('-o', '--output', default='sol.csv', help='best layout csv')
+        p.add_argument('--state', help='save the run state (.npz) for resume')
+        p.add_argument('--checkpoint', help='csv the best layout so far is kept in')
+        p.add_argument('--max-seconds', type=float, help='wall clock budget')
+        p.add_argument('--max-evaluations', type=int, help='evaluation budget')
+        p.add_argument('--fidelity', action='store_true',
+                       help='start on reduced wind roses (Wind_Fidelity)')
+        p.add_argument('--backend', help='force an evaluator backend (Evaluator_Registry)')
+        p.add_argument('--quiet', action='store_true')
+
+    p = commands.add_parser('optimize', help='run the GA')
+    p.add_argument('--config', help='json file of GA settings')
+    p.add_argument('--seed', type=int, default=None)
+    p.add_argument('--initial', nargs='+',
+                   help='csv files or globs of starting layouts, the mu best are kept and '
+                        'random layouts make up the rest')
+    for name, kind in setting_types.items():
+        p.add_argument('--' + name.replace('_', '-'), dest=name,
+                       type=_flag if kind is bool else kind, default=None)
+    addRunOptions(p)
+    p.set_defaults(handler=cmdOptimize)
+
+    p = commands.add_parser('resume', help='continue a run saved with --state')
+    p.add_argument('state_file')
+    p.add_argument('--iterations', type=int, help='further generations')
+    addRunOptions(p)
+    p.set_defaults(handler=cmdResume, wind=None, power_curve=None)
+
+    p = commands.add_parser('benchmark', help='time the evaluators')
+    p.add_argument('--layouts', type=int, default=50)
+    p.add_argument('--turbines', type=int, default=50)
+    p.add_argument('--repeats', type=int, default=3)
+    _addWindOptions(p)
+    p.set_defaults(handler=cmdBenchmark)
+
+    p = commands.add_parser('warm-up', help='compile the numba kernels into the disk cache')
+    p.set_defaults(handler=cmdWarmUp)
+
+    p = commands.add_parser('serve', help='local AEP evaluation server')
+    p.add_argument('--socket', help='Unix socket path, TCP if omitted')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8765)
+    p.add_argument('--window', type=float, default=0.002, help='batching window (s)')
+    p.add_argument('--max-batch', type=int, default=256, help='layouts per evaluator call')
+    _addWindOptions(p)
+    p.set_defaults(handler=cmdServe)
+
+    return(parser)
+
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
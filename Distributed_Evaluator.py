@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Distributed_Evaluator.py
+
+DESCRIPTION
+    Coordinator / worker evaluation over plain TCP
+    ============================================================
+
+    DistributedEvaluator listens for workers, sends each one the wind
+    rose and the EvalTables once when it connects, and from then on is an
+    ordinary evaluate(layouts) -> AEP callable: the layouts are cut into
+    batches of batch_size, handed to whichever worker is free, and the
+    answers put back in order. Workers run getAEPBatch on the very same
+    float64 coordinates, so results are bit for bit those of local
+    evaluation of the same batches (batching alone can change the last
+    bit of a sum).
+
+    Frames are a kind byte, a uint32 tag and a uint64 payload length:
+
+        b'T'  tables     npz of the wind rose and EvalTables fields (no pickle)
+        b'B'  batch id   uint32 n_layouts, n_turbs, then float64 coordinates
+        b'R'  batch id   float64 AEP of the batch
+        b'X'  batch id   utf-8 error message of a failed batch
+        b'H'  heartbeat  no payload, sent both ways
+        b'Q'  quit       no payload
+
+    Both ends send a heartbeat every heartbeat seconds. A worker not heard
+    of for timeout seconds, or whose connection drops, is dropped and its
+    batch in flight goes back to the queue for the others. Workers can
+    join at any time, but a call with no worker connected for
+    worker_grace seconds raises instead of waiting forever.
+
+    On one machine:
+
+        evaluate = DistributedEvaluator(wind_inst_freq, tables, port=0)
+        workers  = spawnLocalWorkers(4, evaluate.address)
+        aep      = evaluate(layouts)
+
+    Across machines (the port is not authenticated, trusted networks only):
+
+        coordinator: DistributedEvaluator(wind_inst_freq, tables, host='0.0.0.0', port=5555)
+        each worker: python Distributed_Evaluator.py worker <coordinator host> 5555
+"""
+
+# Module List
+import numpy  as np
+
+import io
+import itertools
+import os
+import queue
+import select
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from Batch_Evaluator import EvalTables, getAEPBatch
+
+
+frame = struct.Struct('<cIQ')
+shape = struct.Struct('<II')
+
+
+def _sendFrame(sock, kind, tag=0, payload=b''):
+    sock.sendall(frame.pack(kind, tag, len(payload)) + payload)
+
+
+def _receiveExactly(sock, n_bytes):
+    data = bytearray()
+    while len(data) < n_bytes:
+        chunk = sock.recv(min(n_bytes - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        data += chunk
+    return(bytes(data))
+
+
+def _receiveFrame(sock):
+    """(kind, tag, payload) of the next frame"""
+    kind, tag, length = frame.unpack(_receiveExactly(sock, frame.size))
+    return(kind, tag, _receiveExactly(sock, length) if length else b'')
+
+
+def packTables(wind_inst_freq, tables, heartbeat, timeout, memory_budget=None):
+    """npz bytes of everything a worker needs"""
+    buffer = io.BytesIO()
+    np.savez(buffer, wind_inst_freq=wind_inst_freq, heartbeat=heartbeat, timeout=timeout,
+             memory_budget=-1 if memory_budget is None else memory_budget,
+             **tables._asdict())
+    return(buffer.getvalue())
+
+
+def unpackTables(payload):
+    """(wind_inst_freq, tables, heartbeat, timeout, memory_budget) from packTables"""
+    with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+        tables = EvalTables(**{field: data[field][()] for field in EvalTables._fields})
+        memory_budget = int(data['memory_budget'])
+        return(data['wind_inst_freq'], tables, float(data['heartbeat']),
+               float(data['timeout']), None if memory_budget < 0 else memory_budget)
+
+
+class DistributedEvaluator:
+    """
+    :param
+        wind_inst_freq - (36,15) wind rose
+        tables         - EvalTables from Batch_Evaluator.preProcessing
+        host, port     - address to listen on, port 0 picks a free one
+        batch_size     - layouts per batch sent to a worker
+        heartbeat      - seconds between heartbeats
+        timeout        - seconds of silence after which a worker is dropped
+        memory_budget  - bytes, passed on to the workers' getAEPBatch
+        worker_grace   - seconds a call waits with no worker connected
+                         before raising RuntimeError
+    """
+
+    def __init__(self, wind_inst_freq, tables, host='127.0.0.1', port=0, batch_size=16,
+                 heartbeat=1.0, timeout=10.0, memory_budget=None, worker_grace=30.0):
+        self.batch_size   = batch_size
+        self.heartbeat    = heartbeat
+        self.timeout      = timeout
+        self.worker_grace = worker_grace
+        self.metrics    = {'batches': 0, 'layouts': 0, 'requeued': 0, 'workers_lost': 0,
+                           'workers_joined': 0}
+        self._payload   = packTables(wind_inst_freq, tables, heartbeat, timeout, memory_budget)
+        self._tasks     = queue.Queue()
+        self._ids       = itertools.count()
+        self._lock      = threading.Lock()
+        self._workers   = set()
+        self._closed    = threading.Event()
+
+        self._listener = socket.create_server((host, port))
+        self.address   = self._listener.getsockname()[:2]
+        self._acceptor = threading.Thread(target=self._accept, name='coordinator-accept',
+                                          daemon=True)
+        self._acceptor.start()
+
+    @property
+    def n_workers(self):
+        return(len(self._workers))
+
+    def wait_for_workers(self, n_workers, timeout=None):
+        """Blocks until n_workers are connected; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.n_workers < n_workers:
+            if deadline is not None and time.monotonic() > deadline:
+                return(False)
+            time.sleep(0.01)
+        return(True)
+
+    def statistics(self):
+        return(dict(self.metrics, workers=self.n_workers, queued=self._tasks.qsize()))
+
+    def _accept(self):
+        while not self._closed.is_set():
+            try:
+                conn, address = self._listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serveWorker, args=(conn, address),
+                             name='coordinator-%s:%d' % address[:2], daemon=True).start()
+
+    def _finish(self, task, aep=None, error=None):
+        job, b0, b1, layouts = task
+        with self._lock:
+            if error is not None:
+                job['error'] = error
+            else:
+                job['aep'][b0:b1] = aep
+            job['left'] -= 1
+            if job['left'] == 0 or error is not None:
+                job['done'].set()
+
+    def _serveWorker(self, conn, address):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.settimeout(self.timeout)
+        task = None
+        try:
+            _sendFrame(conn, b'T', 0, self._payload)
+            with self._lock:
+                self._workers.add(conn)
+                self.metrics['workers_joined'] += 1
+            last_seen = time.monotonic()
+            while not self._closed.is_set():
+                try:
+                    task = self._tasks.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    # idle: answer for ourselves and check the worker is still there
+                    _sendFrame(conn, b'H')
+                    while select.select([conn], [], [], 0)[0]:
+                        kind, tag, payload = _receiveFrame(conn)
+                        last_seen = time.monotonic()
+                    if time.monotonic() - last_seen > self.timeout:
+                        raise TimeoutError('no heartbeat from %s:%d' % address[:2])
+                    continue
+                if task[0]['error'] is not None:
+                    task = None
+                    continue
+
+                batch_id = next(self._ids)
+                layouts  = task[3]
+                _sendFrame(conn, b'B', batch_id, shape.pack(*layouts.shape[:2]) + layouts.tobytes())
+                while True:
+                    kind, tag, payload = _receiveFrame(conn)   # times out on silence
+                    last_seen = time.monotonic()
+                    if tag != batch_id or kind not in (b'R', b'X'):
+                        continue
+                    if kind == b'R':
+                        self._finish(task, aep=np.frombuffer(payload, dtype='<f8'))
+                        with self._lock:
+                            self.metrics['batches'] += 1
+                            self.metrics['layouts'] += layouts.shape[0]
+                    else:
+                        self._finish(task, error=payload.decode())
+                    task = None
+                    break
+            _sendFrame(conn, b'Q')
+        except (OSError, ConnectionError):
+            with self._lock:
+                self.metrics['workers_lost'] += 1
+        finally:
+            with self._lock:
+                self._workers.discard(conn)
+            if task is not None:
+                self._tasks.put(task)
+                with self._lock:
+                    self.metrics['requeued'] += 1
+            conn.close()
+
+    def __call__(self, layouts):
+        layouts = np.ascontiguousarray(layouts, dtype='<f8')
+        single  = layouts.ndim == 2
+        if single:
+            layouts = layouts[np.newaxis]
+        if layouts.shape[0] == 0:
+            return(np.empty(0))
+        bounds = list(range(0, layouts.shape[0], self.batch_size)) + [layouts.shape[0]]
+        job = {'aep': np.empty(layouts.shape[0]), 'left': len(bounds) - 1, 'error': None,
+               'done': threading.Event()}
+        for b0, b1 in zip(bounds[:-1], bounds[1:]):
+            self._tasks.put((job, b0, b1, layouts[b0:b1]))
+
+        alone_since = None
+        while not job['done'].wait(self.heartbeat):
+            if self.n_workers > 0:
+                alone_since = None
+            elif alone_since is None:
+                alone_since = time.monotonic()
+            elif time.monotonic() - alone_since > self.worker_grace:
+                with self._lock:
+                    job['error'] = 'no worker connected for %g s' % self.worker_grace
+                raise RuntimeError(job['error'])      # its queued batches get skipped
+        if job['error'] is not None:
+            raise RuntimeError('worker failed: %s' % job['error'])
+        return(job['aep'][0] if single else job['aep'])
+
+    def close(self):
+        """Tells the workers to quit and stops listening"""
+        self._closed.set()
+        self._listener.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def runWorker(host, port, connect_timeout=30.0):
+    """
+    Connects to a coordinator and evaluates its batches until told to
+    quit or until the coordinator goes silent.
+
+    :return
+        number of batches evaluated
+    """
+    sock = socket.create_connection((host, port), timeout=connect_timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.settimeout(None)
+    kind, tag, payload = _receiveFrame(sock)
+    wind_inst_freq, tables, heartbeat, timeout, memory_budget = unpackTables(payload)
+    sock.settimeout(timeout)
+
+    send_lock = threading.Lock()
+    stopped   = threading.Event()
+
+    def beat():
+        while not stopped.wait(heartbeat):
+            try:
+                with send_lock:
+                    _sendFrame(sock, b'H')
+            except OSError:
+                break
+
+    threading.Thread(target=beat, name='worker-heartbeat', daemon=True).start()
+    n_batches = 0
+    try:
+        while True:
+            kind, tag, payload = _receiveFrame(sock)
+            if kind == b'Q':
+                break
+            if kind != b'B':
+                continue
+            n_layouts, n_turbs = shape.unpack(payload[:shape.size])
+            layouts = np.frombuffer(payload[shape.size:], dtype='<f8').reshape(n_layouts, n_turbs, 2)
+            try:
+                aep   = np.atleast_1d(getAEPBatch(layouts, wind_inst_freq, tables, memory_budget))
+                reply = (b'R', aep.astype('<f8').tobytes())
+            except Exception as error:
+                reply = (b'X', ('%s: %s' % (type(error).__name__, error)).encode())
+            with send_lock:
+                _sendFrame(sock, reply[0], tag, reply[1])
+            n_batches += 1
+    except (OSError, ConnectionError):
+        pass
+    finally:
+        stopped.set()
+        sock.close()
+    return(n_batches)
+
+
+def spawnLocalWorkers(n_workers, address):
+    """n_workers worker processes on this machine, as subprocess.Popen objects"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    return([subprocess.Popen([sys.executable, os.path.join(here, 'Distributed_Evaluator.py'),
+                              'worker', str(address[0]), str(address[1])], cwd=here)
+            for i in range(n_workers)])
+
+
+if __name__ == "__main__":
+
+    import argparse
+    from Batch_Evaluator import loadPowerCurve, binWindResourceData, preProcessing
+
+    parser   = argparse.ArgumentParser(description='Distributed AEP evaluation')
+    commands = parser.add_subparsers(dest='command', required=True)
+    p = commands.add_parser('worker', help='evaluate batches for a coordinator')
+    p.add_argument('host')
+    p.add_argument('port', type=int)
+    p = commands.add_parser('demo', help='coordinator with local workers, checked against local')
+    p.add_argument('--workers', type=int, default=4)
+    p.add_argument('--layouts', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        print('worker done after %d batches' % runWorker(args.host, args.port))
+    else:
+        from GA_Engine import generate_random_locations
+
+        power_curve    = loadPowerCurve('power_curve.csv')
+        tables         = preProcessing(power_curve, turb_diam=100)
+        wind_inst_freq = binWindResourceData('wind_data_combined.csv')
+        rng     = np.random.default_rng(0)
+        layouts = np.stack([generate_random_locations(rng) for i in range(args.layouts)])
+
+        with DistributedEvaluator(wind_inst_freq, tables) as evaluate:
+            workers = spawnLocalWorkers(args.workers, evaluate.address)
+            evaluate.wait_for_workers(args.workers)
+            start  = time.perf_counter()
+            aep    = evaluate(layouts)
+            print('%d layouts in %.3f s on %d workers'
+                  % (args.layouts, time.perf_counter() - start, args.workers))
+            local = getAEPBatch(layouts, wind_inst_freq, tables)
+            print('identical to local evaluation:', np.array_equal(aep, local))
+            print(evaluate.statistics())
+        for worker in workers:
+            worker.wait()
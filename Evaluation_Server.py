@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Evaluation_Server.py
+
+DESCRIPTION
+    Long running local AEP evaluation service with request micro-batching
+    ============================================================
+
+    EvaluationServer keeps one evaluator (wind rose and tables loaded
+    once) behind a Unix socket or a localhost TCP port. Requests arriving
+    within window seconds of each other are stacked into a single batched
+    evaluator call (up to max_batch layouts), run on a worker thread
+    while the event loop keeps accepting requests for the next batch.
+
+    Messages are binary. A request is one kind byte and two uint32,
+    n_layouts and n_turbs, followed for kind b'E' by n_layouts*n_turbs*2
+    float32 coordinates. Answers start with a kind byte and a uint32:
+
+        b'E' n        n float64 AEP values (GWh)
+        b'M' length   json metrics (kind b'M' request, no payload)
+        b'X' length   utf-8 error message
+
+    Requests with no layouts or no turbines are answered with an error
+    without being queued; one larger than max_request_bytes also closes
+    the connection. Only the requests of the farm size whose evaluator
+    call failed get the error, the rest of the batch is answered.
+
+    Metrics: requests, layouts, batches, mean batch size, layouts per
+    second since start and queue depth (layouts waiting for a batch).
+
+    EvaluationClient is a blocking client; an instance is an evaluate
+    callable usable anywhere an evaluator is expected.
+
+    python Evaluation_Server.py --socket /tmp/aep.sock
+    python Evaluation_Server.py --port 8765
+"""
+
+# Module List
+import numpy  as np
+
+import asyncio
+import json
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+header = struct.Struct('<cII')
+answer = struct.Struct('<cI')
+
+
+class EvaluationServer:
+    """
+    :param
+        evaluate  - callable, (k, n_turbs, 2) layouts -> (k,) AEP
+        window    - seconds to wait for more requests after the first one
+        max_batch - layouts per evaluator call
+        max_request_bytes - largest layout payload accepted in one request
+    """
+
+    def __init__(self, evaluate, window=0.002, max_batch=256, max_request_bytes=1 << 26):
+        self.evaluate  = evaluate
+        self.window    = window
+        self.max_batch = max_batch
+        self.max_request_bytes = max_request_bytes
+        self.metrics   = {'requests': 0, 'layouts': 0, 'batches': 0, 'eval_seconds': 0.0}
+        self.start     = time.perf_counter()
+        self._queued   = 0
+        self._queue    = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='aep-batch')
+
+    def snapshot(self):
+        """Current metrics as a dict"""
+        metrics = dict(self.metrics)
+        uptime  = time.perf_counter() - self.start
+        metrics.update({'uptime'           : uptime,
+                        'queue_depth'      : self._queued,
+                        'mean_batch'       : metrics['layouts']/max(1, metrics['batches']),
+                        'layouts_per_second': metrics['layouts']/max(uptime, 1e-9)})
+        return(metrics)
+
+    def _evaluateBatch(self, items):
+        """
+        Runs on the worker thread: one call per farm size. A failed call
+        leaves its exception as the result of each of its requests.
+        """
+        start  = time.perf_counter()
+        groups = {}
+        for k, (layouts, future) in enumerate(items):
+            groups.setdefault(layouts.shape[1], []).append(k)
+        results = [None]*len(items)
+        for members in groups.values():
+            stacked = np.concatenate([items[k][0] for k in members])
+            try:
+                aep = np.atleast_1d(np.asarray(self.evaluate(stacked), dtype=np.float64))
+            except Exception as error:
+                for k in members:
+                    results[k] = error
+                continue
+            bounds  = np.cumsum([0] + [items[k][0].shape[0] for k in members])
+            for k, b0, b1 in zip(members, bounds[:-1], bounds[1:]):
+                results[k] = aep[b0:b1]
+        return(results, time.perf_counter() - start)
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            count = items[0][0].shape[0]
+            deadline = loop.time() + self.window
+            while count < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                count += item[0].shape[0]
+
+            self._queued -= count
+            try:
+                results, seconds = await loop.run_in_executor(self._executor,
+                                                              self._evaluateBatch, items)
+            except Exception as error:
+                for layouts, future in items:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.metrics['batches']      += 1
+            self.metrics['layouts']      += count
+            self.metrics['eval_seconds'] += seconds
+            for (layouts, future), aep in zip(items, results):
+                if future.done():
+                    continue
+                if isinstance(aep, Exception):
+                    future.set_exception(aep)
+                else:
+                    future.set_result(aep)
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    kind, n_layouts, n_turbs = header.unpack(await reader.readexactly(header.size))
+                except asyncio.IncompleteReadError:
+                    break
+                if kind == b'E':
+                    n_bytes = n_layouts*n_turbs*2*4
+                    if n_bytes > self.max_request_bytes:
+                        message = ('request of %d bytes over the %d byte limit'
+                                   % (n_bytes, self.max_request_bytes)).encode()
+                        writer.write(answer.pack(b'X', len(message)) + message)
+                        await writer.drain()
+                        break
+                    payload = await reader.readexactly(n_bytes)
+                    if n_layouts < 1 or n_turbs < 1:
+                        message = ('expected at least one layout of at least one turbine, got '
+                                   '(%d, %d)' % (n_layouts, n_turbs)).encode()
+                        writer.write(answer.pack(b'X', len(message)) + message)
+                        await writer.drain()
+                        continue
+                    layouts = np.frombuffer(payload, dtype='<f4').reshape(n_layouts, n_turbs, 2)
+                    self.metrics['requests'] += 1
+                    future = loop.create_future()
+                    self._queued += n_layouts
+                    await self._queue.put((layouts, future))
+                    try:
+                        aep = await future
+                        writer.write(answer.pack(b'E', aep.shape[0]) + aep.astype('<f8').tobytes())
+                    except Exception as error:
+                        message = ('%s: %s' % (type(error).__name__, error)).encode()
+                        writer.write(answer.pack(b'X', len(message)) + message)
+                elif kind == b'M':
+                    message = json.dumps(self.snapshot()).encode()
+                    writer.write(answer.pack(b'M', len(message)) + message)
+                else:
+                    message = ('unknown request %r' % kind).encode()
+                    writer.write(answer.pack(b'X', len(message)) + message)
+                    break
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, path=None, host='127.0.0.1', port=8765, ready=None):
+        """
+        Serves forever on the Unix socket path, or on host:port if path
+        is None. ready, an optional threading.Event, is set once
+        listening.
+        """
+        self._queue = asyncio.Queue()
+        self.start  = time.perf_counter()
+        if path is not None:
+            server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            server = await asyncio.start_server(self._handle, host=host, port=port)
+        batcher = asyncio.ensure_future(self._batcher())
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+class EvaluationClient:
+    """
+    Blocking client. evaluate = EvaluationClient(path='/tmp/aep.sock');
+    aep = evaluate(layouts).
+    """
+
+    def __init__(self, path=None, host='127.0.0.1', port=8765):
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _receive(self, n_bytes):
+        data = bytearray()
+        while len(data) < n_bytes:
+            chunk = self.sock.recv(n_bytes - len(data))
+            if not chunk:
+                raise ConnectionError('evaluation server closed the connection')
+            data += chunk
+        return(bytes(data))
+
+    def _answer(self):
+        kind, n = answer.unpack(self._receive(answer.size))
+        if kind == b'E':
+            return(np.frombuffer(self._receive(8*n), dtype='<f8'))
+        message = self._receive(n)
+        if kind == b'M':
+            return(json.loads(message))
+        raise RuntimeError(message.decode())
+
+    def __call__(self, layouts):
+        layouts = np.ascontiguousarray(layouts, dtype='<f4')
+        single  = layouts.ndim == 2
+        if single:
+            layouts = layouts[np.newaxis]
+        self.sock.sendall(header.pack(b'E', layouts.shape[0], layouts.shape[1]) + layouts.tobytes())
+        aep = self._answer()
+        return(aep[0] if single else aep)
+
+    def metrics(self):
+        self.sock.sendall(header.pack(b'M', 0, 0))
+        return(self._answer())
+
+    def close(self):
+        self.sock.close()
+
+
+if __name__ == "__main__":
+
+    import argparse
+    from Batch_Evaluator import loadPowerCurve, binWindResourceData, preProcessing, BatchEvaluator
+
+    parser = argparse.ArgumentParser(description='Local AEP evaluation server')
+    parser.add_argument('--socket', help='Unix socket path (default: TCP on localhost)')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--window', type=float, default=0.002, help='batching window (s)')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--wind', default='wind_data_combined.csv')
+    parser.add_argument('--power-curve', default='power_curve.csv')
+    args = parser.parse_args()
+
+    tables   = preProcessing(loadPowerCurve(args.power_curve), turb_diam=100)
+    evaluate = BatchEvaluator(binWindResourceData(args.wind), tables)
+    server   = EvaluationServer(evaluate, args.window, args.max_batch)
+    print('serving on', args.socket or '127.0.0.1:%d' % args.port)
+    asyncio.run(server.serve(args.socket, port=args.port))
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Evaluator_Registry.py
+
+DESCRIPTION
+    One evaluate(layouts, wind) front for all the AEP evaluators
+    ============================================================
+
+    Every evaluator is registered under a name as a function
+    (layouts, wind_inst_freq, tables, memory_budget) -> AEP of each
+    layout, memory_budget being None or the bytes it may use:
+
+        batch     - Batch_Evaluator.getAEPBatch, numpy broadcasting
+        threaded  - Threaded_Evaluator.getAEPThreaded, numba on a thread pool
+        reference - Farm_Evaluator.totalAEP layout by layout (50 turbines
+                    only, never picked automatically, for debugging)
+
+    Which one is fastest depends on the machine, the number of turbines
+    and how many layouts come at once. The first time evaluate meets a
+    (n_turbs, n_layouts) regime, both rounded up to a power of two, it
+    times every available backend on random layouts of that size, keeps
+    the fastest among those agreeing with 'batch', and stores the choice
+    in a json file (WFLO_BACKEND_CACHE, default ~/.cache/wflo_backends.json)
+    under this host's name, so later runs go straight to it. Calibration
+    holds a lock of its regime only, other regimes are evaluated
+    meanwhile.
+
+    A backend can be forced with evaluate(..., backend='batch'), the
+    AutoEvaluator backend argument, or the WFLO_BACKEND environment
+    variable. registerBackend adds more, e.g. a DistributedEvaluator.
+"""
+
+# Module List
+import numpy  as np
+from collections import namedtuple
+
+import json
+import os
+import platform
+import threading
+import time
+
+from Batch_Evaluator import BatchEvaluator, getAEPBatch, loadPowerCurve, preProcessing
+
+
+Backend  = namedtuple('Backend', ['function', 'supports', 'calibrate'])
+backends = {}
+
+# regime -> backend name, this host only; filled from the cache file
+_choices      = None
+_choices_lock = threading.Lock()
+_regime_locks = {}
+_tables       = None
+
+
+def registerBackend(name, function, supports=None, calibrate=True):
+    """
+    :param
+        function  - (layouts (k,n_turbs,2), wind_inst_freq, tables, memory_budget)
+                    -> (k,) AEP, raising ImportError when a dependency is
+                    missing. memory_budget is None or bytes.
+        supports  - n_turbs -> bool, None for any number of turbines
+        calibrate - False to only run it when forced
+    """
+    backends[name] = Backend(function, supports, calibrate)
+
+
+def _batch(layouts, wind_inst_freq, tables, memory_budget=None):
+    return(getAEPBatch(layouts, wind_inst_freq, tables, memory_budget))
+
+
+def _threaded(layouts, wind_inst_freq, tables, memory_budget=None):
+    # a few arrays of n_turbs per thread, the budget never binds
+    from Threaded_Evaluator import getAEPThreaded
+    return(getAEPThreaded(layouts, wind_inst_freq, tables))
+
+
+def _reference(layouts, wind_inst_freq, tables, memory_budget=None):
+    from Farm_Evaluator import totalAEP
+    return(np.array([totalAEP(2*float(tables.turb_rad), layout, tables.power_curve, wind_inst_freq)
+                     for layout in layouts]))
+
+
+registerBackend('batch', _batch)
+registerBackend('threaded', _threaded)
+registerBackend('reference', _reference, supports=lambda n_turbs: n_turbs == 50, calibrate=False)
+
+
+def cacheFile():
+    return(os.environ.get('WFLO_BACKEND_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'wflo_backends.json')))
+
+
+def hostKey():
+    """Cache entries are per host, a home directory may be shared"""
+    return('%s/%d cpus' % (platform.node(), os.cpu_count() or 1))
+
+
+def regime(n_turbs, n_layouts):
+    """'n_turbs x n_layouts' key, both rounded up to a power of two"""
+    bucket = lambda n: 1 << max(0, int(n) - 1).bit_length()
+    return('%dx%d' % (bucket(n_turbs), bucket(n_layouts)))
+
+
+def _readCache():
+    try:
+        with open(cacheFile()) as f:
+            return(json.load(f))
+    except (OSError, ValueError):
+        return({})
+
+
+def _writeCache(entry_regime, entry):
+    """Merges one calibration into the cache file, written atomically"""
+    cache = _readCache()
+    cache.setdefault(hostKey(), {})[entry_regime] = entry
+    file_name = cacheFile()
+    os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+    temporary = '%s.%d.tmp' % (file_name, os.getpid())
+    with open(temporary, 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(temporary, file_name)
+
+
+def defaultTables():
+    """EvalTables of power_curve.csv next to this file, loaded once"""
+    global _tables
+    if _tables is None:
+        here    = os.path.dirname(os.path.abspath(__file__))
+        _tables = preProcessing(loadPowerCurve(os.path.join(here, 'power_curve.csv')), turb_diam=100)
+    return(_tables)
+
+
+def calibrate(n_turbs, n_layouts, wind_inst_freq, tables, repeats=3, max_layouts=64, rng=0):
+    """
+    Times every calibrated backend on random layouts of the regime.
+
+    :return
+        dict backend name -> seconds per layout (best of repeats, after
+        a warm-up call for compilation), for the backends that ran and
+        agree with 'batch' to 1e-4 relative
+    """
+    rng     = np.random.default_rng(rng)
+    layouts = rng.uniform(50, 3950, (min(n_layouts, max_layouts), n_turbs, 2))
+    target  = None
+    timings = {}
+    for name in ['batch'] + [name for name in backends if name != 'batch']:
+        backend = backends[name]
+        if not backend.calibrate or (backend.supports and not backend.supports(n_turbs)):
+            continue
+        try:
+            aep  = np.atleast_1d(backend.function(layouts, wind_inst_freq, tables, None))
+            best = np.inf
+            for repeat in range(repeats):
+                start = time.perf_counter()
+                backend.function(layouts, wind_inst_freq, tables, None)
+                best  = min(best, time.perf_counter() - start)
+        except Exception:           # missing dependency, out of memory, ...
+            continue
+        if target is None:
+            target = aep
+        elif not np.allclose(aep, target, rtol=1e-4, atol=0):
+            continue
+        timings[name] = best/layouts.shape[0]
+    return(timings)
+
+
+def _knownChoice(key):
+    """Cached backend of a regime or None, to be called under _choices_lock"""
+    global _choices
+    if _choices is None:
+        _choices = {k: v['backend'] for k, v in _readCache().get(hostKey(), {}).items()}
+    if key in _choices and _choices[key] in backends:
+        return(_choices[key])
+    return(None)
+
+
+def chooseBackend(n_turbs, n_layouts, wind_inst_freq, tables):
+    """
+    Backend name for a regime, calibrated and cached on first use. Only
+    threads meeting the same new regime wait for its calibration.
+    """
+    key = regime(n_turbs, n_layouts)
+    with _choices_lock:
+        choice = _knownChoice(key)
+        if choice is not None:
+            return(choice)
+        regime_lock = _regime_locks.setdefault(key, threading.Lock())
+
+    with regime_lock:
+        with _choices_lock:
+            choice = _knownChoice(key)
+        if choice is not None:
+            return(choice)
+        timings = calibrate(n_turbs, int(key.split('x')[1]), wind_inst_freq, tables)
+        choice  = min(timings, key=timings.get) if timings else 'batch'
+        with _choices_lock:
+            _choices[key] = choice
+            try:
+                _writeCache(key, {'backend': choice, 'seconds_per_layout': timings})
+            except OSError:
+                pass                # read-only home, keep the choice for this process
+    return(choice)
+
+
+def evaluate(layouts, wind_inst_freq, tables=None, backend=None, memory_budget=None):
+    """
+    AEP (GWh) of every layout with the fastest backend for this host and
+    regime, or with backend (or $WFLO_BACKEND) if given.
+
+    :param
+        layouts        - (n_layouts, n_turbs, 2) or a single (n_turbs, 2)
+        wind_inst_freq - (36,15) wind rose
+        tables         - EvalTables, those of power_curve.csv if None
+        memory_budget  - bytes the backend may use, None for no limit
+
+    :return
+        AEP with shape (n_layouts,), a float for a single layout
+    """
+    tables  = defaultTables() if tables is None else tables
+    layouts = np.asarray(layouts)
+    single  = layouts.ndim == 2
+    if single:
+        layouts = layouts[np.newaxis]
+    name = backend or os.environ.get('WFLO_BACKEND') or \
+           chooseBackend(layouts.shape[1], layouts.shape[0], wind_inst_freq, tables)
+    if name not in backends:
+        raise ValueError('unknown backend %r, registered: %s' % (name, ', '.join(backends)))
+    aep = np.atleast_1d(backends[name].function(layouts, wind_inst_freq, tables, memory_budget))
+    return(aep[0] if single else aep)
+
+
+class AutoEvaluator(BatchEvaluator):
+    """
+    BatchEvaluator whose evaluate(layouts) goes through the registry;
+    breakdown, progressive and relocation stay on Batch_Evaluator. The
+    memory_budget applies to all of them.
+    """
+
+    def __init__(self, wind_inst_freq, tables, backend=None, memory_budget=None):
+        super().__init__(wind_inst_freq, tables, memory_budget)
+        self.backend = backend
+
+    def __call__(self, layouts):
+        return(evaluate(layouts, self.wind_inst_freq, self.tables, self.backend,
+                        self.memory_budget))
+
+
+if __name__ == "__main__":
+
+    from Batch_Evaluator import binWindResourceData
+
+    tables         = defaultTables()
+    wind_inst_freq = binWindResourceData('wind_data_combined.csv')
+    for n_turbs in (10, 50, 100):
+        for n_layouts in (1, 16, 64):
+            name    = chooseBackend(n_turbs, n_layouts, wind_inst_freq, tables)
+            timings = _readCache()[hostKey()][regime(n_turbs, n_layouts)]['seconds_per_layout']
+            print(regime(n_turbs, n_layouts).ljust(8),
+                  '  '.join('%s %.2f ms' % (k, 1e3*t) for k, t in timings.items()), ' ->', name)
+    print('choices cached in', cacheFile())
@@ -204,7 +204,7 @@ def rotatedFrame(turb_coords, wind_drct):
     return(rotate_coords)
 
 
-@njit            # jensenParkWake is numba compiled function. Gives speed gains. 
+@njit('(int64, float64, float32[:,:], float32[:,:], float64)', cache=True)  # compiled once per host, then loaded from numba's disk cache
 def jensenParkWake(n_turbs, turb_diam, rotate_coords, power_curve, wind_sped):
     """
     -**-THIS FUNCTION SHOULD NOT BE MODIFIED-**-
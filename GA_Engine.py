@@ -0,0 +1,821 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    GA_Engine.py
+
+DESCRIPTION
+    The genetic algorithm of Mutation_energies_540.py as importable functions
+    ============================================================
+
+    Same tournament selection and extrapolating arithmetic crossover as
+    the GA scripts, with these differences:
+
+    - GA settings are passed as a dict (see default_settings) instead of
+      being module constants, so runs can be driven from other code.
+    - Layouts are (n_turbs, 2) arrays and a population is one
+      (mu, n_turbs, 2) array, so offspring are scored in a single call
+      of the injected evaluate(layouts) -> AEP callable.
+    - The evaluator may be a Wind_Fidelity.MultiFidelityEvaluator, in
+      which case early generations run on a reduced wind rose and the
+      final population is always re-scored on the full one.
+    - Mutation chances and step sizes are arrays of the population that
+      adapt by the 1/5th success rule, and all jitter proposals are drawn
+      and checked at once instead of turbine by turbine.
+    - Crossover children are made feasible by repair, a vectorized push
+      apart relaxation, rather than by redrawing turbines one at a time
+      ('retry' mode keeps the old behaviour).
+    - Before blending, the turbines of the second parent are matched to
+      their nearest counterparts in the first (align_parents), since
+      turbine indices of unrelated layouts are arbitrary labels.
+    - In 'guided' mutation mode the turbines that lose the most energy to
+      wakes are the most likely to be moved. The losses come with the
+      AEP from evaluate.breakdown, at no extra evaluations.
+    - With a Surrogate.SurrogateScreen, screen_factor times more children
+      are bred than needed and only the best predicted ones are evaluated.
+    - A Run_Controller.RunController can end the run on a time or
+      evaluation budget and restart part of a stagnated population.
+
+    Typical use:
+
+        evaluate = BatchEvaluator(wind_inst_freq, tables)
+        result   = run_ga({'iterations': 300, 'mutation_mode': 'guided'}, evaluate, rng=0)
+        save_solution(result['best_layout'], 'sol.csv')
+"""
+
+# Module List
+import numpy  as np
+import pandas as pd
+import math
+
+
+default_settings = {
+    'no_of_turbines'         : 50,
+    'mu'                     : 50,
+    'x'                      : 0.9,
+    'c'                      : 40,
+    'iterations'             : 2000,
+    'Dm'                     : 400,
+    'tries_retaining_parents': 50,
+    'tries_changing_parents' : 20,
+    'no_of_mutation_tries'   : 100,
+    'no_retained'            : 1,
+    'mutation_rate'          : 0.75,
+    'turbine_rate'           : 0.75,
+    'adapt_factor'           : 1.5,
+    'Dm_min'                 : 5.0,
+    'Dm_max'                 : 1000.0,
+    'mutation_mode'          : 'random',
+    'crossover_mode'         : 'repair',
+    'align_parents'          : True,
+    'screen_factor'          : 3,
+    'track_loss'             : False,
+}
+
+mutation_modes  = ('random', 'guided')
+crossover_modes = ('retry', 'repair')
+
+# turbines must stay strictly inside the 50 m boundary clearance and
+# at least 4 diameters apart
+coord_min   = 50.0
+coord_max   = 3950.0
+min_spacing = 400.0
+
+# self adapted mutation chances never drop below this
+rate_min    = 0.02
+
+# repair pushes turbines this much (m) past the constraints so that
+# rounding can't put them back on the wrong side
+repair_margin = 1e-3
+
+
+def in_bounds(xy):
+    """True where the last axis (x, y) is strictly inside the clearance"""
+    xy = np.asarray(xy)
+    return(np.all((xy > coord_min) & (xy < coord_max), axis=-1))
+
+
+def far_enough(xy, others):
+    """True if xy is at least min_spacing away from every row of others"""
+    if others.shape[0] == 0:
+        return(True)
+    return(bool(np.min(np.sum(np.square(others - xy), axis=1)) >= min_spacing**2))
+
+
+def feasible_layouts(layouts):
+    """(n_layouts,) True for the (n_layouts, n_turbs, 2) layouts satisfying both constraints"""
+    layouts = np.asarray(layouts, dtype=np.float64)
+    n_turbs = layouts.shape[1]
+    dist2   = np.sum(np.square(layouts[:,:,np.newaxis] - layouts[:,np.newaxis]), axis=-1)
+    dist2[:,np.arange(n_turbs),np.arange(n_turbs)] = np.inf
+    return(np.all(in_bounds(layouts), axis=1) & (np.min(dist2, axis=(1, 2)) >= min_spacing**2))
+
+
+def is_feasible(layout):
+    """True if a (n_turbs, 2) layout satisfies both farm constraints"""
+    return(bool(feasible_layouts(np.asarray(layout)[np.newaxis])[0]))
+
+
+def repair(layouts, max_iterations=500, rng=None):
+    """
+    Pushes the turbines of infeasible layouts apart and back inside the
+    farm. Turbines are first clipped into the boundary clearance, then
+    every pair closer than min_spacing is moved apart along the line
+    joining them by half the overlap each, all pairs of all layouts at
+    once, until nothing overlaps or max_iterations is reached. Feasible
+    layouts come back unchanged, the others end close to where they
+    started.
+
+    :param
+        layouts - (n_layouts, n_turbs, 2) or a single (n_turbs, 2)
+        rng     - seed or np.random.Generator, for separating turbines
+                  sitting on the same spot
+
+    :return
+        (repaired layouts, feasible) with feasible a bool per layout
+    """
+    rng    = np.random.default_rng(rng)
+    xy     = np.array(layouts, dtype=np.float64)
+    single = xy.ndim == 2
+    if single:
+        xy = xy[np.newaxis]
+    n_turbs = xy.shape[1]
+    lower, upper = coord_min + repair_margin, coord_max - repair_margin
+
+    bad = ~feasible_layouts(xy)
+    xy[bad] = np.clip(xy[bad], lower, upper)
+    for iteration in range(max_iterations):
+        bad = np.nonzero(~feasible_layouts(xy))[0]
+        if bad.shape[0] == 0:
+            break
+
+        diff = xy[bad][:,:,np.newaxis] - xy[bad][:,np.newaxis]
+        dist = np.sqrt(np.sum(np.square(diff), axis=-1))
+        dist[:,np.arange(n_turbs),np.arange(n_turbs)] = np.inf
+
+        # turbines on the same spot are separated in a random direction
+        same = dist == 0
+        if np.any(same):
+            diff[same] = rng.normal(size=(np.count_nonzero(same), 2))
+            diff[same] -= np.swapaxes(diff, 1, 2)[same]
+            dist[same] = np.sqrt(np.sum(np.square(diff[same]), axis=-1))
+
+        overlap = np.maximum(min_spacing + repair_margin - dist, 0.0)
+        push    = np.sum((0.5*overlap/dist)[...,np.newaxis]*diff, axis=2)
+        xy[bad] = np.clip(xy[bad] + push, lower, upper)
+
+    feasible = feasible_layouts(xy)
+    return((xy[0], feasible[0]) if single else (xy, feasible))
+
+
+def generate_random_locations(rng, no_of_turbines=50):
+    """Random feasible layout, turbines placed one at a time"""
+    layout = np.zeros((no_of_turbines, 2))
+    layout[0] = rng.uniform(coord_min, coord_max, 2)
+    for i in range(1, no_of_turbines):
+        xy = rng.uniform(coord_min, coord_max, 2)
+        while not far_enough(xy, layout[:i]):
+            xy = rng.uniform(coord_min, coord_max, 2)
+        layout[i] = xy
+    return(layout)
+
+
+def initialize_generation(settings, evaluate, rng):
+    """Returns (coords, aep) of mu random layouts"""
+    coords = np.stack([generate_random_locations(rng, settings['no_of_turbines'])
+                       for i in range(settings['mu'])])
+    return(coords, evaluate(coords))
+
+
+def initialize_generation_by_files(file_names, evaluate):
+    """
+    Returns (coords, aep) of layouts read from csv files with x,y
+    columns. Infeasible layouts are repaired.
+    """
+    coords = np.stack([pd.read_csv(f)[['x', 'y']].to_numpy(dtype = np.float64)
+                       for f in file_names])
+    coords, feasible = repair(coords)
+    if not np.all(feasible):
+        raise ValueError('Could not repair ' + ', '.join(np.asarray(file_names)[~feasible]))
+    return(coords, evaluate(coords))
+
+
+def linear_assignment(cost):
+    """
+    Minimum cost perfect matching of a square cost matrix (Hungarian
+    method, shortest augmenting paths, inner loops vectorized over the
+    columns). Returns col with row i matched to column col[i].
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    n    = cost.shape[0]
+    u    = np.zeros(n + 1)
+    v    = np.zeros(n + 1)
+    p    = np.zeros(n + 1, dtype=np.int64)     # row matched to column j (1-based)
+    way  = np.zeros(n + 1, dtype=np.int64)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0   = 0
+        minv = np.full(n + 1, np.inf)
+        used = np.zeros(n + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0   = p[j0]
+            free = ~used[1:]
+            cur  = cost[i0-1] - u[i0] - v[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better]  = j0
+
+            j1    = int(np.argmin(np.where(free, minv[1:], np.inf))) + 1
+            delta = minv[j1]
+            u[p[used]] += delta
+            v[used]    -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1    = way[j0]
+            p[j0] = p[j1]
+            j0    = j1
+
+    col = np.zeros(n, dtype=np.int64)
+    col[p[1:] - 1] = np.arange(n)
+    return(col)
+
+
+def align_to(reference, layout):
+    """
+    layout with its turbines reordered so that turbine i is the
+    counterpart of reference turbine i, minimising the total squared
+    distance between matched turbines
+    """
+    cost = np.sum(np.square(reference[:,np.newaxis] - layout[np.newaxis]), axis=-1)
+    return(layout[linear_assignment(cost)])
+
+
+def choose_parents(parents_for_crossovers, settings, rng):
+    """
+    Two random parents of the pool, (pair, parents). Turbine indices are
+    arbitrary labels, so with align_parents the second parent is
+    reordered to match the first before they are blended.
+    """
+    pair    = rng.choice(parents_for_crossovers.shape[0], 2, replace=False)
+    parents = parents_for_crossovers[pair]
+    if settings['align_parents']:
+        parents = np.stack([parents[0], align_to(parents[0], parents[1])])
+    return(pair, parents)
+
+
+def count_crossover(stats, key, n=1):
+    """Adds n to stats[key] if crossover statistics are being kept"""
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + n
+
+
+def crossover(parents_for_crossovers, settings, rng, stats=None):
+    """
+    Child of two random parents of the pool, turbine i being an
+    extrapolating blend a*p0 + (1-a)*p1, a in [-5,5] per axis, redrawn
+    until it is feasible. Falls back to a random layout when even
+    changing parents doesn't help.
+
+    :param
+        stats - optional dict counting 'children', 'fallbacks' (random
+                layouts), 'blends' and 'blends_feasible'
+
+    :return
+        (child, pair) with pair the pool indices of the parents of the
+        last turbine, None for a random fallback
+    """
+    no_of_turbines = settings['no_of_turbines']
+    pair, parents  = choose_parents(parents_for_crossovers, settings, rng)
+    child   = np.zeros((no_of_turbines, 2))
+    count_crossover(stats, 'children')
+
+    # the first turbine only needs to be inside the farm
+    xy = np.full(2, -1.0)
+    while not in_bounds(xy):
+        a  = rng.uniform(-5, 5, 2)
+        xy = a*parents[0,0] + (1 - a)*parents[1,0]
+    child[0] = xy
+
+    for i in range(1, no_of_turbines):
+        iter_same_parents     = 0
+        iter_changing_parents = 0
+        while True:
+            a  = rng.uniform(-5, 5, 2)
+            xy = a*parents[0,i] + (1 - a)*parents[1,i]
+            count_crossover(stats, 'blends')
+            if in_bounds(xy) and far_enough(xy, child[:i]):
+                count_crossover(stats, 'blends_feasible')
+                break
+
+            iter_same_parents += 1
+            if iter_same_parents > settings['tries_retaining_parents']:
+                iter_changing_parents += 1
+                if iter_changing_parents > settings['tries_changing_parents']:
+                    count_crossover(stats, 'fallbacks')
+                    return(generate_random_locations(rng, no_of_turbines), None)
+                pair, parents = choose_parents(parents_for_crossovers, settings, rng)
+                iter_same_parents = 0
+        child[i] = xy
+
+    return(child, pair)
+
+
+def crossover_by_repair(parents_for_crossovers, settings, rng, stats=None):
+    """
+    Same blends as crossover, but drawn for all turbines at once: of
+    tries_retaining_parents blends per turbine the first inside the farm
+    is kept, and the spacing is then fixed by repair instead of redrawing
+    turbine by turbine. New parents are only drawn if repair fails.
+
+    :return
+        (child, pair) as crossover. stats as crossover, a blend counting
+        as feasible if it is inside the farm and needed no repair.
+    """
+    no_of_turbines = settings['no_of_turbines']
+    n_tries = max(1, settings['tries_retaining_parents'])
+    count_crossover(stats, 'children')
+
+    for iter_changing_parents in range(settings['tries_changing_parents'] + 1):
+        pair, parents = choose_parents(parents_for_crossovers, settings, rng)
+
+        a      = rng.uniform(-5, 5, (n_tries, no_of_turbines, 2))
+        blends = a*parents[0] + (1 - a)*parents[1]
+        inside = in_bounds(blends)
+        first  = np.argmax(inside, axis=0)
+        blend  = blends[first,np.arange(no_of_turbines)]
+        child, feasible = repair(blend, rng=rng)
+
+        used = np.where(np.any(inside, axis=0), first + 1, n_tries)
+        count_crossover(stats, 'blends', int(np.sum(used)))
+        count_crossover(stats, 'blends_feasible', int(np.sum(np.all(child == blend, axis=1))))
+        if feasible:
+            return(child, pair)
+
+    count_crossover(stats, 'fallbacks')
+    return(generate_random_locations(rng, no_of_turbines), None)
+
+
+def alignment_statistics(parents_for_crossovers, rng, n_samples=200):
+    """
+    Feasibility of single shot blends of random parent pairs of a pool,
+    without and with turbine alignment.
+
+    :return
+        dict 'unaligned' / 'aligned' -> dict with 'turbines_in_bounds'
+        (fraction of blended turbines inside the farm), 'children_feasible'
+        (fraction of children feasible as drawn), 'children_repaired'
+        (fraction feasible after repair) and 'match_distance' (mean
+        distance (m) between the turbines blended together)
+    """
+    rng     = np.random.default_rng(rng)
+    n_turbs = parents_for_crossovers.shape[1]
+    result  = {}
+    for name, align in (('unaligned', False), ('aligned', True)):
+        pairs   = [rng.choice(parents_for_crossovers.shape[0], 2, replace=False)
+                   for sample in range(n_samples)]
+        parents = parents_for_crossovers[np.array(pairs)]
+        if align:
+            parents[:,1] = [align_to(p[0], p[1]) for p in parents]
+
+        a        = rng.uniform(-5, 5, (n_samples, n_turbs, 2))
+        children = a*parents[:,0] + (1 - a)*parents[:,1]
+        repaired = repair(children, rng=rng)[1]
+        result[name] = {
+            'turbines_in_bounds': float(np.mean(in_bounds(children))),
+            'children_feasible' : float(np.mean(feasible_layouts(children))),
+            'children_repaired' : float(np.mean(repaired)),
+            'match_distance'    : float(np.mean(np.linalg.norm(parents[:,0] - parents[:,1], axis=-1)))}
+    return(result)
+
+
+def new_strategy(settings, n_individuals):
+    """Initial mutation strategy arrays for n_individuals"""
+    n = settings['no_of_turbines']
+    return({'pm1': np.full(n_individuals, settings['mutation_rate']),
+            'pm2': np.full((n_individuals, n), settings['turbine_rate']),
+            'Dm' : np.full(n_individuals, float(settings['Dm']))})
+
+
+def score(evaluate, coords, settings):
+    """
+    (aep (k,), loss (k, n_turbs)) of k layouts. In guided mode, or with
+    track_loss set, both come from one evaluate.breakdown pass, otherwise
+    loss is all zeros.
+    """
+    coords = np.asarray(coords)
+    if settings['mutation_mode'] == 'guided' or settings['track_loss']:
+        result = evaluate.breakdown(coords)
+        return(np.atleast_1d(result['aep']), np.atleast_2d(result['turbine_loss']))
+    aep = np.atleast_1d(evaluate(coords))
+    return(aep, np.zeros((aep.shape[0], coords.shape[-2])))
+
+
+def new_population(coords, aep, settings, loss=None):
+    """
+    Population dict: 'coords' (mu, n_turbs, 2), 'aep' (mu,), 'loss'
+    (mu, n_turbs) wake loss of every turbine (guided mode only) and the
+    self adaptive mutation strategy of every individual, 'pm1' (mu,)
+    chance to mutate at all, 'pm2' (mu, n_turbs) chance per turbine and
+    'Dm' (mu,) step size. Every array is indexed by individual first.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if loss is None:
+        loss = np.zeros(coords.shape[:2])
+    population = {'coords': coords,
+                  'aep'   : np.asarray(aep, dtype=np.float64),
+                  'loss'  : np.asarray(loss, dtype=np.float64)}
+    population.update(new_strategy(settings, population['aep'].shape[0]))
+    return(population)
+
+
+def take(population, indices):
+    """Individuals at indices (array, slice or boolean mask)"""
+    return({k: v[indices] for k, v in population.items()})
+
+
+def concatenate(*populations):
+    """Populations appended one after the other"""
+    return({k: np.concatenate([p[k] for p in populations]) for k in populations[0]})
+
+
+def sort_population(population):
+    """Population sorted by AEP, best first"""
+    return(take(population, np.argsort(-population['aep'], kind='stable')))
+
+
+def propose_moves(coords, moving, Dm, no_of_tries, rng, chunk=16):
+    """
+    Jitters every moving turbine by up to +-Dm of its individual per axis
+    and keeps the first of up to no_of_tries proposals that is inside the
+    farm and clear of the other turbines of its layout. All proposals of
+    a chunk of tries are drawn and checked as one array operation.
+
+    :param
+        coords - (mu, n_turbs, 2) current layouts
+        moving - (mu, n_turbs) bool, turbines to move
+        Dm     - (mu,) step sizes
+
+    :return
+        (new_coords, moved) where moved flags turbines that found a spot
+    """
+    new_coords = coords.copy()
+    pending    = moving.copy()
+    while no_of_tries > 0 and np.any(pending):
+        n_tries = min(chunk, no_of_tries)
+        ind, turb = np.nonzero(pending)
+        n_pending = ind.shape[0]
+
+        jitter = rng.uniform(0, 1, (n_pending, n_tries, 2)) - rng.uniform(0, 1, (n_pending, n_tries, 2))
+        proposals = coords[ind,turb][:,np.newaxis] + Dm[ind][:,np.newaxis,np.newaxis]*jitter
+
+        # (n_pending, n_tries, n_turbs) squared distances to the layout,
+        # ignoring the turbine's own current position
+        dist2 = np.sum(np.square(proposals[:,:,np.newaxis] - coords[ind][:,np.newaxis]), axis=-1)
+        dist2[np.arange(n_pending),:,turb] = np.inf
+        ok = in_bounds(proposals) & (np.min(dist2, axis=-1) >= min_spacing**2)
+
+        found = np.any(ok, axis=1)
+        first = np.argmax(ok, axis=1)
+        new_coords[ind[found],turb[found]] = proposals[found,first[found]]
+        pending[ind[found],turb[found]] = False
+        no_of_tries -= n_tries
+
+    return(new_coords, moving & ~pending)
+
+
+def resolve_conflicts(coords, new_coords, moved):
+    """
+    Moves were checked against the old positions of the other turbines,
+    so two turbines moved together may now clash. Of every clashing pair
+    the higher index one is put back, which is always feasible.
+    """
+    dist2    = np.sum(np.square(new_coords[:,:,np.newaxis] - new_coords[:,np.newaxis]), axis=-1)
+    conflict = (dist2 < min_spacing**2) & moved[:,:,np.newaxis] & moved[:,np.newaxis,:]
+    revert   = np.any(np.triu(conflict, k=1), axis=1)
+    new_coords[revert] = coords[revert]
+    return(new_coords, moved & ~revert)
+
+
+def adapt_strategy(population, mutated, moved, success, settings):
+    """
+    1/5th success rule. Step sizes and the chances of the turbines that
+    moved grow by adapt_factor after a success and shrink by
+    adapt_factor**(1/4) after a failure, so they settle where about one
+    mutation in five improves the individual.
+    """
+    grow   = settings['adapt_factor']
+    shrink = grow**-0.25
+
+    factor = np.where(success, grow, shrink)
+    population['Dm'][mutated] *= factor[mutated]
+    population['pm1'][mutated] *= factor[mutated]
+    population['pm2'][moved] *= np.broadcast_to(factor[:,np.newaxis], moved.shape)[moved]
+
+    np.clip(population['Dm'], settings['Dm_min'], settings['Dm_max'], out=population['Dm'])
+    np.clip(population['pm1'], rate_min, 1.0, out=population['pm1'])
+    np.clip(population['pm2'], rate_min, 1.0, out=population['pm2'])
+
+
+def best_improvement(evaluate, candidates, threshold, settings, archive=None, parent=None):
+    """
+    (index, aep, loss) of the best of candidates if it beats threshold,
+    else None. With an evaluator offering progressive(), candidates that
+    cannot win are abandoned after part of the wind rose. Every candidate
+    scored in full is appended to archive if one is given, with parent.
+    """
+    def record(scored, aep):
+        if archive is not None and np.any(scored):
+            archive.append(candidates[scored], aep[scored], 'mutation',
+                           np.broadcast_to(parent, candidates[scored].shape))
+
+    if hasattr(evaluate, 'progressive'):
+        result = evaluate.progressive(candidates, threshold)
+        record(~result['rejected'], result['aep'])
+        if np.all(result['rejected']):
+            return(None)
+        best = int(np.nanargmax(result['aep']))
+        if not result['aep'][best] > threshold:
+            return(None)
+        aep, loss = score(evaluate, candidates[best:best+1], settings) \
+                    if settings['mutation_mode'] == 'guided' or settings['track_loss'] \
+                    else ([result['aep'][best]], np.zeros((1, candidates.shape[1])))
+        return(best, aep[0], loss[0])
+
+    aep, loss = score(evaluate, candidates, settings)
+    record(np.ones(aep.shape[0], dtype=bool), aep)
+    best = int(np.argmax(aep))
+    if not aep[best] > threshold:
+        return(None)
+    return(best, aep[best], loss[best])
+
+
+def mutation(population, settings, evaluate, rng, archive=None):
+    """
+    Self adaptive jitter mutation of a population sorted best first,
+    modified in place. Individual i mutates with chance pm1[i] and then
+    each of its turbines t moves with chance pm2[i,t] by up to +-Dm[i],
+    in guided mode scaled by the turbine's wake loss relative to the
+    layout's mean loss. The first no_retained individuals only take the
+    best improving single turbine move, see best_improvement. Proposals,
+    bounds and spacing checks run as array operations over all
+    individuals and turbines at once; only the changed individuals are
+    re-evaluated. Every layout scored, the candidates turned down
+    included, is appended to archive if one is given.
+    """
+    coords = population['coords']
+    aep    = population['aep']
+    mu, no_of_turbines = coords.shape[:2]
+    no_retained = min(settings['no_retained'], mu)
+
+    turbine_chance = population['pm2']
+    if settings['mutation_mode'] == 'guided':
+        loss = np.maximum(population['loss'], 0.0)
+        mean_loss = np.maximum(np.mean(loss, axis=1, keepdims=True), 1e-12)
+        turbine_chance = np.clip(turbine_chance*loss/mean_loss, 0.0, 1.0)
+
+    mutated = rng.uniform(0, 1, mu) < population['pm1']
+    moving  = mutated[:,np.newaxis] & (rng.uniform(0, 1, (mu, no_of_turbines)) < turbine_chance)
+    new_coords, moved = propose_moves(coords, moving, population['Dm'],
+                                      settings['no_of_mutation_tries'], rng)
+    new_coords, moved = resolve_conflicts(coords, new_coords, moved)
+
+    old_aep    = aep.copy()
+    old_coords = coords.copy() if archive is not None else None
+
+    # retained individuals, one candidate per single moved turbine
+    for i in range(no_retained):
+        turbines = np.nonzero(moved[i])[0]
+        if turbines.shape[0] == 0:
+            continue
+        candidates = np.repeat(coords[i][np.newaxis], turbines.shape[0], axis=0)
+        candidates[np.arange(turbines.shape[0]),turbines] = new_coords[i,turbines]
+        moved[i] = False
+        found = best_improvement(evaluate, candidates, aep[i], settings, archive, coords[i].copy())
+        if found is not None:
+            best, aep[i], population['loss'][i] = found
+            coords[i] = candidates[best]
+            moved[i,turbines[best]] = True
+
+    # the others keep their moves blindly
+    changed = np.any(moved, axis=1)
+    changed[:no_retained] = False
+    if np.any(changed):
+        coords[changed] = new_coords[changed]
+        aep[changed], population['loss'][changed] = score(evaluate, coords[changed], settings)
+    if archive is not None and np.any(changed):
+        archive.append(coords[changed], aep[changed], 'mutation', old_coords[changed])
+
+    adapt_strategy(population, mutated, moved, aep > old_aep, settings)
+    return(population)
+
+
+def tournament_selection(aep, n_parents, c, rng):
+    """Indices of n_parents winners of tournaments among c random individuals"""
+    winners = np.zeros(n_parents, dtype=np.int64)
+    for epoch in range(n_parents):
+        candidates = rng.choice(aep.shape[0], c, replace=False)
+        winners[epoch] = candidates[np.argmax(aep[candidates])]
+    return(winners)
+
+
+def make_offspring(pool, n_offspring, settings, evaluate, rng, stats=None, surrogate=None,
+                   archive=None):
+    """
+    n_offspring children of the pool population. A child inherits the
+    mean mutation strategy of its two parents, or the initial strategy
+    when crossover fell back to a random layout. With a surrogate,
+    screen_factor times more children are bred and the surrogate picks
+    the ones to evaluate, then learns from their AEP. Evaluated children
+    are appended to a Layout_Archive.LayoutArchive if one is given, with
+    their first parent.
+    """
+    n_children = n_offspring
+    if surrogate is not None:
+        n_children *= settings['screen_factor']
+    offspring = new_population(np.zeros((n_children, settings['no_of_turbines'], 2)),
+                               np.zeros(n_children), settings)
+    parents   = np.full(offspring['coords'].shape, np.nan)
+    for epoch in range(n_children):
+        child, pair = crossover_operators[settings['crossover_mode']](pool['coords'], settings,
+                                                                      rng, stats)
+        offspring['coords'][epoch] = child
+        if pair is not None:
+            parents[epoch] = pool['coords'][pair[0]]
+            for k in ('pm1', 'pm2', 'Dm'):
+                offspring[k][epoch] = np.mean(pool[k][pair], axis=0)
+    if surrogate is not None:
+        keep      = surrogate.screen(offspring['coords'], n_offspring)
+        offspring = take(offspring, keep)
+        parents   = parents[keep]
+    offspring['aep'], offspring['loss'] = score(evaluate, offspring['coords'], settings)
+    if surrogate is not None:
+        surrogate.update(offspring['aep'])
+    if archive is not None:
+        archive.append(offspring['coords'], offspring['aep'], 'crossover', parents)
+    return(offspring)
+
+
+crossover_operators = {'retry': crossover, 'repair': crossover_by_repair}
+
+
+def run_ga(settings, evaluate, rng=None, initial=None, verbose=True, surrogate=None,
+           controller=None, archive=None):
+    """
+    Runs the GA.
+
+    :param
+        settings - dict overriding default_settings
+        evaluate - callable, (n_layouts, n_turbs, 2) or (n_turbs, 2) -> AEP,
+                   e.g. Batch_Evaluator.BatchEvaluator. Guided mutation
+                   needs its breakdown method too. A MultiFidelityEvaluator
+                   is promoted as the run goes.
+        rng      - seed or np.random.Generator
+        initial  - optional (coords, aep) starting population, or the
+                   'population' of an earlier run to continue it with
+                   its mutation strategies
+        verbose  - print progress every generation
+        surrogate - optional Surrogate.SurrogateScreen for the offspring
+        controller - optional Run_Controller.RunController. The run then
+                     also stops when its budget is spent, and its
+                     best_layout is the best so far at any time.
+        archive  - optional Layout_Archive.LayoutArchive receiving every
+                   scored layout with the error bound of its fidelity.
+                   Flushed, not closed, at the end.
+
+    :return
+        dict with 'best_layout', 'best_aep' (full fidelity),
+        'solution_values' (best AEP per generation), 'crossover_stats'
+        (see crossover), the final 'population' and with a surrogate
+        'surrogate_stats' (see SurrogateScreen.statistics), with a
+        controller 'controller_stats' (see RunController.statistics)
+    """
+    settings = dict(default_settings, **settings)
+    rng      = np.random.default_rng(rng)
+    if controller is not None:
+        evaluate = controller.wrap(evaluate)
+    fidelity = evaluate if hasattr(evaluate, 'update') else None
+    if settings['crossover_mode'] not in crossover_modes:
+        raise ValueError('Unknown crossover_mode %r' % settings['crossover_mode'])
+    if settings['mutation_mode'] not in mutation_modes:
+        raise ValueError('Unknown mutation_mode %r' % settings['mutation_mode'])
+    if settings['mutation_mode'] == 'guided' and not hasattr(evaluate, 'breakdown'):
+        raise ValueError('Guided mutation needs an evaluator with a breakdown method')
+
+    mu = settings['mu']
+    n_elite     = math.floor(mu - mu*settings['x'])
+    n_offspring = mu - n_elite
+    n_parents   = math.floor(settings['x']*mu)
+
+    if initial is None:
+        initial = initialize_generation(settings, evaluate, rng)
+    if isinstance(initial, dict):
+        population = {k: v.copy() for k, v in initial.items()}
+    else:
+        population = new_population(initial[0], initial[1], settings)
+    if settings['mutation_mode'] == 'guided' or settings['track_loss']:
+        population['aep'], population['loss'] = score(evaluate, population['coords'], settings)
+    if surrogate is not None:
+        surrogate.update(population['aep'], population['coords'])
+    if archive is not None:
+        archive.fidelity = fidelity.error_bound if fidelity is not None else 0.0
+        archive.append(population['coords'], population['aep'], 'initial')
+
+    solution_values = []
+    crossover_stats = {}
+    for iteration in range(settings['iterations']):
+        population = sort_population(population)
+        if archive is not None:
+            archive.generation = iteration + 1
+
+        # crossover for offsprings
+        winners    = tournament_selection(population['aep'], n_parents, settings['c'], rng)
+        offspring  = make_offspring(take(population, winners), n_offspring, settings, evaluate,
+                                    rng, crossover_stats, surrogate, archive)
+        population = concatenate(take(population, slice(0, n_elite)), offspring)
+
+        # mutation, best individuals first so they are the retained ones
+        population = mutation(sort_population(population), settings, evaluate, rng, archive)
+
+        best = np.argmax(population['aep'])
+        solution_values.append(float(population['aep'][best]))
+        if verbose:
+            print('iteration : ', iteration, ' best AEP =', population['aep'][best],
+                  ' mean Dm = %.1f' % np.mean(population['Dm']))
+
+        if fidelity is not None and fidelity.update(iteration, population['aep'][best]):
+            population['aep'], population['loss'] = score(fidelity, population['coords'], settings)
+            if surrogate is not None:
+                surrogate.reset()
+                surrogate.update(population['aep'], population['coords'])
+            if controller is not None:
+                controller.rescale()
+            if archive is not None:
+                archive.fidelity = fidelity.error_bound
+                archive.append(population['coords'], population['aep'], 'rescore')
+            if verbose:
+                print('promoted to fidelity level', fidelity.level,
+                      ', error bound %.4f GWh' % fidelity.error_bound)
+
+        if controller is not None:
+            stalled = controller.observe(population)
+            if controller.exhausted():
+                if verbose:
+                    print('budget spent after', iteration + 1, 'generations')
+                break
+            if stalled:
+                population = controller.restart(population, settings, evaluate, rng, archive)
+                if verbose:
+                    print('stagnated, restarted', len(controller.restarts), 'time(s)')
+
+    # final results are always scored against the full wind rose
+    if fidelity is not None:
+        population['aep'] = fidelity.full(population['coords'])
+        if archive is not None and archive.fidelity > 0:
+            archive.fidelity = 0.0
+            archive.append(population['coords'], population['aep'], 'rescore')
+    best = np.argmax(population['aep'])
+
+    result = {'best_layout'    : population['coords'][best].copy(),
+              'best_aep'       : float(population['aep'][best]),
+              'solution_values': solution_values,
+              'crossover_stats': crossover_stats,
+              'population'     : population}
+    if archive is not None:
+        archive.flush()
+    if controller is not None:
+        result['controller_stats'] = controller.statistics()
+    if surrogate is not None:
+        result['surrogate_stats'] = surrogate.statistics()
+        if verbose:
+            print('surrogate: %(evaluated)d exact evaluations instead of %(baseline)d, '
+                  '%(cost).1f spent on the surrogate, %(net_saved).1f net saved, '
+                  'rank correlation %(rank_correlation).3f' % result['surrogate_stats'])
+    return(result)
+
+
+def save_solution(layout, file_name='sol.csv'):
+    """Writes a layout as x,y columns, the format of final_sol.csv"""
+    pd.DataFrame(np.asarray(layout), columns=['x', 'y']).to_csv(file_name, index=False)
+
+
+if __name__ == "__main__":
+
+    from Batch_Evaluator import loadPowerCurve, binWindResourceData, preProcessing
+    from Wind_Fidelity   import MultiFidelityEvaluator
+
+    power_curve    = loadPowerCurve('power_curve.csv')
+    tables         = preProcessing(power_curve, turb_diam=100)
+    wind_inst_freq = binWindResourceData('wind_data_combined.csv')
+
+    evaluate = MultiFidelityEvaluator(wind_inst_freq, tables, tolerances=(0.05, 0.01),
+                                      schedule=[100, 300])
+    result   = run_ga({}, evaluate)
+
+    for i, value in enumerate(result['solution_values']):
+        print('Iteration ', i, ' AEP =', value)
+    print('Best AEP on the full wind rose:', result['best_aep'])
+    save_solution(result['best_layout'], 'sol.csv')
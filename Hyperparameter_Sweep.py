@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Hyperparameter_Sweep.py
+
+DESCRIPTION
+    Parallel GA settings sweep with successive halving and Hyperband
+    ============================================================
+
+    Replaces tuning by hand (see Ideas.txt). A search space maps GA
+    settings to a list of values to pick from, or to a (low, high) range
+    sampled uniformly (integers if both ends are):
+
+        space = {'x': [0.5, 0.7, 0.8, 0.9], 'c': (10, 40), 'Dm': (100, 800),
+                 'tries_retaining_parents': [20, 50], 'tries_changing_parents': [10, 20],
+                 'no_of_mutation_tries': [50, 100, 200]}
+
+    successive_halving runs every configuration for min_iterations
+    generations on a process pool, keeps the best 1/eta by best AEP so
+    far, continues those eta times longer, and so on. Survivors carry on
+    from their population and random state, so a configuration run to
+    N generations in rungs gives the same result as one run of N, and
+    every configuration has its own fixed seed. hyperband runs several
+    such brackets trading the number of configurations against their
+    starting budget. results_table collects everything as a DataFrame.
+"""
+
+# Module List
+import numpy  as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import math
+import time
+
+from GA_Engine import run_ga
+
+
+# evaluator of a worker process, set once by _init_worker
+_worker_evaluate = None
+
+
+def _init_worker(evaluate):
+    global _worker_evaluate
+    _worker_evaluate = evaluate
+
+
+def _advance(settings, iterations, rng, population):
+    """Runs a configuration for iterations more generations"""
+    start  = time.perf_counter()
+    result = run_ga(dict(settings, iterations=iterations), _worker_evaluate, rng=rng,
+                    initial=population, verbose=False)
+    return(result['best_aep'], result['population'], rng, time.perf_counter() - start)
+
+
+def sample_configurations(space, n_configs, rng):
+    """
+    n_configs random settings dicts from space, without duplicates when
+    the space allows it
+    """
+    configs, seen = [], set()
+    for attempt in range(100*n_configs):
+        config = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, (int, np.integer)) and isinstance(high, (int, np.integer)):
+                    config[name] = int(rng.integers(low, high + 1))
+                else:
+                    config[name] = float(rng.uniform(low, high))
+            else:
+                config[name] = values[int(rng.integers(len(values)))]
+        key = tuple(sorted(config.items()))
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+        if len(configs) == n_configs:
+            break
+    return(configs)
+
+
+def successive_halving(configs, evaluate, min_iterations=10, max_iterations=None, eta=3,
+                       base_settings=None, seed=0, max_workers=None, bracket=0,
+                       executor=None, verbose=True):
+    """
+    Successive halving over configurations.
+
+    :param
+        configs        - list of settings dicts
+        evaluate       - picklable evaluator, e.g. BatchEvaluator,
+                         sent once to every worker process
+        min_iterations - generations of the first rung
+        max_iterations - cap on the generations of any configuration
+        eta            - 1/eta of the configurations survive each rung,
+                         running eta times longer
+        base_settings  - settings shared by all configurations
+        seed           - configuration i is seeded with (seed, i)
+        executor       - process pool to reuse, one is made if None
+
+    :return
+        list of trial dicts: 'config', 'seed', 'bracket', 'rung' (last
+        rung reached), 'iterations', 'best_aep' (so far) and 'seconds'
+    """
+    base_settings = dict(base_settings or {})
+    trials = [{'config': config, 'seed': (seed, i), 'bracket': bracket, 'rung': 0,
+               'iterations': 0, 'best_aep': -np.inf, 'seconds': 0.0,
+               'rng': np.random.default_rng([seed, i]), 'population': None}
+              for i, config in enumerate(configs)]
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers, initializer=_init_worker,
+                                       initargs=(evaluate,))
+    try:
+        alive  = list(trials)
+        budget = min_iterations
+        rung   = 0
+        while alive:
+            futures = {executor.submit(_advance, dict(base_settings, **trial['config']),
+                                       budget - trial['iterations'], trial['rng'],
+                                       trial['population']): trial
+                       for trial in alive}
+            for future in as_completed(futures):
+                trial = futures[future]
+                trial['best_aep'], trial['population'], trial['rng'], seconds = future.result()
+                trial['seconds']   += seconds
+                trial['iterations'] = budget
+                trial['rung']       = rung
+
+            alive.sort(key=lambda trial: trial['best_aep'], reverse=True)
+            if verbose:
+                print('bracket', bracket, 'rung', rung, ':', len(alive), 'configurations at',
+                      budget, 'generations, best AEP = %.4f' % alive[0]['best_aep'])
+            if len(alive) == 1 or (max_iterations is not None and budget >= max_iterations):
+                break
+            alive  = alive[:max(1, len(alive)//eta)]
+            budget = budget*eta if max_iterations is None else min(budget*eta, max_iterations)
+            rung  += 1
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    for trial in trials:
+        del trial['rng'], trial['population']
+    return(trials)
+
+
+def hyperband(space, evaluate, max_iterations=81, eta=3, base_settings=None, seed=0,
+              max_workers=None, verbose=True):
+    """
+    Hyperband: successive halving brackets from many configurations on
+    a small budget to a few run for max_iterations from the start. Each
+    bracket samples its own configurations from space.
+
+    :return
+        list of trial dicts of all brackets, see successive_halving
+    """
+    rng    = np.random.default_rng(seed)
+    s_max  = int(math.floor(math.log(max_iterations)/math.log(eta) + 1e-9))
+    trials = []
+    with ProcessPoolExecutor(max_workers, initializer=_init_worker,
+                             initargs=(evaluate,)) as executor:
+        for s in range(s_max, -1, -1):
+            n_configs = int(math.ceil((s_max + 1)/(s + 1)*eta**s))
+            configs   = sample_configurations(space, n_configs, rng)
+            trials   += successive_halving(configs, evaluate,
+                                           min_iterations=max(1, max_iterations//eta**s),
+                                           max_iterations=max_iterations, eta=eta,
+                                           base_settings=base_settings, seed=seed + s,
+                                           bracket=s, executor=executor, verbose=verbose)
+    return(trials)
+
+
+def results_table(trials):
+    """Trials as a DataFrame, one column per swept setting, best first"""
+    rows = [dict(trial['config'], **{k: v for k, v in trial.items() if k != 'config'})
+            for trial in trials]
+    table = pd.DataFrame(rows)
+    table['seed'] = table['seed'].astype(str)
+    return(table.sort_values(['iterations', 'best_aep'], ascending=False, ignore_index=True))
+
+
+if __name__ == "__main__":
+
+    from Batch_Evaluator import loadPowerCurve, binWindResourceData, preProcessing, BatchEvaluator
+
+    power_curve    = loadPowerCurve('power_curve.csv')
+    tables         = preProcessing(power_curve, turb_diam=100)
+    wind_inst_freq = binWindResourceData('wind_data_combined.csv')
+
+    space = {'x'                      : [0.5, 0.6, 0.7, 0.8, 0.9],
+             'c'                      : (10, 40),
+             'Dm'                     : (100, 800),
+             'tries_retaining_parents': [20, 50, 100],
+             'tries_changing_parents' : [10, 20, 40],
+             'no_of_mutation_tries'   : [50, 100, 200]}
+
+    trials = hyperband(space, BatchEvaluator(wind_inst_freq, tables), max_iterations=81)
+    table  = results_table(trials)
+    table.to_csv('sweep_results.csv', index=False)
+    print(table.head(10).to_string())
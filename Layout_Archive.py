@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Layout_Archive.py
+
+DESCRIPTION
+    Append-only archive of every evaluated layout
+    ============================================================
+
+    One binary file: a 16 byte header (magic, number of turbines, record
+    size) followed by fixed width records
+
+        hash       uint64   of the quantized coordinates
+        parent     uint64   hash of the layout it was derived from, 0 if none
+        aep        float32  GWh
+        fidelity   float32  error bound (GWh) of the wind rose aep was
+                            computed on, 0 for the full rose
+        generation uint32
+        operator   uint8    index into operator_names
+        coords     uint16 (n_turbs, 2), 0..4000 m in 65536 steps (6 cm)
+
+    i.e. 229 bytes for a 50 turbine layout. LayoutArchive buffers appends
+    and hands full buffers to a writer thread, so the GA loop never waits
+    on the disk. readArchive memory-maps the records for analysis without
+    copying; bestLayouts and sampleLayouts turn them back into
+    coordinates, as a warm start pool (warmStartPopulation) or as
+    training data for Surrogate.SurrogateScreen. They only take records
+    scored on the full wind rose unless asked for coarser ones, so that
+    AEP of different fidelities are never ranked together.
+
+    Quantized coordinates can land a few cm on the wrong side of a
+    constraint, so layouts read back are meant to go through
+    GA_Engine.repair before being used as solutions.
+"""
+
+# Module List
+import numpy  as np
+
+import hashlib
+import os
+import queue
+import threading
+
+
+magic       = b'WFLOARC2'
+header_size = 16
+farm_size   = 4000.0
+quant_steps = 65535
+
+operator_names = ('initial', 'crossover', 'mutation', 'local_search', 'other', 'restart',
+                  'rescore')
+
+
+def recordDtype(n_turbs):
+    """Structured dtype of one record"""
+    return(np.dtype([('hash', '<u8'), ('parent', '<u8'), ('aep', '<f4'), ('fidelity', '<f4'),
+                     ('generation', '<u4'), ('operator', 'u1'),
+                     ('coords', '<u2', (n_turbs, 2))]))
+
+
+def quantize(coords):
+    coords = np.asarray(coords, dtype=np.float64)
+    return(np.clip(np.rint(coords*(quant_steps/farm_size)), 0, quant_steps).astype('<u2'))
+
+
+def dequantize(quantized):
+    return(quantized.astype(np.float64)*(farm_size/quant_steps))
+
+
+def layoutHash(quantized):
+    """(k,) uint64 hashes of (k, n_turbs, 2) quantized layouts, never 0"""
+    quantized = np.ascontiguousarray(quantized, dtype='<u2')
+    hashes = np.empty(quantized.shape[0], dtype=np.uint64)
+    for k in range(quantized.shape[0]):
+        digest    = hashlib.blake2b(quantized[k].tobytes(), digest_size=8).digest()
+        hashes[k] = int.from_bytes(digest, 'little') or 1
+    return(hashes)
+
+
+class LayoutArchive:
+    """
+    Appends scored layouts to file_name, created if missing.
+
+    :param
+        n_turbs        - turbines per layout, checked against an existing file
+        buffer_records - records collected before a write is issued
+        background     - write from a separate thread
+    """
+
+    def __init__(self, file_name, n_turbs=50, buffer_records=4096, background=True):
+        self.file_name      = file_name
+        self.dtype          = recordDtype(n_turbs)
+        self.buffer_records = buffer_records
+        self.generation     = 0
+        self.fidelity       = 0.0
+        self.appended       = 0
+
+        if os.path.exists(file_name) and os.path.getsize(file_name) > 0:
+            if readHeader(file_name) != (n_turbs, self.dtype.itemsize):
+                raise ValueError('%s holds layouts of a different size' % file_name)
+            self._file = open(file_name, 'ab')
+        else:
+            self._file = open(file_name, 'ab')
+            self._file.write(magic + np.array([n_turbs, self.dtype.itemsize], '<u4').tobytes())
+            self._file.flush()
+
+        self._buffer   = []
+        self._buffered = 0
+        self._queue    = None
+        if background:
+            self._queue  = queue.Queue()
+            self._thread = threading.Thread(target=self._writer, name='layout-archive',
+                                            daemon=True)
+            self._thread.start()
+
+    def _writer(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is not None:
+                self._file.write(chunk.tobytes())
+                self._file.flush()
+            self._queue.task_done()
+            if chunk is None:
+                break
+
+    def append(self, coords, aep, operator='other', parents=None, generation=None,
+               fidelity=None):
+        """
+        Queues (k, n_turbs, 2) layouts with their AEP. parents are the
+        (k, n_turbs, 2) layouts they came from, if any, NaN for the ones
+        without a parent. generation and fidelity default to the
+        archive's attributes of the same name.
+
+        :return
+            (k,) hashes of the layouts
+        """
+        coords  = np.asarray(coords).reshape(-1, *self.dtype['coords'].shape)
+        records = np.zeros(coords.shape[0], dtype=self.dtype)
+        records['coords']     = quantize(coords)
+        records['hash']       = layoutHash(records['coords'])
+        records['aep']        = np.asarray(aep, dtype=np.float32).reshape(-1)
+        records['fidelity']   = self.fidelity if fidelity is None else fidelity
+        records['generation'] = self.generation if generation is None else generation
+        records['operator']   = operator_names.index(operator)
+        if parents is not None:
+            parents = np.asarray(parents, dtype=np.float64).reshape(coords.shape)
+            known   = ~np.any(np.isnan(parents), axis=(1, 2))
+            records['parent'][known] = layoutHash(quantize(parents[known]))
+
+        self._buffer.append(records)
+        self._buffered += records.shape[0]
+        self.appended  += records.shape[0]
+        if self._buffered >= self.buffer_records:
+            self.flush(wait=False)
+        return(records['hash'])
+
+    def flush(self, wait=True):
+        """Writes buffered records; with wait, returns once they are on file"""
+        if self._buffer:
+            chunk = np.concatenate(self._buffer)
+            self._buffer, self._buffered = [], 0
+            if self._queue is None:
+                self._file.write(chunk.tobytes())
+                self._file.flush()
+            else:
+                self._queue.put(chunk)
+        if wait and self._queue is not None:
+            self._queue.join()
+
+    def close(self):
+        self.flush(wait=True)
+        if self._queue is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._queue = None
+        self._file.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def readHeader(file_name):
+    """(n_turbs, record size) of an archive file"""
+    with open(file_name, 'rb') as f:
+        header = f.read(header_size)
+    if len(header) < header_size or header[:8] != magic:
+        raise ValueError('%s is not a layout archive' % file_name)
+    n_turbs, itemsize = np.frombuffer(header[8:], dtype='<u4')
+    return(int(n_turbs), int(itemsize))
+
+
+def readArchive(file_name):
+    """
+    Read-only memory map of all complete records. A record still being
+    written at the end of the file is left out.
+    """
+    n_turbs, itemsize = readHeader(file_name)
+    n_records = (os.path.getsize(file_name) - header_size)//itemsize
+    if n_records == 0:
+        return(np.zeros(0, dtype=recordDtype(n_turbs)))
+    return(np.memmap(file_name, dtype=recordDtype(n_turbs), mode='r', offset=header_size,
+                     shape=(n_records,)))
+
+
+def bestLayouts(records, k, max_fidelity=0.0):
+    """
+    (coords, aep) of the k best distinct layouts among the records scored
+    with an error bound of at most max_fidelity GWh
+    """
+    records = records[records['fidelity'] <= max_fidelity]
+    order = np.argsort(-records['aep'], kind='stable')
+    hashes, first = np.unique(records['hash'][order], return_index=True)
+    best  = order[np.sort(first)[:k]]
+    return(dequantize(records['coords'][best]), records['aep'][best].astype(np.float64))
+
+
+def sampleLayouts(records, k, rng=None, max_fidelity=0.0):
+    """
+    (coords, aep) of k records drawn at random among those scored with an
+    error bound of at most max_fidelity GWh, e.g. surrogate training data
+    """
+    records = records[records['fidelity'] <= max_fidelity]
+    rng  = np.random.default_rng(rng)
+    pick = np.sort(rng.choice(records.shape[0], min(k, records.shape[0]), replace=False))
+    return(dequantize(records['coords'][pick]), records['aep'][pick].astype(np.float64))
+
+
+def warmStartPopulation(file_name, mu, evaluate):
+    """
+    (coords, aep) of the mu best distinct archived layouts scored on the
+    full wind rose, repaired and re-scored with evaluate. Usable as
+    GA_Engine.run_ga's initial.
+    """
+    from GA_Engine import repair
+
+    coords, aep = bestLayouts(readArchive(file_name), mu)
+    coords, feasible = repair(coords)
+    coords = coords[feasible]
+    return(coords, evaluate(coords))
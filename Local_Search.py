@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Local_Search.py
+
+DESCRIPTION
+    Single turbine AEP landscapes and best-of-K relocation local search
+    ============================================================
+
+    Batch_Evaluator.relocationAEP scores a layout with one turbine moved
+    to each of K positions for about the cost of K/n_turbs full
+    evaluations. On top of it:
+
+    - relocation_raster maps the farm AEP over a regular grid of
+      positions of one turbine.
+    - local_search visits the turbines in turn and moves each one to the
+      best feasible of K candidates (near its current spot, plus a few
+      anywhere in the farm or on a raster) whenever that raises the AEP.
+      Meant to polish the best layout of a GA run.
+"""
+
+# Module List
+import numpy  as np
+
+from Batch_Evaluator import relocationAEP, getAEPBatch
+from GA_Engine       import coord_min, coord_max, min_spacing, in_bounds
+
+
+def feasible_positions(layout, turbine, candidates):
+    """
+    True for candidate positions of turbine that are inside the farm and
+    clear of the other turbines of the layout
+    """
+    others = np.delete(np.asarray(layout, dtype=np.float64), turbine, axis=0)
+    dist2  = np.sum(np.square(candidates[:,np.newaxis] - others[np.newaxis]), axis=-1)
+    return(in_bounds(candidates) & (np.min(dist2, axis=1) >= min_spacing**2))
+
+
+def raster_positions(resolution):
+    """(n, 2) grid of positions spaced resolution m, strictly inside the farm"""
+    axis = np.arange(coord_min + resolution/2, coord_max, resolution)
+    grid_x, grid_y = np.meshgrid(axis, axis)
+    return(np.column_stack([grid_x.ravel(), grid_y.ravel()]))
+
+
+def relocation_raster(layout, turbine, wind_inst_freq, tables, resolution=50.0,
+                      memory_budget=None):
+    """
+    Farm AEP with one turbine placed on every point of a grid.
+
+    :return
+        (axis, aep, feasible) where axis holds the grid coordinates along
+        x and y, and aep, feasible are (len(axis), len(axis)) arrays
+        indexed [y, x]. Infeasible points are evaluated too.
+    """
+    positions = raster_positions(resolution)
+    n_axis    = int(round(np.sqrt(positions.shape[0])))
+    aep       = relocationAEP(layout, turbine, positions, wind_inst_freq, tables, memory_budget)
+    feasible  = feasible_positions(layout, turbine, positions)
+    return(positions[:n_axis,0], aep.reshape(n_axis, n_axis), feasible.reshape(n_axis, n_axis))
+
+
+def relocation_candidates(layout, turbine, n_candidates, radius, rng, global_fraction=0.25):
+    """
+    K candidate positions for turbine: uniform in a disc of radius around
+    its current position, and a global_fraction uniform over the farm
+    """
+    n_global = int(round(n_candidates*global_fraction))
+    n_local  = n_candidates - n_global
+
+    angle = rng.uniform(0, 2*np.pi, n_local)
+    dist  = radius*np.sqrt(rng.uniform(0, 1, n_local))
+    local = layout[turbine] + np.column_stack([dist*np.cos(angle), dist*np.sin(angle)])
+    far   = rng.uniform(coord_min, coord_max, (n_global, 2))
+    return(np.concatenate([local, far]))
+
+
+def local_search(layout, wind_inst_freq, tables, n_candidates=64, radius=400.0,
+                 max_passes=5, raster_resolution=None, min_gain=1e-6, rng=None,
+                 memory_budget=None, verbose=False):
+    """
+    Coordinate-wise relocation search. Each pass visits every turbine and
+    moves it to its best feasible candidate if that improves the AEP by
+    more than min_gain GWh. Stops after a pass without moves.
+
+    :param
+        layout            - (n_turbs, 2) feasible starting layout
+        wind_inst_freq    - (36,15) wind rose
+        tables            - EvalTables from Batch_Evaluator.preProcessing
+        n_candidates      - random candidates per turbine and pass
+        radius            - local candidates are drawn within radius (m)
+        raster_resolution - if set, the points of a raster of this
+                            resolution (m) are added to the candidates
+        rng               - seed or np.random.Generator
+
+    :return
+        (layout, aep, stats) where stats counts passes, moves, candidates
+        evaluated and 'full_eval_equivalents', the cost in full layout
+        evaluations (candidates/n_turbs, plus the final re-score)
+    """
+    rng     = np.random.default_rng(rng)
+    layout  = np.array(layout, dtype=np.float64)
+    n_turbs = layout.shape[0]
+    raster  = raster_positions(raster_resolution) if raster_resolution else None
+
+    aep = float(getAEPBatch(layout, wind_inst_freq, tables))
+    stats = {'passes': 0, 'moves': 0, 'candidates': 0, 'start_aep': aep}
+
+    for stats['passes'] in range(1, max_passes + 1):
+        moves = 0
+        for turbine in rng.permutation(n_turbs):
+            candidates = relocation_candidates(layout, turbine, n_candidates, radius, rng)
+            if raster is not None:
+                candidates = np.concatenate([candidates, raster])
+            candidates = candidates[feasible_positions(layout, turbine, candidates)]
+            if candidates.shape[0] == 0:
+                continue
+
+            candidate_aep = relocationAEP(layout, turbine, candidates, wind_inst_freq,
+                                          tables, memory_budget)
+            stats['candidates'] += candidates.shape[0]
+            best = np.argmax(candidate_aep)
+            if candidate_aep[best] > aep + min_gain:
+                layout[turbine] = candidates[best]
+                aep    = float(candidate_aep[best])
+                moves += 1
+
+        stats['moves'] += moves
+        if verbose:
+            print('pass', stats['passes'], ':', moves, 'moves, AEP = %.6f' % aep)
+        if moves == 0:
+            break
+
+    # re-score with the full evaluator
+    aep = float(getAEPBatch(layout, wind_inst_freq, tables))
+    stats['full_eval_equivalents'] = stats['candidates']/n_turbs + 2
+    return(layout, aep, stats)
+
+
+if __name__ == "__main__":
+
+    import pandas as pd
+    from Batch_Evaluator import loadPowerCurve, binWindResourceData, preProcessing
+
+    power_curve    = loadPowerCurve('power_curve.csv')
+    tables         = preProcessing(power_curve, turb_diam=100)
+    wind_inst_freq = binWindResourceData('wind_data_combined.csv')
+
+    layout = pd.read_csv('Arrangement_0.csv')[['x', 'y']].to_numpy(dtype = np.float64)
+    layout, aep, stats = local_search(layout, wind_inst_freq, tables, rng=0, verbose=True)
+    print('AEP %.6f -> %.6f GWh in %.0f full evaluation equivalents'
+          % (stats['start_aep'], aep, stats['full_eval_equivalents']))
@@ -279,10 +279,7 @@ import pandas as pd
 import math
 import random
 import matplotlib.pyplot as plt
-import winsound
 
-frequency = 1000  # Set Frequency To 2500 Hertz
-duration = 1000  # Set Duration To 1000 ms == 1 second
 
 no_of_turbines = 50
 mu = 50
@@ -548,7 +545,7 @@ while (iteration < iterations):
     if (iteration != 0):
         if (solution_values[iteration][1] < solution_values[iteration - 1][1]):
             print("ALERT ALERT ALERT ALERT")
-            winsound.Beep(frequency, duration)
+            print('\a', end='', flush=True)  # terminal bell, doesn't block
     iteration = iteration + 1
 
 for i in range(len(solution_values)):
@@ -282,10 +282,7 @@ import pandas as pd
 import math
 import random
 import matplotlib.pyplot as plt
-import winsound
 
-frequency = 1000  # Set Frequency To 2500 Hertz
-duration = 1000  # Set Duration To 1000 ms == 1 second
 
 no_of_turbines = 50
 mu = 50
@@ -439,7 +436,7 @@ def mutation(generation_to_be_mutated,no_retained):
 def clear_probabilities(generation_to_be_cleared):
     for i in range(mu):
         generation_to_be_cleared[i].pop()
-        #generation_to_be_cleared[i][0] = generation_to_be_cleared[i][0].drop(['pm2'],  axis=1)
+        generation_to_be_cleared[i][0] = generation_to_be_cleared[i][0].drop(['pm2'],  axis=1)
 
 def crossover(parents_for_crossovers):
     parents = random.sample(parents_for_crossovers, 2)
@@ -537,7 +534,7 @@ while (iteration < iterations):
     if (iteration != 0):
         if(solution_values[iteration][1] < solution_values[iteration-1][1]):
             print("ALERT ALERT ALERT ALERT")
-            winsound.Beep(frequency, duration)
+            print('\a', end='', flush=True)  # terminal bell, doesn't block
     iteration = iteration + 1
 
 for i in range(len(solution_values)):
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Operator_Scheduler.py
+
+DESCRIPTION
+    GA with operators scheduled by a bandit on AEP gain per second
+    ============================================================
+
+    Instead of running crossover and mutation in fixed proportions every
+    generation, run_adaptive_ga spends each generation on
+    pulls_per_generation operator applications chosen by OperatorBandit.
+    The arms are
+
+    - 'crossover'      : GA_Engine.make_offspring from tournament winners,
+                         the mu best of parents and children kept
+    - 'mutation'       : GA_Engine.mutation in random mode
+    - 'guided'         : GA_Engine.mutation in guided mode, turbines with
+                         large wake losses moved first
+    - 'local_search'   : one pass of Local_Search.local_search on a
+                         tournament winner, kept if it improved
+
+    The reward of a pull is the rise of the elite mean AEP (mean of the
+    best quarter of the population) it caused, and the bandit ranks arms
+    by discounted gain per wall second plus an upper confidence bonus,
+    so the budget drifts to whatever currently pays most and follows the
+    search as it moves from exploring to polishing. Every decision is
+    logged with the rates the bandit saw; write_log saves the log as csv.
+"""
+
+# Module List
+import numpy  as np
+import pandas as pd
+
+import math
+import time
+
+from GA_Engine    import default_settings, initialize_generation, new_population, score, take, \
+                         concatenate, sort_population, tournament_selection, make_offspring, \
+                         mutation
+from Local_Search import local_search
+
+
+operator_names = ('crossover', 'mutation', 'guided', 'local_search')
+
+
+class OperatorBandit:
+    """
+    Discounted UCB bandit over operators, rewarded in AEP gain per second.
+
+    :param
+        arms        - operator names
+        exploration - weight of the confidence bonus, relative to the best
+                      current rate
+        decay       - discount of past pulls per update, so old rates fade
+    """
+
+    def __init__(self, arms, exploration=0.5, decay=0.9):
+        self.arms        = list(arms)
+        self.exploration = exploration
+        self.decay       = decay
+        self.gain        = np.zeros(len(self.arms))
+        self.seconds     = np.zeros(len(self.arms))
+        self.weight      = np.zeros(len(self.arms))
+        self.pulls       = np.zeros(len(self.arms), dtype=np.int64)
+
+    def rates(self):
+        """Discounted AEP gain (GWh) per second of every arm"""
+        return(self.gain/np.maximum(self.seconds, 1e-12))
+
+    def choose(self):
+        """Name of the next operator, every arm being tried once first"""
+        untried = np.nonzero(self.pulls == 0)[0]
+        if untried.shape[0] > 0:
+            return(self.arms[untried[0]])
+
+        rates = self.rates()
+        scale = max(np.max(np.abs(rates)), 1e-12)
+        bonus = self.exploration*scale*np.sqrt(2*math.log(np.sum(self.weight))/self.weight)
+        return(self.arms[int(np.argmax(rates + bonus))])
+
+    def update(self, arm, gain, seconds):
+        self.gain    *= self.decay
+        self.seconds *= self.decay
+        self.weight  *= self.decay
+        k = self.arms.index(arm)
+        self.gain[k]    += gain
+        self.seconds[k] += seconds
+        self.weight[k]  += 1.0
+        self.pulls[k]   += 1
+
+
+def elite_mean(aep):
+    """Mean AEP of the best quarter of a population"""
+    n = max(1, aep.shape[0]//4)
+    return(float(np.mean(np.sort(aep)[-n:])))
+
+
+def _crossover(population, settings, evaluate, rng, context):
+    mu = settings['mu']
+    n_offspring = mu - math.floor(mu - mu*settings['x'])
+    n_parents   = math.floor(settings['x']*mu)
+    winners   = tournament_selection(population['aep'], n_parents, settings['c'], rng)
+    offspring = make_offspring(take(population, winners), n_offspring, settings, evaluate, rng,
+                               context['crossover_stats'])
+    return(take(sort_population(concatenate(population, offspring)), slice(0, mu)))
+
+
+def _mutation(population, settings, evaluate, rng, context):
+    return(mutation(sort_population(population), dict(settings, mutation_mode='random'),
+                    evaluate, rng))
+
+
+def _guided(population, settings, evaluate, rng, context):
+    return(mutation(sort_population(population), dict(settings, mutation_mode='guided'),
+                    evaluate, rng))
+
+
+def _local_search(population, settings, evaluate, rng, context):
+    # local_search returns the exact AEP of its layout, only the wake
+    # losses of a kept one need another pass
+    i = tournament_selection(population['aep'], 1, settings['c'], rng)[0]
+    layout, aep, stats = local_search(population['coords'][i], context['wind_inst_freq'],
+                                      context['tables'], n_candidates=context['n_candidates'],
+                                      max_passes=1, rng=rng)
+    if aep > population['aep'][i]:
+        population['coords'][i] = layout
+        population['aep'][i]    = aep
+        if settings['mutation_mode'] == 'guided' or settings['track_loss']:
+            population['loss'][i] = score(evaluate, layout[np.newaxis], settings)[1][0]
+    return(population)
+
+
+operators = {'crossover'   : _crossover,
+             'mutation'    : _mutation,
+             'guided'      : _guided,
+             'local_search': _local_search}
+
+
+def run_adaptive_ga(settings, evaluate, wind_inst_freq, tables, rng=None, initial=None,
+                    arms=operator_names, pulls_per_generation=4, exploration=0.5, decay=0.9,
+                    n_candidates=16, verbose=True):
+    """
+    Runs the GA with bandit scheduled operators.
+
+    :param
+        settings             - dict overriding GA_Engine.default_settings,
+                               'iterations' being the number of generations
+        evaluate             - callable, layouts -> AEP, at a fixed fidelity.
+                               The 'guided' arm needs its breakdown method.
+        wind_inst_freq       - (36,15) wind rose and
+        tables               - EvalTables for the local search arm, which
+                               scores its layouts itself. They must be
+                               those evaluate uses.
+        arms                 - operators to schedule, see operator_names
+        pulls_per_generation - operator applications per generation
+        n_candidates         - candidates per turbine of the local search
+
+    :return
+        dict like GA_Engine.run_ga plus 'operator_log', one dict per pull
+        with the generation, operator, gain (GWh), seconds and the rates
+        the bandit saw before choosing, and 'operator_stats', pulls, gain
+        and seconds per operator
+    """
+    settings = dict(default_settings, **settings)
+    rng      = np.random.default_rng(rng)
+    arms     = list(arms)
+    if 'guided' in arms:
+        if not hasattr(evaluate, 'breakdown'):
+            raise ValueError('The guided arm needs an evaluator with a breakdown method')
+        settings['track_loss'] = True
+    unknown = set(arms) - set(operators)
+    if unknown:
+        raise ValueError('Unknown operators ' + ', '.join(sorted(unknown)))
+
+    if initial is None:
+        initial = initialize_generation(settings, evaluate, rng)
+    population = new_population(initial[0], initial[1], settings)
+    if settings['mutation_mode'] == 'guided' or settings['track_loss']:
+        population['aep'], population['loss'] = score(evaluate, population['coords'], settings)
+
+    context = {'crossover_stats': {}, 'wind_inst_freq': wind_inst_freq, 'tables': tables,
+               'n_candidates': n_candidates}
+    bandit  = OperatorBandit(arms, exploration, decay)
+    totals  = {arm: {'pulls': 0, 'gain': 0.0, 'seconds': 0.0} for arm in arms}
+    operator_log    = []
+    solution_values = []
+    for iteration in range(settings['iterations']):
+        for pull in range(pulls_per_generation):
+            rates = dict(zip(arms, bandit.rates()))
+            arm   = bandit.choose()
+
+            before = elite_mean(population['aep'])
+            start  = time.perf_counter()
+            population = operators[arm](population, settings, evaluate, rng, context)
+            seconds = time.perf_counter() - start
+            gain    = elite_mean(population['aep']) - before
+
+            bandit.update(arm, gain, seconds)
+            totals[arm]['pulls']   += 1
+            totals[arm]['gain']    += gain
+            totals[arm]['seconds'] += seconds
+            operator_log.append(dict({'generation': iteration, 'operator': arm,
+                                      'gain': gain, 'seconds': seconds},
+                                     **{'rate_' + a: r for a, r in rates.items()}))
+
+        best = np.argmax(population['aep'])
+        solution_values.append(float(population['aep'][best]))
+        if verbose:
+            print('iteration : ', iteration, ' best AEP =', population['aep'][best],
+                  ' operators :', ' '.join(e['operator'] for e in operator_log[-pulls_per_generation:]))
+
+    best = np.argmax(population['aep'])
+    return({'best_layout'    : population['coords'][best].copy(),
+            'best_aep'       : float(population['aep'][best]),
+            'solution_values': solution_values,
+            'crossover_stats': context['crossover_stats'],
+            'population'     : population,
+            'operator_log'   : operator_log,
+            'operator_stats' : totals})
+
+
+def write_log(operator_log, file_name='operator_log.csv'):
+    """Writes the decisions of run_adaptive_ga as csv"""
+    pd.DataFrame(operator_log).to_csv(file_name, index=False)
+
+
+if __name__ == "__main__":
+
+    from Batch_Evaluator import loadPowerCurve, binWindResourceData, preProcessing, BatchEvaluator
+    from GA_Engine       import save_solution
+
+    power_curve    = loadPowerCurve('power_curve.csv')
+    tables         = preProcessing(power_curve, turb_diam=100)
+    wind_inst_freq = binWindResourceData('wind_data_combined.csv')
+
+    result = run_adaptive_ga({'iterations': 200}, BatchEvaluator(wind_inst_freq, tables),
+                             wind_inst_freq, tables)
+    for arm, total in result['operator_stats'].items():
+        print('%-12s %4d pulls, %8.3f GWh in %7.1f s' % (arm, total['pulls'], total['gain'],
+                                                         total['seconds']))
+    write_log(result['operator_log'])
+    save_solution(result['best_layout'], 'sol.csv')
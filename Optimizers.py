@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Optimizers.py
+
+DESCRIPTION
+    Ask/tell layout optimizers sharing one evaluation loop
+    ============================================================
+
+    An Optimizer proposes layouts with ask() -> (k, n_turbs, 2) and is
+    given their AEP with tell(layouts, aep). run_optimizer drives any of
+    them with the same evaluator (BatchEvaluator, MultiFidelityEvaluator,
+    ...), the same constraint handling (GA_Engine.repair of infeasible
+    proposals, the repaired layouts are what gets told; those repair
+    can't fix are not scored and told with an AEP of -inf, so they are
+    never the best) and the same
+    instrumentation: evaluations, full evaluation equivalents, CPU and
+    wall seconds and the best AEP over time, so strategies can be
+    compared on AEP per CPU hour.
+
+    Backends:
+
+    - CMAES, a (mu/mu_w, lambda) CMA-ES over the 2*n_turbs coordinates.
+      Each generation is one ask() and so one batched evaluation.
+    - SimulatedAnnealing, moving one turbine at a time. Each ask() offers
+      K positions of the same turbine; when the evaluator has a
+      relocation method they are scored for about K/n_turbs full
+      evaluations (Batch_Evaluator.relocationAEP).
+"""
+
+# Module List
+import numpy  as np
+
+import math
+import time
+
+from GA_Engine    import repair, feasible_layouts, generate_random_locations
+from Local_Search import relocation_candidates, feasible_positions
+
+
+class Optimizer:
+    """
+    Base class. Subclasses implement ask() and tell(); tell() should call
+    record() so best_layout and best_aep are kept up to date.
+
+    relocating is None, or (layout, turbine) when every layout of the
+    last ask() is layout with only turbine moved.
+    """
+
+    relocating = None
+
+    def __init__(self):
+        self.best_layout = None
+        self.best_aep    = -np.inf
+
+    def ask(self):
+        raise NotImplementedError
+
+    def tell(self, layouts, aep):
+        raise NotImplementedError
+
+    def record(self, layouts, aep):
+        """Keeps the best layout; -inf marks an infeasible one"""
+        best = int(np.argmax(aep))
+        if aep[best] > self.best_aep:
+            self.best_aep    = float(aep[best])
+            self.best_layout = np.array(layouts[best], dtype=np.float64)
+
+
+class CMAES(Optimizer):
+    """
+    CMA-ES maximizing AEP over flattened layouts.
+
+    :param
+        layout  - (n_turbs, 2) initial mean
+        sigma   - initial step size (m)
+        popsize - lambda, default 4 + 3 ln(2 n_turbs)
+        rng     - seed or np.random.Generator
+    """
+
+    def __init__(self, layout, sigma=100.0, popsize=None, rng=None):
+        super().__init__()
+        self.rng   = np.random.default_rng(rng)
+        self.shape = np.shape(layout)
+        self.mean  = np.array(layout, dtype=np.float64).ravel()
+        self.sigma = float(sigma)
+
+        N = self.mean.shape[0]
+        self.lam = popsize or 4 + int(3*math.log(N))
+        self.mu  = self.lam//2
+        weights  = math.log(self.mu + 0.5) - np.log(np.arange(1, self.mu + 1))
+        self.weights = weights/np.sum(weights)
+        self.mueff   = 1/np.sum(np.square(self.weights))
+
+        self.cc    = (4 + self.mueff/N)/(N + 4 + 2*self.mueff/N)
+        self.cs    = (self.mueff + 2)/(N + self.mueff + 5)
+        self.c1    = 2/((N + 1.3)**2 + self.mueff)
+        self.cmu   = min(1 - self.c1,
+                         2*(self.mueff - 2 + 1/self.mueff)/((N + 2)**2 + self.mueff))
+        self.damps = 1 + 2*max(0, math.sqrt((self.mueff - 1)/(N + 1)) - 1) + self.cs
+        self.chiN  = math.sqrt(N)*(1 - 1/(4*N) + 1/(21*N**2))
+
+        self.pc = np.zeros(N)
+        self.ps = np.zeros(N)
+        self.C  = np.eye(N)
+        self.B  = np.eye(N)
+        self.D  = np.ones(N)
+        self.generation = 0
+
+    def ask(self):
+        z = self.rng.standard_normal((self.lam, self.mean.shape[0]))
+        x = self.mean + self.sigma*(z*self.D) @ self.B.T
+        return(x.reshape((self.lam,) + self.shape))
+
+    def tell(self, layouts, aep):
+        self.record(layouts, aep)
+        N = self.mean.shape[0]
+        x = np.asarray(layouts, dtype=np.float64).reshape(len(aep), N)
+        selected = x[np.argsort(-np.asarray(aep), kind='stable')[:self.mu]]
+
+        old_mean  = self.mean
+        self.mean = self.weights @ selected
+        y_w       = (self.mean - old_mean)/self.sigma
+        self.generation += 1
+
+        # evolution paths, C^-1/2 y_w computed in the eigenbasis
+        invsqrt_y = self.B @ ((self.B.T @ y_w)/self.D)
+        self.ps   = (1 - self.cs)*self.ps + math.sqrt(self.cs*(2 - self.cs)*self.mueff)*invsqrt_y
+        norm_ps   = np.linalg.norm(self.ps)
+        hsig      = (norm_ps/math.sqrt(1 - (1 - self.cs)**(2*self.generation))/self.chiN
+                     < 1.4 + 2/(N + 1))
+        self.pc   = (1 - self.cc)*self.pc + hsig*math.sqrt(self.cc*(2 - self.cc)*self.mueff)*y_w
+
+        # covariance: rank one and rank mu updates
+        steps  = (selected - old_mean)/self.sigma
+        self.C = ((1 - self.c1 - self.cmu)*self.C
+                  + self.c1*(np.outer(self.pc, self.pc) + (1 - hsig)*self.cc*(2 - self.cc)*self.C)
+                  + self.cmu*(steps.T*self.weights) @ steps)
+        self.sigma *= math.exp(self.cs/self.damps*(norm_ps/self.chiN - 1))
+
+        # the decomposition is O(N^3), refresh it only every few generations
+        if self.generation % max(1, int(1/(10*N*(self.c1 + self.cmu)))) == 0:
+            self.C = np.triu(self.C) + np.triu(self.C, 1).T
+            eigenvalues, self.B = np.linalg.eigh(self.C)
+            self.D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+
+
+class SimulatedAnnealing(Optimizer):
+    """
+    Simulated annealing with single turbine moves.
+
+    Every step picks a turbine and K feasible positions for it (around
+    its position, and a few anywhere in the farm); the best of them is
+    accepted by the Metropolis rule at a temperature (GWh) decaying
+    geometrically from t_start to t_end over n_steps. The move radius
+    shrinks with the temperature down to min_radius, and is halved for
+    each turbine in a row that has no feasible position to offer. When
+    max_attempts turbines fail, ask() offers nothing: the step costs no
+    evaluation, accepts nothing and only lowers the temperature.
+
+    :param
+        layout       - (n_turbs, 2) feasible starting layout
+        n_candidates - K, positions offered per step
+        rng          - seed or np.random.Generator
+    """
+
+    def __init__(self, layout, n_candidates=16, radius=400.0, min_radius=25.0,
+                 t_start=0.5, t_end=1e-3, n_steps=5000, max_attempts=100, rng=None):
+        super().__init__()
+        self.max_attempts = max_attempts
+        self.stuck        = 0
+        self.rng          = np.random.default_rng(rng)
+        self.current      = np.array(layout, dtype=np.float64)
+        self.current_aep  = None
+        self.n_candidates = n_candidates
+        self.radius       = radius
+        self.min_radius   = min_radius
+        self.t_start      = t_start
+        self.t_end        = t_end
+        self.n_steps      = n_steps
+        self.step         = 0
+        self.accepted     = 0
+
+    @property
+    def temperature(self):
+        fraction = min(self.step/self.n_steps, 1.0)
+        return(self.t_start*(self.t_end/self.t_start)**fraction)
+
+    def ask(self):
+        # the starting layout has to be scored first
+        if self.current_aep is None:
+            self.relocating = None
+            return(self.current[np.newaxis])
+
+        radius = max(self.min_radius, self.radius*self.temperature/self.t_start)
+        for attempt in range(self.max_attempts):
+            turbine    = int(self.rng.integers(self.current.shape[0]))
+            candidates = relocation_candidates(self.current, turbine, self.n_candidates,
+                                               radius, self.rng)
+            candidates = candidates[feasible_positions(self.current, turbine, candidates)]
+            if candidates.shape[0] > 0:
+                break
+            radius = max(self.min_radius, radius/2)
+        else:
+            self.stuck     += 1
+            self.relocating = None
+            return(np.empty((0,) + self.current.shape))
+
+        self.relocating = (self.current, turbine)
+        layouts = np.repeat(self.current[np.newaxis], candidates.shape[0], axis=0)
+        layouts[:,turbine] = candidates
+        return(layouts)
+
+    def tell(self, layouts, aep):
+        if len(aep) == 0:
+            self.step += 1
+            return
+        self.record(layouts, aep)
+        best = int(np.argmax(aep))
+        if self.current_aep is None:
+            self.current_aep = float(aep[best])
+            return
+
+        delta = aep[best] - self.current_aep
+        if delta > 0 or self.rng.uniform() < math.exp(delta/self.temperature):
+            self.current     = np.array(layouts[best], dtype=np.float64)
+            self.current_aep = float(aep[best])
+            self.accepted   += 1
+        self.step += 1
+
+
+def evaluate_proposals(evaluate, layouts, relocating=None):
+    """
+    AEP of asked layouts and their cost in full layout evaluations. Single
+    turbine moves go through evaluate.relocation when there is one.
+    """
+    n_layouts, n_turbs = layouts.shape[:2]
+    if relocating is not None and hasattr(evaluate, 'relocation'):
+        layout, turbine = relocating
+        aep = evaluate.relocation(layout, turbine, layouts[:,turbine])
+        return(np.asarray(aep, dtype=np.float64), n_layouts/n_turbs)
+    return(np.asarray(evaluate(layouts), dtype=np.float64).reshape(n_layouts), n_layouts)
+
+
+def run_optimizer(optimizer, evaluate, max_evaluations=None, max_seconds=None,
+                  verbose=False, report_every=10, max_idle_steps=100):
+    """
+    Ask/tell loop shared by all optimizers.
+
+    :param
+        optimizer       - Optimizer instance
+        evaluate        - callable, layouts -> AEP, as for GA_Engine.run_ga.
+                          Its relocation method is used if present.
+        max_evaluations - stop after this many full evaluation equivalents
+        max_seconds     - stop after this much wall time
+        report_every    - steps between progress lines when verbose
+
+        The loop also ends after max_idle_steps steps in a row with no
+        feasible proposal, which spend no evaluations.
+
+    :return
+        dict with 'best_layout', 'best_aep', 'solution_values' (best AEP
+        per step), 'history' (rows of full evaluation equivalents, CPU
+        seconds, best AEP), 'evaluations' (layouts scored), 'repaired',
+        'rejected' (proposals still infeasible after repair, not scored),
+        'full_eval_equivalents', 'cpu_seconds' and 'wall_seconds'
+    """
+    if max_evaluations is None and max_seconds is None:
+        raise ValueError('Give max_evaluations and/or max_seconds')
+
+    solution_values = []
+    history     = []
+    evaluations = 0
+    repaired    = 0
+    rejected    = 0
+    idle        = 0
+    cost        = 0.0
+    step        = 0
+    cpu_start   = time.process_time()
+    wall_start  = time.perf_counter()
+    while True:
+        layouts = np.asarray(optimizer.ask(), dtype=np.float64)
+        relocating = optimizer.relocating
+
+        feasible = feasible_layouts(layouts)
+        if not np.all(feasible):
+            infeasible = ~feasible
+            layouts[infeasible], feasible[infeasible] = repair(layouts[infeasible])
+            repaired  += int(np.count_nonzero(infeasible))
+            rejected  += int(np.count_nonzero(~feasible))
+            relocating = None
+
+        aep = np.full(layouts.shape[0], -np.inf)
+        if np.any(feasible):
+            aep[feasible], step_cost = evaluate_proposals(evaluate, layouts[feasible], relocating)
+            evaluations += int(np.count_nonzero(feasible))
+            cost        += step_cost
+            idle         = 0
+        else:
+            idle        += 1
+        optimizer.tell(layouts, aep)
+        step        += 1
+
+        cpu_seconds = time.process_time() - cpu_start
+        solution_values.append(optimizer.best_aep)
+        history.append((cost, cpu_seconds, optimizer.best_aep))
+        if verbose and step % report_every == 0:
+            print('step : ', step, ' evaluations = %.0f' % cost, ' best AEP =', optimizer.best_aep)
+
+        if max_evaluations is not None and cost >= max_evaluations:
+            break
+        if max_seconds is not None and time.perf_counter() - wall_start >= max_seconds:
+            break
+        if idle >= max_idle_steps:
+            break
+
+    return({'best_layout'          : optimizer.best_layout,
+            'best_aep'             : optimizer.best_aep,
+            'solution_values'      : solution_values,
+            'history'              : np.array(history),
+            'evaluations'          : evaluations,
+            'repaired'             : repaired,
+            'rejected'             : rejected,
+            'full_eval_equivalents': cost,
+            'cpu_seconds'          : time.process_time() - cpu_start,
+            'wall_seconds'         : time.perf_counter() - wall_start})
+
+
+if __name__ == "__main__":
+
+    from Batch_Evaluator import loadPowerCurve, binWindResourceData, preProcessing, BatchEvaluator
+
+    power_curve    = loadPowerCurve('power_curve.csv')
+    tables         = preProcessing(power_curve, turb_diam=100)
+    wind_inst_freq = binWindResourceData('wind_data_combined.csv')
+    evaluate       = BatchEvaluator(wind_inst_freq, tables)
+
+    start = generate_random_locations(np.random.default_rng(0), 50)
+    for name, optimizer in [('CMA-ES', CMAES(start, rng=0)),
+                            ('SA',     SimulatedAnnealing(start, rng=0))]:
+        result = run_optimizer(optimizer, evaluate, max_evaluations=2000)
+        print('%-6s best AEP %.4f GWh, %.1f GWh per CPU hour of search'
+              % (name, result['best_aep'],
+                 (result['best_aep'] - result['solution_values'][0])/result['cpu_seconds']*3600))
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Run_Controller.py
+
+DESCRIPTION
+    Budgets, stagnation restarts and anytime results for GA runs
+    ============================================================
+
+    A RunController is handed to GA_Engine.run_ga and consulted once per
+    generation. It
+
+    - stops the run when a wall clock (max_seconds) or evaluation
+      (max_evaluations) budget is spent, so runs fit batch job limits,
+    - keeps an EliteArchive of the best distinct layouts seen,
+    - detects stagnation, no best AEP gain and no mean AEP gain of
+      min_improvement for stall_generations, and then restarts part of
+      the population: the worst restart_fraction is replaced by jittered
+      archive elites and fresh random layouts,
+    - always holds the best layout so far (best_layout, best_aep) and
+      optionally writes it to checkpoint_file whenever it improves, so a
+      killed job still leaves its best result behind. Under a
+      MultiFidelityEvaluator best_aep is always on the full wind rose:
+      a new best of the current level is re-scored with full() before
+      it is compared, and promotions keep it.
+
+    Evaluations are counted by wrapping the evaluator, see wrap().
+"""
+
+# Module List
+import numpy  as np
+
+import time
+
+from GA_Engine import generate_random_locations, repair, new_strategy, score, take, \
+                      concatenate, sort_population, save_solution
+
+
+class CountingEvaluator:
+    """
+    Evaluator proxy counting layouts scored by __call__, breakdown,
+    progressive and full, and single turbine relocations in full evaluation
+    equivalents. Every other attribute is the wrapped evaluator's, so
+    hasattr checks for optional methods still see what it offers.
+    """
+
+    def __init__(self, evaluate):
+        self.evaluate    = evaluate
+        self.evaluations = 0.0
+
+    def _count(self, layouts):
+        self.evaluations += 1 if np.ndim(layouts) == 2 else np.shape(layouts)[0]
+
+    def __call__(self, layouts):
+        self._count(layouts)
+        return(self.evaluate(layouts))
+
+    def __getattr__(self, name):
+        # only reached for attributes not set on the proxy itself
+        attribute = getattr(self.evaluate, name)
+        if name in ('breakdown', 'progressive', 'full'):
+            def counted(layouts, *args):
+                self._count(layouts)
+                return(attribute(layouts, *args))
+            return(counted)
+        if name == 'relocation':
+            def counted(layout, turbine, candidates):
+                self.evaluations += len(candidates)/np.shape(layout)[0]
+                return(attribute(layout, turbine, candidates))
+            return(counted)
+        return(attribute)
+
+
+class EliteArchive:
+    """
+    The size best layouts seen, no two within min_aep_gap GWh of each
+    other (a cheap stand-in for "different layout").
+    """
+
+    def __init__(self, size=20, min_aep_gap=1e-6):
+        self.size        = size
+        self.min_aep_gap = min_aep_gap
+        self.coords      = []
+        self.aep         = []
+
+    def __len__(self):
+        return(len(self.aep))
+
+    def add(self, coords, aep):
+        """Offers layouts (k, n_turbs, 2) with their AEP to the archive"""
+        for layout, value in zip(coords, aep):
+            value = float(value)
+            if any(abs(value - a) < self.min_aep_gap for a in self.aep):
+                continue
+            if len(self.aep) >= self.size and value <= min(self.aep):
+                continue
+            self.coords.append(np.array(layout, dtype=np.float64))
+            self.aep.append(value)
+            if len(self.aep) > self.size:
+                worst = int(np.argmin(self.aep))
+                del self.coords[worst], self.aep[worst]
+
+    def clear(self):
+        self.coords, self.aep = [], []
+
+
+class RunController:
+    """
+    :param
+        max_seconds       - wall clock budget of the run, None for none
+        max_evaluations   - layout evaluations budget, None for none
+        stall_generations - generations without progress before a restart
+        min_improvement   - AEP gain (GWh) that counts as progress
+        restart_fraction  - part of the population replaced on a restart
+        restart_sigma     - jitter (m) applied to archive elites reseeded
+        archive_size      - layouts kept in the elite archive
+        checkpoint_file   - csv the best layout is written to, or None
+    """
+
+    def __init__(self, max_seconds=None, max_evaluations=None, stall_generations=30,
+                 min_improvement=1e-3, restart_fraction=0.5, restart_sigma=100.0,
+                 archive_size=20, checkpoint_file=None):
+        self.max_seconds       = max_seconds
+        self.max_evaluations   = max_evaluations
+        self.stall_generations = stall_generations
+        self.min_improvement   = min_improvement
+        self.restart_fraction  = restart_fraction
+        self.restart_sigma     = restart_sigma
+        self.checkpoint_file   = checkpoint_file
+        self.archive           = EliteArchive(archive_size)
+        self.evaluator         = None
+        self.start             = time.perf_counter()
+        self.restarts          = []
+        self.best_layout       = None
+        self.best_aep          = -np.inf
+        self._level_best       = -np.inf
+        self._reset_stall()
+
+    def _reset_stall(self):
+        self._best_seen  = -np.inf
+        self._mean_seen  = -np.inf
+        self._best_since = 0
+        self._mean_since = 0
+
+    @property
+    def elapsed(self):
+        return(time.perf_counter() - self.start)
+
+    @property
+    def evaluations(self):
+        return(0.0 if self.evaluator is None else self.evaluator.evaluations)
+
+    def wrap(self, evaluate):
+        """Counting proxy of evaluate, to be used for the whole run"""
+        self.start     = time.perf_counter()
+        self.evaluator = CountingEvaluator(evaluate)
+        return(self.evaluator)
+
+    def exhausted(self):
+        """True once a budget is spent"""
+        return((self.max_seconds is not None and self.elapsed >= self.max_seconds)
+               or (self.max_evaluations is not None and self.evaluations >= self.max_evaluations))
+
+    def rescale(self):
+        """
+        Forgets the archive and the AEP history after the evaluator
+        changed fidelity, since values of different levels don't compare.
+        The best layout, scored on the full wind rose, is kept.
+        """
+        self.archive.clear()
+        self._level_best = -np.inf
+        self._reset_stall()
+
+    def _fullAEP(self, layout, aep):
+        """AEP of layout on the full wind rose, aep if already exact"""
+        evaluator = self.evaluator
+        if evaluator is None or not hasattr(evaluator, 'full') or evaluator.is_full:
+            return(aep)
+        return(float(evaluator.full(layout)))
+
+    def observe(self, population):
+        """
+        Records a generation. Returns True when the run has stagnated,
+        i.e. neither the best nor the mean AEP rose by min_improvement in
+        stall_generations generations.
+        """
+        aep  = population['aep']
+        best = int(np.argmax(aep))
+        self.archive.add(population['coords'], aep)
+        if aep[best] > self._level_best:
+            self._level_best = float(aep[best])
+            full_aep = self._fullAEP(population['coords'][best], self._level_best)
+            if full_aep > self.best_aep:
+                self.best_aep    = full_aep
+                self.best_layout = population['coords'][best].copy()
+                if self.checkpoint_file is not None:
+                    save_solution(self.best_layout, self.checkpoint_file)
+
+        mean = float(np.mean(aep))
+        if aep[best] > self._best_seen + self.min_improvement:
+            self._best_seen, self._best_since = float(aep[best]), 0
+        else:
+            self._best_since += 1
+        if mean > self._mean_seen + self.min_improvement:
+            self._mean_seen, self._mean_since = mean, 0
+        else:
+            self._mean_since += 1
+        return(min(self._best_since, self._mean_since) >= self.stall_generations)
+
+    def restart(self, population, settings, evaluate, rng, archive=None):
+        """
+        Partial restart: the worst restart_fraction of the population is
+        replaced, half by jittered archive elites and half by random
+        layouts, all with a fresh mutation strategy. Jittered elites that
+        repair can't make feasible are replaced by random layouts too.
+        The newcomers are appended to archive, a
+        Layout_Archive.LayoutArchive, if one is given.
+        """
+        population = sort_population(population)
+        mu = population['aep'].shape[0]
+        n_new  = int(round(mu*self.restart_fraction))
+        n_keep = mu - n_new
+        if n_new == 0:
+            return(population)
+
+        n_seeded = min(n_new//2, len(self.archive)) if len(self.archive) else 0
+        picks    = rng.integers(len(self.archive), size=n_seeded) if n_seeded else []
+        seeded   = [self.archive.coords[i] + rng.normal(0, self.restart_sigma,
+                                                       self.archive.coords[i].shape)
+                    for i in picks]
+        fresh    = [generate_random_locations(rng, settings['no_of_turbines'])
+                    for i in range(n_new - n_seeded)]
+        coords, feasible = repair(np.stack(seeded + fresh), rng=rng)
+        for i in np.nonzero(~feasible)[0]:
+            coords[i] = generate_random_locations(rng, settings['no_of_turbines'])
+
+        newcomers = {'coords': coords}
+        newcomers['aep'], newcomers['loss'] = score(evaluate, coords, settings)
+        if archive is not None:
+            archive.append(coords, newcomers['aep'], 'restart')
+        newcomers.update(new_strategy(settings, n_new))
+        self.restarts.append({'evaluations': self.evaluations, 'seconds': self.elapsed,
+                              'best_aep': self.best_aep, 'seeded': n_seeded})
+        self._reset_stall()
+        return(concatenate(take(population, slice(0, n_keep)), newcomers))
+
+    def statistics(self):
+        return({'seconds'    : self.elapsed,
+                'evaluations': self.evaluations,
+                'restarts'   : list(self.restarts),
+                'best_aep'   : self.best_aep})
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Smooth_Evaluator.py
+
+DESCRIPTION
+    Differentiable AEP and gradient based layout refinement
+    ============================================================
+
+    The exact model is piecewise constant in the turbine coordinates
+    (nearest speed power lookup, hard wake cone), so its gradient is zero
+    almost everywhere. smoothAEP evaluates a smoothed variant:
+
+    - power is linearly interpolated along the power curve,
+    - the wake cone |y| <= r + kw*x and the upstream test x > 0 are
+      replaced by cubic ramps of width edge (m), so the model is exact
+      for every pair of turbines not within edge/2 of a cone boundary,
+
+    and returns the AEP with its (n_turbs, 2) gradient from one forward
+    and one backward pass over all wind instances. As edge goes to 0 the
+    smoothed AEP tends to the exact one, up to the interpolation of the
+    power curve.
+
+    gradient_refinement polishes a layout with a projected L-BFGS on the
+    smoothed AEP, the projection clipping turbines into the farm and
+    pushing them apart (GA_Engine.repair). A step whose projection is
+    still infeasible is shortened like one that does not gain enough.
+    Every accepted iterate is re-scored with the exact model and the best
+    exact layout is returned, so the refinement never returns a worse
+    layout than it was given.
+
+    A wide edge gives long range gradients but a model about 2 GWh away
+    from the exact one on a 50 turbine farm, whose ascent stalls short of
+    an exact gain. The refinement therefore anneals edge (10, 1, 0.1 m by
+    default), restarting the ascent from the best exact layout at each
+    width, so the last ascent follows a model within a few hundredths of
+    a GWh of the exact AEP.
+"""
+
+# Module List
+import numpy  as np
+
+from Batch_Evaluator import kw, getAEPBatch
+from GA_Engine       import coord_min, coord_max, repair, repair_margin
+
+
+def _smoothStep(z, edge):
+    """
+    Cubic step rising from 0 at z = -edge/2 to 1 at z = edge/2, and its
+    derivative. Unlike a logistic step it has no tails, which the square
+    root of the deficit sum would amplify.
+    """
+    t = np.clip(z/edge + 0.5, 0.0, 1.0)
+    return(t*t*(3.0 - 2.0*t), 6.0*t*(1.0 - t)/edge)
+
+
+def smoothAEP(layout, wind_inst_freq, tables, edge=10.0, return_grad=True):
+    """
+    Smoothed AEP (GWh) of one layout and its gradient.
+
+    :param
+        layout         - (n_turbs, 2) turbine coordinates
+        wind_inst_freq - wind rose matching tables, (36,15) or flat
+        tables         - EvalTables from Batch_Evaluator.preProcessing
+        edge           - width (m) of the soft wake cone edges
+
+    :return
+        (aep, grad) with grad (n_turbs, 2) in GWh/m, or aep alone if
+        return_grad is False
+    """
+    xy       = np.asarray(layout, dtype=np.float64)
+    freq     = np.asarray(wind_inst_freq, dtype=np.float64).ravel()
+    turb_rad = float(tables.turb_rad)
+    speeds   = tables.power_curve[:,0].astype(np.float64)
+    power    = tables.power_curve[:,2].astype(np.float64)
+    cos_dir  = tables.cos_dir.astype(np.float64)[:,np.newaxis]
+    sin_dir  = tables.sin_dir.astype(np.float64)[:,np.newaxis]
+    wind_sped = tables.wind_sped.astype(np.float64)[:,np.newaxis]
+    wake_coef = tables.wake_coef.astype(np.float64)[:,np.newaxis]
+
+    # downwind(x) & crosswind(y) coordinates, (n_inst, n_turbs)
+    rotate_x = xy[:,0]*cos_dir - xy[:,1]*sin_dir
+    rotate_y = xy[:,0]*sin_dir + xy[:,1]*cos_dir
+
+    # offsets of target i from source j, (n_inst, n_turbs, n_turbs)
+    x_dist = rotate_x[:,:,np.newaxis] - rotate_x[:,np.newaxis,:]
+    y_dist = rotate_y[:,:,np.newaxis] - rotate_y[:,np.newaxis,:]
+    upwind   = x_dist > 0
+    wake_rad = turb_rad + kw*np.where(upwind, x_dist, 0.0)
+    gate_x, d_gate_x = _smoothStep(x_dist, edge)
+    gate_y, d_gate_y = _smoothStep(wake_rad - np.abs(y_dist), edge)
+    ratio    = np.square(np.square(turb_rad/wake_rad))
+    n_turbs  = xy.shape[0]
+    gate_x[:,np.arange(n_turbs),np.arange(n_turbs)] = 0.0
+
+    # sum of squares of the deficits and effective speeds, (n_inst, n_turbs)
+    deficit_sq    = np.sum(gate_x*gate_y*ratio, axis=-1) + 1e-12
+    deficit       = np.sqrt(deficit_sq)
+    wind_sped_eff = wind_sped*(1.0 - wake_coef*deficit)
+
+    turb_pwr = np.interp(wind_sped_eff, speeds, power)
+    scale    = 8760.0/1e3*freq[:,np.newaxis]
+    aep      = float(np.sum(scale*turb_pwr))
+    if not return_grad:
+        return(aep)
+
+    # backward pass
+    segment = np.clip(np.searchsorted(speeds, wind_sped_eff, side='right') - 1,
+                      0, speeds.shape[0] - 2)
+    slope   = (power[segment+1] - power[segment])/(speeds[segment+1] - speeds[segment])
+    slope[(wind_sped_eff < speeds[0]) | (wind_sped_eff > speeds[-1])] = 0.0
+    grad_deficit_sq = -scale*slope*wind_sped*wake_coef/(2.0*deficit)
+
+    d_rad    = kw*upwind
+    grad_x_dist = (d_gate_x*gate_y*ratio
+                   + gate_x*ratio*d_gate_y*d_rad
+                   - gate_x*gate_y*4.0*ratio/wake_rad*d_rad)
+    grad_y_dist = -gate_x*ratio*d_gate_y*np.sign(y_dist)
+    grad_x_dist *= grad_deficit_sq[:,:,np.newaxis]
+    grad_y_dist *= grad_deficit_sq[:,:,np.newaxis]
+
+    grad_rotate_x = np.sum(grad_x_dist, axis=2) - np.sum(grad_x_dist, axis=1)
+    grad_rotate_y = np.sum(grad_y_dist, axis=2) - np.sum(grad_y_dist, axis=1)
+    grad = np.column_stack([np.sum(grad_rotate_x*cos_dir + grad_rotate_y*sin_dir, axis=0),
+                            np.sum(grad_rotate_y*cos_dir - grad_rotate_x*sin_dir, axis=0)])
+    return(aep, grad)
+
+
+def checkGradient(layout, wind_inst_freq, tables, edge=10.0, h=1e-3, n_coords=10, rng=None):
+    """
+    Compares the smoothAEP gradient with central finite differences on
+    n_coords random coordinates.
+
+    :return
+        dict with 'analytic', 'numeric' (n_coords,) and 'max_abs_error',
+        'max_rel_error'
+    """
+    rng    = np.random.default_rng(rng)
+    layout = np.array(layout, dtype=np.float64)
+    aep, grad = smoothAEP(layout, wind_inst_freq, tables, edge)
+
+    picks   = rng.choice(layout.size, n_coords, replace=False)
+    numeric = np.empty(n_coords)
+    for k, flat in enumerate(picks):
+        index = np.unravel_index(flat, layout.shape)
+        moved = layout.copy()
+        moved[index] += h
+        plus  = smoothAEP(moved, wind_inst_freq, tables, edge, return_grad=False)
+        moved[index] -= 2*h
+        minus = smoothAEP(moved, wind_inst_freq, tables, edge, return_grad=False)
+        numeric[k] = (plus - minus)/(2*h)
+
+    analytic = grad.ravel()[picks]
+    error    = np.abs(analytic - numeric)
+    return({'analytic'     : analytic,
+            'numeric'      : numeric,
+            'max_abs_error': float(np.max(error)),
+            'max_rel_error': float(np.max(error/np.maximum(np.abs(numeric), 1e-12)))})
+
+
+def project(layout):
+    """
+    Nearest feasible layout, as found by GA_Engine.repair.
+
+    :return
+        (layout, feasible), feasible False when repair gave up
+    """
+    layout = np.clip(layout, coord_min + repair_margin, coord_max - repair_margin)
+    layout, feasible = repair(layout)
+    return(layout, bool(feasible))
+
+
+def gradient_refinement(layout, wind_inst_freq, tables, edges=(10.0, 1.0, 0.1), max_iterations=50,
+                        memory=10, max_step=50.0, min_gain=1e-6, patience=5, verbose=False):
+    """
+    Projected L-BFGS ascent of smoothAEP from a feasible layout, annealing
+    the soft edge width.
+
+    :param
+        layout         - (n_turbs, 2) feasible starting layout
+        wind_inst_freq - (36,15) wind rose
+        tables         - EvalTables from Batch_Evaluator.preProcessing
+        edges          - decreasing soft edge widths (m) of smoothAEP, one
+                         ascent each, started from the best exact layout
+        max_iterations - iterations of each ascent
+        memory         - number of (step, gradient change) pairs kept
+        max_step       - largest move (m) of any turbine in one iteration
+        min_gain       - end an ascent when the smoothed AEP gains less (GWh)
+        patience       - end an ascent after this many iterations without a
+                         better exact AEP
+
+    :return
+        (layout, aep, stats) with the best layout by exact AEP (GWh) and
+        stats counting 'iterations', 'evaluations' (forward/backward
+        passes), 'exact_evaluations', 'infeasible' (projected trials
+        rejected), the exact 'start_aep', 'smoothing_gap' (smoothed minus
+        exact AEP where each ascent starts, one per edge width) and
+        'improved'
+    """
+    best_layout = np.array(layout, dtype=np.float64)
+    best_aep    = float(getAEPBatch(best_layout, wind_inst_freq, tables))
+    stats = {'iterations': 0, 'evaluations': 0, 'exact_evaluations': 1, 'infeasible': 0,
+             'start_aep': best_aep, 'smoothing_gap': []}
+
+    for edge in edges:
+        # minimize f = -smoothed AEP
+        layout = best_layout.copy()
+        f, g = smoothAEP(layout, wind_inst_freq, tables, edge)
+        stats['evaluations'] += 1
+        stats['smoothing_gap'].append(f - best_aep)
+        f, g = -f, -g
+        stale = 0
+        steps, changes = [], []
+        for iteration in range(max_iterations):
+            stats['iterations'] += 1
+
+            # two loop recursion for the L-BFGS direction
+            q = g.copy()
+            alphas = []
+            for s, y in zip(reversed(steps), reversed(changes)):
+                alpha = np.vdot(s, q)/np.vdot(y, s)
+                q    -= alpha*y
+                alphas.append(alpha)
+            if steps:
+                q *= np.vdot(steps[-1], changes[-1])/np.vdot(changes[-1], changes[-1])
+            for (s, y), alpha in zip(zip(steps, changes), reversed(alphas)):
+                q += (alpha - np.vdot(y, q)/np.vdot(y, s))*s
+            direction = -q
+            if np.vdot(direction, g) >= 0:
+                direction = -g
+                steps, changes = [], []
+
+            # backtracking on the projected step, no turbine moving more than max_step
+            length = np.max(np.sqrt(np.sum(np.square(direction), axis=1)))
+            t = min(1.0, max_step/length) if length > 0 else 0.0
+            accepted = False
+            while t*length > 1e-3:
+                trial, feasible = project(layout + t*direction)
+                if not feasible:
+                    stats['infeasible'] += 1
+                    t *= 0.5
+                    continue
+                f_trial, g_trial = smoothAEP(trial, wind_inst_freq, tables, edge)
+                f_trial, g_trial = -f_trial, -g_trial
+                stats['evaluations'] += 1
+                if f_trial <= f + 1e-4*np.vdot(g, trial - layout):
+                    accepted = True
+                    break
+                t *= 0.5
+            if not accepted:
+                break
+
+            s, y = trial - layout, g_trial - g
+            if np.vdot(s, y) > 1e-12:
+                steps.append(s)
+                changes.append(y)
+                if len(steps) > memory:
+                    del steps[0], changes[0]
+            gain = f - f_trial
+            layout, f, g = trial, f_trial, g_trial
+
+            exact = float(getAEPBatch(layout, wind_inst_freq, tables))
+            stats['exact_evaluations'] += 1
+            if exact > best_aep:
+                best_layout, best_aep = layout.copy(), exact
+                stale = 0
+            else:
+                stale += 1
+            if verbose:
+                print('edge %g m, iteration %d : smoothed AEP = %.6f, exact AEP = %.6f'
+                      % (edge, iteration + 1, -f, exact))
+            if gain < min_gain or stale >= patience:
+                break
+
+    stats['improved'] = best_aep > stats['start_aep']
+    return(best_layout, best_aep, stats)
+
+
+if __name__ == "__main__":
+
+    import pandas as pd
+    from Batch_Evaluator import loadPowerCurve, binWindResourceData, preProcessing
+
+    power_curve    = loadPowerCurve('power_curve.csv')
+    tables         = preProcessing(power_curve, turb_diam=100)
+    wind_inst_freq = binWindResourceData('wind_data_combined.csv')
+
+    layout = pd.read_csv('Arrangement_0.csv')[['x', 'y']].to_numpy(dtype = np.float64)
+    check  = checkGradient(layout, wind_inst_freq, tables, rng=0)
+    print('gradient check, max relative error: %.2e' % check['max_rel_error'])
+
+    layout, aep, stats = gradient_refinement(layout, wind_inst_freq, tables, verbose=True)
+    print('AEP %.6f -> %.6f GWh in %d smoothed evaluations'
+          % (stats['start_aep'], aep, stats['evaluations']))
+    print('smoothed minus exact AEP per edge width:', np.round(stats['smoothing_gap'], 3),
+          'GWh, improved:', stats['improved'])
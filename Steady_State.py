@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Steady_State.py
+
+DESCRIPTION
+    Steady state, asynchronous variant of the GA of GA_Engine.py
+    ============================================================
+
+    There are no generations. The coordinator keeps the population in a
+    list ordered by AEP (bisect insertion) and keeps every worker busy:
+    as soon as one offspring has been scored it is inserted in place of
+    the worst individual if it beats it, and a new offspring, bred from
+    the current population, is submitted. Nothing waits for the slowest
+    evaluation of a generation and the population is never re-sorted.
+
+    Offspring are bred with the GA_Engine operators: tournament selection,
+    crossover (settings['crossover_mode']) and a blind self adaptive
+    jitter with the mean strategy of the parents.
+"""
+
+# Module List
+import numpy  as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import bisect
+import math
+import os
+import time
+
+from GA_Engine import default_settings, crossover_operators, new_strategy, new_population, \
+                      generate_random_locations, initialize_generation, propose_moves, \
+                      resolve_conflicts, score, take
+
+
+# evaluator of a worker process, set once by _init_worker
+_worker_evaluate = None
+
+
+def _init_worker(evaluate):
+    global _worker_evaluate
+    _worker_evaluate = evaluate
+
+
+def _score_in_worker(child, settings):
+    """score() of one child with the worker's own evaluator"""
+    aep, loss = score(_worker_evaluate, child[np.newaxis], settings)
+    return(aep[0], loss[0])
+
+
+def _score_in_thread(evaluate, child, settings):
+    aep, loss = score(evaluate, child[np.newaxis], settings)
+    return(aep[0], loss[0])
+
+
+class OrderedPopulation:
+    """
+    Individuals kept in ascending AEP order, the worst first. Each member
+    is a dict like GA_Engine.take(population, i).
+    """
+
+    def __init__(self, population):
+        order        = np.argsort(population['aep'], kind='stable')
+        self.keys    = [float(population['aep'][i]) for i in order]
+        self.members = [take(population, i) for i in order]
+
+    def __len__(self):
+        return(len(self.keys))
+
+    def best(self):
+        return(self.members[-1])
+
+    def tournament(self, c, rng):
+        """Winner of a tournament among c random members: the highest index"""
+        return(self.members[int(np.max(rng.choice(len(self.keys), c, replace=False)))])
+
+    def insert(self, member):
+        """Replaces the worst member if member beats it. Returns True if inserted."""
+        aep = float(member['aep'])
+        if aep <= self.keys[0]:
+            return(False)
+        del self.keys[0], self.members[0]
+        i = bisect.bisect(self.keys, aep)
+        self.keys.insert(i, aep)
+        self.members.insert(i, member)
+        return(True)
+
+    def as_population(self):
+        """Population dict, best first"""
+        members = self.members[::-1]
+        return({k: np.stack([m[k] for m in members]) for k in members[0]})
+
+
+def breed(population, settings, rng):
+    """
+    One unevaluated offspring: crossover of two tournament winners, then
+    every turbine jittered with the chances and step size inherited from
+    the parents. Returns a member dict without 'aep'.
+    """
+    parents = [population.tournament(settings['c'], rng) for epoch in range(2)]
+    pool    = np.stack([p['coords'] for p in parents])
+    child, pair = crossover_operators[settings['crossover_mode']](pool, settings, rng)
+
+    member = {k: v[0] for k, v in new_strategy(settings, 1).items()}
+    if pair is not None:
+        for k in member:
+            member[k] = np.mean([p[k] for p in parents], axis=0)
+
+    if rng.uniform() < member['pm1']:
+        moving = rng.uniform(0, 1, child.shape[0]) < member['pm2']
+        new_coords, moved = propose_moves(child[np.newaxis], moving[np.newaxis],
+                                          np.array([member['Dm']]),
+                                          settings['no_of_mutation_tries'], rng)
+        child = resolve_conflicts(child[np.newaxis], new_coords, moved)[0][0]
+
+    member['coords'] = child
+    return(member)
+
+
+def run_steady_state(settings, evaluate, rng=None, initial=None, n_workers=None,
+                     backend='process', max_evaluations=None, verbose=True):
+    """
+    Runs the steady state GA.
+
+    :param
+        settings        - dict overriding GA_Engine.default_settings
+        evaluate        - picklable evaluator, as for GA_Engine.run_ga
+        rng             - seed or np.random.Generator
+        initial         - optional (coords, aep) starting population
+        n_workers       - concurrent evaluations, default os.cpu_count()
+        backend         - 'process' (evaluator sent to every worker once)
+                          or 'thread' (for evaluators releasing the GIL)
+        max_evaluations - offspring to score. By default as many as
+                          settings['iterations'] generations of run_ga.
+
+    :return
+        dict like GA_Engine.run_ga, solution_values holding the best AEP
+        after every generation's worth of evaluations, plus 'evaluations',
+        'inserted' and 'throughput' (evaluations per second)
+    """
+    settings  = dict(default_settings, **settings)
+    rng       = np.random.default_rng(rng)
+    n_workers = n_workers or os.cpu_count() or 1
+
+    mu = settings['mu']
+    per_generation = mu - math.floor(mu - mu*settings['x'])
+    if max_evaluations is None:
+        max_evaluations = settings['iterations']*per_generation
+
+    # the initial AEP are reused, only the losses need a breakdown pass
+    needs_loss = settings['mutation_mode'] == 'guided' or settings['track_loss']
+    if initial is None and needs_loss:
+        coords = np.stack([generate_random_locations(rng, settings['no_of_turbines'])
+                           for i in range(mu)])
+        aep, loss  = score(evaluate, coords, settings)
+        population = new_population(coords, aep, settings, loss)
+    else:
+        if initial is None:
+            initial = initialize_generation(settings, evaluate, rng)
+        population = new_population(initial[0], initial[1], settings)
+        if needs_loss:
+            population['aep'], population['loss'] = score(evaluate, population['coords'], settings)
+    population = OrderedPopulation(population)
+
+    if backend == 'process':
+        executor = ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(evaluate,))
+        submit   = lambda child: executor.submit(_score_in_worker, child, settings)
+    elif backend == 'thread':
+        executor = ThreadPoolExecutor(n_workers)
+        submit   = lambda child: executor.submit(_score_in_thread, evaluate, child, settings)
+    else:
+        raise ValueError('Unknown backend %r' % backend)
+
+    solution_values = []
+    in_flight   = {}
+    submitted   = 0
+    evaluations = 0
+    inserted    = 0
+    start       = time.perf_counter()
+    with executor:
+        while evaluations < max_evaluations:
+            # keep every worker busy, with one spare task each
+            while len(in_flight) < 2*n_workers and submitted < max_evaluations:
+                member = breed(population, settings, rng)
+                in_flight[submit(member['coords'])] = member
+                submitted += 1
+
+            done, pending = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                member = in_flight.pop(future)
+                member['aep'], member['loss'] = future.result()
+                inserted    += population.insert(member)
+                evaluations += 1
+                if evaluations % per_generation == 0:
+                    solution_values.append(population.keys[-1])
+                    if verbose:
+                        print('evaluations : ', evaluations, ' best AEP =', population.keys[-1])
+    elapsed = time.perf_counter() - start
+
+    best = population.best()
+    return({'best_layout'    : best['coords'].copy(),
+            'best_aep'       : float(best['aep']),
+            'solution_values': solution_values,
+            'population'     : population.as_population(),
+            'evaluations'    : evaluations,
+            'inserted'       : inserted,
+            'throughput'     : evaluations/elapsed if elapsed > 0 else float('inf')})
+
+
+if __name__ == "__main__":
+
+    from Batch_Evaluator import loadPowerCurve, binWindResourceData, preProcessing, BatchEvaluator
+    from GA_Engine       import save_solution
+
+    power_curve    = loadPowerCurve('power_curve.csv')
+    tables         = preProcessing(power_curve, turb_diam=100)
+    wind_inst_freq = binWindResourceData('wind_data_combined.csv')
+
+    result = run_steady_state({'iterations': 200}, BatchEvaluator(wind_inst_freq, tables))
+    print('Best AEP:', result['best_aep'], ' evaluations/s: %.1f' % result['throughput'])
+    save_solution(result['best_layout'], 'sol.csv')
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Surrogate.py
+
+DESCRIPTION
+    Cheap AEP surrogate for screening GA offspring
+    ============================================================
+
+    SurrogateScreen predicts the AEP of a layout from two cheap features:
+
+    - the exact AEP over the n_instances most energetic wind instances
+      (probability x Batch_Evaluator.upperBoundPower), and
+    - a pairwise wake overlap index: the (r/(r + kw*x))**4 wake terms of
+      every pair of turbines, summed over the 36 directions weighted by
+      the energy each direction can carry.
+
+    The prediction is a linear regression on them, refitted online from
+    the exact AEP of every individual that gets evaluated, older samples
+    fading by a forgetting factor. Used by GA_Engine.make_offspring, which
+    breeds screen_factor times more children than it needs and only sends
+    the best predicted ones to the exact evaluator.
+
+    The out-of-sample predictions of evaluated individuals are kept to
+    report the Spearman rank correlation of surrogate and exact AEP.
+    statistics compares the exact evaluations spent with those of picking
+    the same children by exact AEP, net of the surrogate's own work: the
+    features of every screened layout and of every layout it is refitted
+    on cost about 60 of the 540 wind instances each.
+"""
+
+# Module List
+import numpy  as np
+from collections import deque
+
+from Batch_Evaluator import n_slices_drct, n_slices_sped, subsetTables, upperBoundPower, \
+                            getAEPBatch, _wakeTerms
+
+
+def rankCorrelation(a, b):
+    """Spearman rank correlation of two samples (ties not averaged)"""
+    rank_a = np.argsort(np.argsort(a)).astype(np.float64)
+    rank_b = np.argsort(np.argsort(b)).astype(np.float64)
+    if rank_a.shape[0] < 2:
+        return(np.nan)
+    return(float(np.corrcoef(rank_a, rank_b)[0, 1]))
+
+
+class SurrogateScreen:
+    """
+    :param
+        wind_inst_freq - (36,15) wind rose
+        tables         - EvalTables from Batch_Evaluator.preProcessing
+        n_instances    - dominant wind instances evaluated exactly
+        forgetting     - weight decay of older samples per update call
+        min_samples    - samples needed before the regression is used,
+                         before that the dominant instance AEP ranks alone
+        window         - predictions kept for the rank correlation
+    """
+
+    def __init__(self, wind_inst_freq, tables, n_instances=24, forgetting=0.95,
+                 ridge=1e-6, min_samples=10, window=500):
+        wind_inst_freq = np.asarray(wind_inst_freq, dtype=np.float64).ravel()
+        weight = wind_inst_freq*upperBoundPower(tables)
+
+        dominant = np.sort(np.argsort(-weight, kind='stable')[:n_instances])
+        self.freq   = wind_inst_freq[dominant]
+        self.tables = subsetTables(tables, dominant)
+
+        # one instance per direction, weighted by what it can carry
+        firsts = np.arange(n_slices_drct)*n_slices_sped
+        self.direction_tables = subsetTables(tables, firsts)
+        self.direction_weight = np.sum(weight.reshape(n_slices_drct, n_slices_sped), axis=1)
+        self.direction_weight/= np.sum(self.direction_weight)
+
+        self.cost        = (n_instances + n_slices_drct)/tables.n_wind_instances
+        self.forgetting  = forgetting
+        self.ridge       = ridge
+        self.min_samples = min_samples
+        self.normal      = np.zeros((3, 3))
+        self.target      = np.zeros(3)
+        self.coef        = None
+        self.n_samples   = 0
+        self.history     = deque(maxlen=window)
+        self.screened    = 0
+        self.kept        = 0
+        self.fitted      = 0
+        self._pending    = None
+
+    def features(self, layouts):
+        """(k, 3) features [dominant AEP, wake overlap, 1] of k layouts"""
+        layouts = np.asarray(layouts, dtype=np.float32).reshape(-1, *np.shape(layouts)[-2:])
+        aep = np.atleast_1d(getAEPBatch(layouts, self.freq, self.tables))
+
+        tables   = self.direction_tables
+        cos_dir  = tables.cos_dir[np.newaxis,:,np.newaxis]
+        sin_dir  = tables.sin_dir[np.newaxis,:,np.newaxis]
+        rotate_x = layouts[:,np.newaxis,:,0]*cos_dir - layouts[:,np.newaxis,:,1]*sin_dir
+        rotate_y = layouts[:,np.newaxis,:,0]*sin_dir + layouts[:,np.newaxis,:,1]*cos_dir
+        overlap  = _wakeTerms(rotate_x[...,:,np.newaxis] - rotate_x[...,np.newaxis,:],
+                              np.abs(rotate_y[...,:,np.newaxis] - rotate_y[...,np.newaxis,:]),
+                              tables.turb_rad)
+        overlap  = np.sum(overlap, axis=(2, 3)) @ self.direction_weight
+
+        return(np.column_stack([aep, overlap, np.ones_like(aep)]))
+
+    def predict_features(self, features):
+        if self.coef is None:
+            return(features[:,0])
+        return(features @ self.coef)
+
+    def predict(self, layouts):
+        """Predicted AEP (GWh) of layouts"""
+        return(self.predict_features(self.features(layouts)))
+
+    def screen(self, layouts, n_keep):
+        """
+        Indices of the n_keep layouts with the best predicted AEP. Their
+        features are kept for the next update(aep).
+        """
+        features = self.features(layouts)
+        predicted = self.predict_features(features)
+        keep = np.sort(np.argsort(-predicted, kind='stable')[:n_keep])
+        self.screened += features.shape[0]
+        self.kept     += keep.shape[0]
+        self._pending  = (features[keep], predicted[keep])
+        return(keep)
+
+    def update(self, aep, layouts=None):
+        """
+        Refits on the exact AEP of layouts, by default the ones kept by the
+        last screen() call.
+        """
+        aep = np.atleast_1d(np.asarray(aep, dtype=np.float64))
+        if layouts is None:
+            features, predicted = self._pending
+            self._pending = None
+            self.history.extend(zip(predicted, aep))
+        else:
+            features = self.features(layouts)
+            self.fitted += aep.shape[0]
+
+        self.normal = self.forgetting*self.normal + features.T @ features
+        self.target = self.forgetting*self.target + features.T @ aep
+        self.n_samples += aep.shape[0]
+        if self.n_samples >= self.min_samples:
+            self.coef = np.linalg.solve(self.normal + self.ridge*np.eye(3), self.target)
+
+    def reset(self):
+        """Forgets the fit, e.g. when the evaluator changes fidelity"""
+        self.normal    = np.zeros((3, 3))
+        self.target    = np.zeros(3)
+        self.coef      = None
+        self.n_samples = 0
+        self.history.clear()
+
+    def statistics(self):
+        """
+        dict with 'screened' (layouts predicted), 'evaluated' (exact
+        evaluations of the kept ones), 'fitted' (layouts featurized to
+        refit), 'cost' (prediction and fitting work in full evaluation
+        equivalents), 'baseline' (exact evaluations to pick the same
+        children without screening, i.e. all screened ones), 'net_saved'
+        (baseline - evaluated - cost, negative when the surrogate costs
+        more than it saves), 'overhead' (cost relative to a run breeding
+        only the children it evaluates) and 'rank_correlation' of recent
+        out-of-sample predictions
+        """
+        pairs = np.array(self.history).reshape(-1, 2)
+        cost  = (self.screened + self.fitted)*self.cost
+        return({'screened'        : self.screened,
+                'evaluated'       : self.kept,
+                'fitted'          : self.fitted,
+                'cost'            : cost,
+                'baseline'        : self.screened,
+                'net_saved'       : self.screened - self.kept - cost,
+                'overhead'        : cost/max(1, self.kept),
+                'rank_correlation': rankCorrelation(pairs[:,0], pairs[:,1])})
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Threaded_Evaluator.py
+
+DESCRIPTION
+    In-process multi-core AEP evaluation
+    ============================================================
+
+    farmPowerKernel is a numba compiled loop version of the Jensen wake
+    evaluation of Batch_Evaluator.py, compiled with nogil=True so that
+    several threads run it truly in parallel. Work items are (layout,
+    range of wind instances) pairs submitted to a long lived
+    ThreadPoolExecutor, one per number of workers asked for. Every thread reads the same EvalTables and the
+    same population array and writes its own slice of one output array,
+    so nothing is copied or pickled, which makes even single layout
+    evaluations (e.g. mutation acceptance tests) worth spreading over
+    cores.
+
+    The kernel is compiled for its one float32 signature when the module
+    is imported and kept in numba's on-disk cache (__pycache__ next to
+    this file, or $NUMBA_CACHE_DIR), so only the first process on a host
+    pays for the compilation; later ones, pool workers included, load it
+    in a fraction of a second. warmUp fills the cache ahead of a run and
+    jitStatistics reports what each kernel cost at start up.
+"""
+
+# Module List
+import numpy  as np
+from   numba  import njit                      # For some speed gains
+from   concurrent.futures import ThreadPoolExecutor
+
+import os
+import sys
+import threading
+import time
+
+from Batch_Evaluator import kw, powerToAEP
+
+
+# max_workers -> (shared pool, its number of threads), never shut down
+# while the process runs
+_executors     = {}
+_executor_lock = threading.Lock()
+
+
+def getExecutor(max_workers=None):
+    """
+    Returns the shared thread pool of max_workers threads, created on
+    first use, and its number of threads (max_workers None means one per
+    CPU). Pools of other sizes stay up, so callers asking for different
+    sizes at the same time never lose theirs.
+
+    :return
+        (executor, n_workers)
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    with _executor_lock:
+        if max_workers not in _executors:
+            _executors[max_workers] = (ThreadPoolExecutor(max_workers=max_workers,
+                                                          thread_name_prefix='aep%d' % max_workers),
+                                       max_workers)
+        return(_executors[max_workers])
+
+
+# turb_coords, cos_dir, sin_dir, wind_sped, wake_coef, lookup_middles,
+# power, turb_rad, farm_pwr
+kernel_signature = ('(float32[:,::1], float32[::1], float32[::1], float32[::1], float32[::1], '
+                    'float32[::1], float32[::1], float64, float32[::1])')
+
+_jit_start = time.perf_counter()
+
+
+@njit(kernel_signature, nogil=True, cache=True)  # nogil: threads run the kernel in parallel
+def farmPowerKernel(turb_coords, cos_dir, sin_dir, wind_sped, wake_coef,
+                    lookup_middles, power, turb_rad, farm_pwr):
+    """
+    Farm power of one layout for a range of wind instances, written into
+    farm_pwr (one value per instance in cos_dir/sin_dir/...).
+
+    :param
+        turb_coords    - (n_turbs, 2) turbine coordinates
+        cos_dir        - cos of the rotation of every wind instance
+        sin_dir        - sin of the rotation of every wind instance
+        wind_sped      - free stream speed of every wind instance
+        wake_coef      - 1 - sqrt(1 - C_t) of every wind instance
+        lookup_middles - power curve speeds midpoints, see searchSorted
+        power          - power curve power column (MW)
+        turb_rad       - turbine radius (m)
+        farm_pwr       - output, farm power (MW) of every wind instance
+    """
+    n_turbs  = turb_coords.shape[0]
+    rotate_x = np.empty(n_turbs, dtype=np.float32)
+    rotate_y = np.empty(n_turbs, dtype=np.float32)
+
+    for k in range(cos_dir.shape[0]):
+        # downwind(x) & crosswind(y) coordinates
+        for i in range(n_turbs):
+            rotate_x[i] = turb_coords[i,0]*cos_dir[k] - turb_coords[i,1]*sin_dir[k]
+            rotate_y[i] = turb_coords[i,0]*sin_dir[k] + turb_coords[i,1]*cos_dir[k]
+
+        total = 0.0
+        for i in range(n_turbs):
+            # sum of squares of (deficit/wake_coef) from all upstream turbs
+            deficit_sq = 0.0
+            for j in range(n_turbs):
+                x = rotate_x[i] - rotate_x[j]
+                if x > 0:
+                    wake_rad = turb_rad + kw*x
+                    if np.abs(rotate_y[i] - rotate_y[j]) <= wake_rad:
+                        q = (turb_rad/wake_rad)**2
+                        deficit_sq += q*q
+
+            wind_sped_eff = wind_sped[k]*(1.0 - wake_coef[k]*np.sqrt(deficit_sq))
+            total += power[np.searchsorted(lookup_middles, wind_sped_eff)]
+        farm_pwr[k] = total
+
+
+# compiling or loading farmPowerKernel happened at its definition
+_jit_seconds = {'farmPowerKernel': time.perf_counter() - _jit_start}
+
+
+def jitStatistics():
+    """
+    Start up cost of the compiled kernels: per kernel the seconds spent
+    compiling or loading it and the numba cache hits and misses (a miss
+    means it was compiled in this process).
+    """
+    kernels = {'farmPowerKernel': farmPowerKernel}
+    if 'Farm_Evaluator' in sys.modules:
+        kernels['jensenParkWake'] = sys.modules['Farm_Evaluator'].jensenParkWake
+    stats = {}
+    for name, kernel in kernels.items():
+        stats[name] = {'seconds'     : _jit_seconds.get(name, float('nan')),
+                       'cache_hits'  : sum(kernel.stats.cache_hits.values()),
+                       'cache_misses': sum(kernel.stats.cache_misses.values())}
+    return(stats)
+
+
+def warmUp(reference=True):
+    """
+    Compiles, or loads from the cache, every kernel so that the processes
+    started afterwards find them on disk. With reference, also
+    Farm_Evaluator.jensenParkWake, if Farm_Evaluator can be imported.
+
+    :return
+        jitStatistics()
+    """
+    if reference and 'Farm_Evaluator' not in sys.modules:
+        start = time.perf_counter()
+        try:
+            import Farm_Evaluator
+        except ImportError:
+            pass
+        else:
+            _jit_seconds['jensenParkWake'] = time.perf_counter() - start
+    return(jitStatistics())
+
+
+def farmPowerThreaded(layouts, tables, max_workers=None):
+    """
+    Farm power (MW) of each layout for each wind instance, computed on
+    the shared thread pool. Same shapes as Batch_Evaluator.farmPowerBatch.
+    """
+    layouts = np.ascontiguousarray(layouts, dtype=np.float32)
+    single  = layouts.ndim == 2
+    if single:
+        layouts = layouts[np.newaxis]
+    n_layouts = layouts.shape[0]
+    n_wind_instances = tables.n_wind_instances
+
+    executor, n_workers = getExecutor(max_workers)
+
+    # when there are fewer layouts than threads split the wind rose too
+    n_chunks = max(1, min(n_wind_instances, -(-n_workers//n_layouts)))
+    bounds   = np.linspace(0, n_wind_instances, n_chunks + 1).astype(np.int64)
+
+    power_curve    = tables.power_curve
+    lookup_middles = np.ascontiguousarray(power_curve[1:,0] - np.diff(power_curve[:,0])/2,
+                                          dtype=np.float32)
+    power          = np.ascontiguousarray(power_curve[:,2], dtype=np.float32)
+    cos_dir, sin_dir, wind_sped, wake_coef = (
+        np.ascontiguousarray(a, dtype=np.float32)
+        for a in (tables.cos_dir, tables.sin_dir, tables.wind_sped, tables.wake_coef))
+    farm_pwr       = np.zeros((n_layouts, n_wind_instances), dtype=np.float32)
+
+    futures = []
+    for p in range(n_layouts):
+        for i0, i1 in zip(bounds[:-1], bounds[1:]):
+            futures.append(executor.submit(
+                farmPowerKernel, layouts[p], cos_dir[i0:i1], sin_dir[i0:i1],
+                wind_sped[i0:i1], wake_coef[i0:i1], lookup_middles, power,
+                float(tables.turb_rad), farm_pwr[p,i0:i1]))
+    for future in futures:
+        future.result()
+
+    return(farm_pwr[0] if single else farm_pwr)
+
+
+def getAEPThreaded(layouts, wind_inst_freq, tables, max_workers=None):
+    """
+    AEP (GWh) of every layout, see Batch_Evaluator.getAEPBatch
+    """
+    farm_pwr = farmPowerThreaded(layouts, tables, max_workers)
+    return(powerToAEP(farm_pwr, wind_inst_freq))
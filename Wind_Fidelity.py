@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Wind_Fidelity.py
+
+DESCRIPTION
+    Reduced wind roses with a guaranteed AEP error bound
+    ============================================================
+
+    A wake can only slow a turbine down, so in any wind instance a
+    turbine produces at most the largest power the power curve gives at
+    or below the free stream speed. Ranking the 540 instances by
+    probability x that bound and dropping the weakest ones from the
+    bottom gives a reduced rose whose AEP is a lower bound of the full
+    AEP and never more than error_bound GWh below it, for any layout.
+    Instances whose bound is zero (below cut-in) are dropped for free.
+
+    MultiFidelityEvaluator steps through a list of such roses, coarse to
+    exact, promoting on a generation schedule or when the best AEP
+    stalls. full() always scores against the complete rose.
+"""
+
+# Module List
+import numpy  as np
+from collections import namedtuple
+
+from Batch_Evaluator import subsetTables, upperBoundPower, getAEPBatch, lossBreakdown, \
+                            progressiveAEP, relocationAEP
+
+
+ReducedRose = namedtuple('ReducedRose', ['indices', 'wind_inst_freq', 'tables',
+                                         'error_bound', 'tolerance'])
+
+
+def reduceWindRose(wind_inst_freq, tables, n_turbs=50, tolerance=0.0):
+    """
+    Drops the least energetic wind instances.
+
+    :param
+        wind_inst_freq - (36,15) or (540,) wind instance probabilities
+        tables         - EvalTables from Batch_Evaluator.preProcessing
+        n_turbs        - Total number of turbines
+        tolerance      - allowed AEP error as a fraction of the farm's
+                         upper bound AEP. 0 keeps every instance that
+                         can produce power, so the result is exact.
+
+    :return
+        ReducedRose. For every layout,
+        0 <= AEP(full rose) - AEP(reduced rose) <= error_bound (GWh)
+    """
+    wind_inst_freq = np.asarray(wind_inst_freq, dtype=np.float32).ravel()
+
+    # upper bound on the energy (GWh) each instance can contribute
+    bound = 8760.0*n_turbs*wind_inst_freq*upperBoundPower(tables)/1e3
+
+    # drop from the weakest instance up while the dropped bound fits
+    order   = np.argsort(bound, kind='stable')
+    dropped = np.cumsum(bound[order]) <= tolerance*np.sum(bound)
+    dropped|= bound[order] == 0
+    keep    = np.sort(order[~dropped])
+
+    return(ReducedRose(keep, wind_inst_freq[keep], subsetTables(tables, keep),
+                       float(np.sum(bound[order[dropped]])), tolerance))
+
+
+class MultiFidelityEvaluator:
+    """
+    Callable AEP evaluator that starts on a coarse wind rose and is
+    promoted towards the exact one.
+
+    :param
+        wind_inst_freq    - full (36,15) wind rose
+        tables            - EvalTables from Batch_Evaluator.preProcessing
+        n_turbs           - Total number of turbines
+        tolerances        - error tolerances of the levels, coarse first.
+                            An exact level (0.0) is appended if missing.
+        schedule          - generations at which to leave each level,
+                            e.g. [50, 150]. None to promote on stall only.
+        stall_generations - promote after this many generations without
+                            a best AEP gain of min_improvement (GWh).
+                            None to promote on schedule only.
+
+    evaluations counts, per level, the layouts scored in full evaluation
+    equivalents, a single turbine relocation of K candidates counting
+    K/n_turbs as in Run_Controller.CountingEvaluator.
+    """
+
+    def __init__(self, wind_inst_freq, tables, n_turbs=50,
+                 tolerances=(0.05, 0.01, 0.0), schedule=None,
+                 stall_generations=10, min_improvement=1e-3):
+        tolerances = list(tolerances)
+        if not tolerances or tolerances[-1] != 0.0:
+            tolerances.append(0.0)
+
+        self.wind_inst_freq    = np.asarray(wind_inst_freq, dtype=np.float32).ravel()
+        self.tables            = tables
+        self.roses             = [reduceWindRose(self.wind_inst_freq, tables, n_turbs, t)
+                                  for t in tolerances]
+        self.schedule          = list(schedule) if schedule is not None else None
+        self.stall_generations = stall_generations
+        self.min_improvement   = min_improvement
+        self.level             = 0
+        self.evaluations       = [0.0]*len(self.roses)
+        self._reset_stall()
+
+    def _reset_stall(self):
+        self._best  = -np.inf
+        self._since = 0
+
+    @property
+    def rose(self):
+        return(self.roses[self.level])
+
+    @property
+    def is_full(self):
+        return(self.level == len(self.roses) - 1)
+
+    @property
+    def error_bound(self):
+        return(self.rose.error_bound)
+
+    def __call__(self, layouts):
+        """AEP (GWh) of layouts at the current fidelity"""
+        layouts = np.asarray(layouts, dtype=np.float32)
+        self.evaluations[self.level] += 1 if layouts.ndim == 2 else layouts.shape[0]
+        return(getAEPBatch(layouts, self.rose.wind_inst_freq, self.rose.tables))
+
+    def breakdown(self, layouts):
+        """Batch_Evaluator.lossBreakdown of layouts at the current fidelity"""
+        layouts = np.asarray(layouts, dtype=np.float32)
+        self.evaluations[self.level] += 1 if layouts.ndim == 2 else layouts.shape[0]
+        return(lossBreakdown(layouts, self.rose.wind_inst_freq, self.rose.tables))
+
+    def progressive(self, layouts, thresholds):
+        """Batch_Evaluator.progressiveAEP of layouts at the current fidelity"""
+        layouts = np.asarray(layouts, dtype=np.float32)
+        self.evaluations[self.level] += 1 if layouts.ndim == 2 else layouts.shape[0]
+        return(progressiveAEP(layouts, thresholds, self.rose.wind_inst_freq, self.rose.tables))
+
+    def relocation(self, layout, turbine, candidates):
+        """Batch_Evaluator.relocationAEP at the current fidelity"""
+        self.evaluations[self.level] += len(candidates)/np.shape(layout)[0]
+        return(relocationAEP(layout, turbine, candidates, self.rose.wind_inst_freq,
+                             self.rose.tables))
+
+    def full(self, layouts):
+        """AEP (GWh) of layouts against the complete wind rose"""
+        return(getAEPBatch(layouts, self.wind_inst_freq, self.tables))
+
+    def promote(self):
+        """Moves to the next finer level. Returns False if already exact."""
+        if self.is_full:
+            return(False)
+        self.level += 1
+        self._reset_stall()
+        return(True)
+
+    def update(self, generation, best_aep):
+        """
+        Called once per generation with the current best AEP. Returns True
+        when the evaluator was promoted, in which case the population has
+        to be re-scored since AEP values of different levels don't compare.
+        """
+        if self.is_full:
+            return(False)
+
+        if best_aep > self._best + self.min_improvement:
+            self._best  = best_aep
+            self._since = 0
+        else:
+            self._since += 1
+
+        scheduled = (self.schedule is not None and self.level < len(self.schedule)
+                     and generation >= self.schedule[self.level])
+        stalled   = (self.stall_generations is not None
+                     and self._since >= self.stall_generations)
+        if scheduled or stalled:
+            return(self.promote())
+        return(False)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+NAME
+    Wind_Store.py
+
+DESCRIPTION
+    Columnar binary store for the wind data csv files
+    ============================================================
+
+    Every wind_data_*.csv is converted once into typed column arrays,
+
+        <store>/<name>.drct.npy   int16   direction (deg)
+        <store>/<name>.sped.npy   float32 speed (m/s)
+        <store>/<name>.date.npy   int64   epoch timestamp (s)
+
+    plus a manifest.json listing every entry with its year and row count.
+    The columns are opened with np.load(mmap_mode='r'), so loading is
+    near instant and worker processes reading the same store share the
+    pages instead of holding their own copies.
+
+    Typical use:
+
+        convertWindData(sorted(glob.glob('wind_data_*.csv')), 'wind_store')
+        names, wind_stack = binWindStore('wind_store', years=[2007, 2008])
+"""
+
+# Module List
+import numpy  as np
+import pandas as pd
+
+import json
+import os
+import re
+
+from Batch_Evaluator import binWindArrays
+
+
+manifest_file_name = 'manifest.json'
+store_format       = 1
+
+# column name -> dtype stored on disk
+store_columns = {'drct': np.int16, 'sped': np.float32, 'date': np.int64}
+
+
+def columnFileName(store_dir, name, column):
+    """Returns the .npy file holding one column of one store entry"""
+    return(os.path.join(store_dir, name + '.' + column + '.npy'))
+
+
+def readManifest(store_dir):
+    """
+    Returns the store manifest, a dict with 'format', 'columns' and
+    'entries' (list of dicts with 'name', 'year', 'rows', 'source').
+    """
+    with open(os.path.join(store_dir, manifest_file_name)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != store_format:
+        raise ValueError('Unsupported wind store format %r in %s'
+                         % (manifest.get('format'), store_dir))
+    return(manifest)
+
+
+def convertWindFile(wind_data_file_name, store_dir):
+    """
+    Converts one wind data csv file into typed column arrays.
+
+    :return
+        manifest entry (dict) for the converted file
+    """
+    name = os.path.splitext(os.path.basename(wind_data_file_name))[0]
+    df   = pd.read_csv(wind_data_file_name, usecols=['date', 'drct', 'sped'])
+
+    # directions are binned on exact multiples of 10, so nothing may be
+    # lost when narrowing them to int16
+    drct = df['drct'].to_numpy(dtype=np.float64)
+    if not np.all(drct == np.round(drct)):
+        raise ValueError('Non integer wind directions in ' + wind_data_file_name)
+
+    columns = {'drct': drct.astype(np.int16),
+               'sped': df['sped'].to_numpy(dtype=np.float32),
+               'date': pd.to_datetime(df['date']).to_numpy(dtype='datetime64[s]').astype(np.int64)}
+    for column, values in columns.items():
+        np.save(columnFileName(store_dir, name, column), values.astype(store_columns[column]))
+
+    year = re.search(r'(\d{4})', name)
+    return({'name'  : name,
+            'year'  : int(year.group(1)) if year else None,
+            'rows'  : int(df.shape[0]),
+            'source': os.path.basename(wind_data_file_name)})
+
+
+def convertWindData(wind_data_file_names, store_dir):
+    """
+    Converts wind data csv files into a store, replacing entries of the
+    same name and keeping the others. Writes the manifest last.
+
+    :return
+        the manifest (dict)
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    try:
+        entries = readManifest(store_dir)['entries']
+    except FileNotFoundError:
+        entries = []
+
+    for wind_data_file_name in wind_data_file_names:
+        entry   = convertWindFile(wind_data_file_name, store_dir)
+        entries = [e for e in entries if e['name'] != entry['name']] + [entry]
+
+    manifest = {'format' : store_format,
+                'columns': {c: np.dtype(t).name for c, t in store_columns.items()},
+                'entries': sorted(entries, key=lambda e: e['name'])}
+    tmp_file_name = os.path.join(store_dir, manifest_file_name + '.tmp')
+    with open(tmp_file_name, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_file_name, os.path.join(store_dir, manifest_file_name))
+    return(manifest)
+
+
+def selectEntries(manifest, names=None, years=None):
+    """Returns manifest entries matching names and/or years, all by default"""
+    entries = manifest['entries']
+    if names is not None:
+        by_name = {e['name']: e for e in entries}
+        missing = [n for n in names if n not in by_name]
+        if missing:
+            raise KeyError('Not in wind store: ' + ', '.join(missing))
+        entries = [by_name[n] for n in names]
+    if years is not None:
+        years   = set(years)
+        entries = [e for e in entries if e['year'] in years]
+    return(entries)
+
+
+def loadWindColumns(store_dir, name, columns=('drct', 'sped')):
+    """
+    Returns a dict column -> read-only memory mapped array for one entry
+    """
+    return({c: np.load(columnFileName(store_dir, name, c), mmap_mode='r')
+            for c in columns})
+
+
+def binWindStore(store_dir, names=None, years=None):
+    """
+    Bins store entries into wind instance probabilities. Drop-in for
+    Batch_Evaluator.binWindEnsemble.
+
+    :return
+        (names, wind_stack) with wind_stack of shape (n_entries, 36, 15)
+    """
+    entries = selectEntries(readManifest(store_dir), names, years)
+    stack   = []
+    for entry in entries:
+        wind = loadWindColumns(store_dir, entry['name'])
+        stack.append(binWindArrays(wind['drct'], wind['sped']))
+    return([e['name'] for e in entries], np.stack(stack))
+
+
+if __name__ == "__main__":
+
+    import glob
+
+    manifest = convertWindData(sorted(glob.glob('wind_data_*.csv')), 'wind_store')
+    for entry in manifest['entries']:
+        print('%-22s year %-5s rows %d' % (entry['name'], entry['year'], entry['rows']))
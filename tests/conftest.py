@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures: the repository modules live at the top level, next to
+the data files the tests read.
+"""
+
+# Module List
+import numpy  as np
+import pytest
+
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from Batch_Evaluator import loadPowerCurve, binWindResourceData, preProcessing
+
+
+@pytest.fixture(scope='session')
+def power_curve():
+    return(loadPowerCurve(os.path.join(root, 'power_curve.csv')))
+
+
+@pytest.fixture(scope='session')
+def tables(power_curve):
+    return(preProcessing(power_curve, turb_diam=100))
+
+
+@pytest.fixture(scope='session')
+def wind_inst_freq():
+    return(binWindResourceData(os.path.join(root, 'wind_data_2007.csv')))
+
+
+@pytest.fixture
+def layouts():
+    """Six random feasible 50 turbine layouts"""
+    from GA_Engine import generate_random_locations
+    rng = np.random.default_rng(0)
+    return(np.stack([generate_random_locations(rng) for i in range(6)]))
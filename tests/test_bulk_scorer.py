@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Bulk scoring of layout files, including ones that hold no layout"""
+
+# Module List
+import numpy  as np
+import pandas as pd
+
+import os
+
+from Batch_Evaluator import getAEPBatch
+from Bulk_Scorer     import scoreLayouts
+
+from conftest        import root
+
+
+def test_empty_and_unreadable_files_are_reported_per_file(tmp_path, tables, wind_inst_freq):
+    with open(os.path.join(root, 'Arrangement_0.csv')) as source:
+        (tmp_path / 'good.csv').write_text(source.read())
+    (tmp_path / 'empty.csv').write_text('x,y\n')
+    (tmp_path / 'columns.csv').write_text('a,b\n1,2\n')
+
+    table = scoreLayouts(str(tmp_path), wind_inst_freq, tables).set_index('name')
+    good  = table.loc[str(tmp_path / 'good.csv')]
+    assert good['feasible'] and pd.isna(good['error'])
+    layout = np.loadtxt(tmp_path / 'good.csv', delimiter=',', skiprows=1)
+    assert good['aep'] == float(getAEPBatch(layout, wind_inst_freq, tables))
+    for name, message in [('empty.csv', 'no turbines'), ('columns.csv', 'KeyError')]:
+        row = table.loc[str(tmp_path / name)]
+        assert message in row['error'] and not row['feasible'] and np.isnan(row['aep'])
+
+
+def test_empty_layouts_of_an_archive_are_reported(tmp_path, layouts, tables, wind_inst_freq):
+    np.savez(tmp_path / 'layouts.npz', good=layouts[0], empty=np.zeros((0, 2)))
+    (tmp_path / 'broken.npy').write_bytes(b'not an array')
+
+    table = scoreLayouts(str(tmp_path / 'layouts.npz'), wind_inst_freq, tables).set_index('name')
+    assert table.loc['good', 'feasible'] and 'no turbines' in table.loc['empty', 'error']
+    table = scoreLayouts(str(tmp_path / 'broken.npy'), wind_inst_freq, tables)
+    assert table.shape[0] == 1 and table.loc[0, 'error'].startswith('ValueError')
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""optimize and resume score their starting population with the run's evaluator"""
+
+# Module List
+import numpy  as np
+import pytest
+
+import os
+
+import Command_Line
+from conftest        import root
+from Batch_Evaluator import getAEPBatch
+from GA_Engine       import default_settings, new_population
+
+
+def capture(monkeypatch):
+    """Replaces _runGA, returning the arguments of its calls, and counts model loads"""
+    calls, loads = [], []
+    load = Command_Line._loadModel
+    monkeypatch.setattr(Command_Line, '_runGA', lambda *args: calls.append(args))
+    monkeypatch.setattr(Command_Line, '_loadModel', lambda args: loads.append(1) or load(args))
+    return(calls, loads)
+
+
+def test_initial_population_scored_at_the_run_fidelity(monkeypatch, wind_inst_freq, tables):
+    calls, loads = capture(monkeypatch)
+    Command_Line.main(['optimize', '--fidelity', '--quiet',
+                       '--wind', os.path.join(root, 'wind_data_2007.csv'),
+                       '--power-curve', os.path.join(root, 'power_curve.csv'),
+                       '--initial', os.path.join(root, 'Arrangement_1*.csv')])
+    args, settings, rng, initial, done, evaluate = calls[0]
+    assert len(loads) == 1 and evaluate.level == 0
+    np.testing.assert_allclose(initial[1], evaluate(initial[0]), rtol=1e-12)
+    assert not np.allclose(initial[1], getAEPBatch(initial[0], wind_inst_freq, tables))
+
+
+def test_resume_rescores_the_saved_population(monkeypatch, tmp_path, layouts):
+    calls, loads = capture(monkeypatch)
+    args = Command_Line.buildParser().parse_args(
+        ['resume', 'state.npz', '--wind', os.path.join(root, 'wind_data_2007.csv'),
+         '--power-curve', os.path.join(root, 'power_curve.csv')])
+    settings   = dict(default_settings, mu=len(layouts))
+    population = new_population(layouts, np.zeros(len(layouts)), settings)
+    state_file = str(tmp_path/'state.npz')
+    Command_Line.saveState(state_file, settings, population, np.random.default_rng(0), 3, args)
+
+    Command_Line.main(['resume', state_file, '--fidelity', '--quiet'])
+    args, settings, rng, initial, done, evaluate = calls[0]
+    assert len(loads) == 1 and done == 3
+    assert np.array_equal(initial['aep'], evaluate(layouts))
+
+
+def test_optimize_from_fewer_files_than_mu(tmp_path, capsys):
+    output = str(tmp_path/'sol.csv')
+    Command_Line.main(['optimize', '--quiet', '--seed', '0', '--mu', '12', '--c', '4',
+                       '--iterations', '2', '--no-of-mutation-tries', '20',
+                       '--wind', os.path.join(root, 'wind_data_2007.csv'),
+                       '--power-curve', os.path.join(root, 'power_curve.csv'),
+                       '--initial', os.path.join(root, 'Arrangement_1[0-2].csv'),
+                       '--state', str(tmp_path/'run.npz'), '-o', output])
+    meta, population, rng = Command_Line.loadState(str(tmp_path/'run.npz'))
+    assert population['coords'].shape == (12, 50, 2) and meta['settings']['mu'] == 12
+    assert os.path.exists(output)
+
+
+def test_tournament_larger_than_population_is_refused():
+    with pytest.raises(SystemExit, match='tournament size'):
+        Command_Line.main(['optimize', '--mu', '8', '--c', '10'])
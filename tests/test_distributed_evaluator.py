@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Distributed_Evaluator with local workers against local evaluation"""
+
+# Module List
+import numpy  as np
+import pytest
+
+import signal
+import time
+
+from Batch_Evaluator       import getAEPBatch
+from Distributed_Evaluator import DistributedEvaluator, spawnLocalWorkers
+
+
+def localBatches(layouts, batch_size, wind_inst_freq, tables):
+    """getAEPBatch on the batches a coordinator hands out"""
+    return(np.concatenate([getAEPBatch(layouts[b:b+batch_size], wind_inst_freq, tables)
+                           for b in range(0, len(layouts), batch_size)]))
+
+
+def test_results_match_local(layouts, tables, wind_inst_freq):
+    with DistributedEvaluator(wind_inst_freq, tables, batch_size=2) as evaluate:
+        workers = spawnLocalWorkers(2, evaluate.address)
+        assert evaluate.wait_for_workers(2, timeout=60)
+        aep = evaluate(layouts)
+        np.testing.assert_array_equal(aep, localBatches(layouts, 2, wind_inst_freq, tables))
+        np.testing.assert_allclose(aep, getAEPBatch(layouts, wind_inst_freq, tables), rtol=1e-12)
+        assert evaluate(layouts[0]) == getAEPBatch(layouts[0], wind_inst_freq, tables)
+        assert evaluate.statistics()['layouts'] == len(layouts) + 1
+    for worker in workers:
+        assert worker.wait(30) == 0
+
+
+def test_lost_worker_batch_is_requeued(layouts, tables, wind_inst_freq):
+    layouts = np.concatenate([layouts]*8)
+    with DistributedEvaluator(wind_inst_freq, tables, batch_size=1, heartbeat=0.2,
+                              timeout=2.0) as evaluate:
+        workers = spawnLocalWorkers(2, evaluate.address)
+        assert evaluate.wait_for_workers(2, timeout=60)
+        workers[0].send_signal(signal.SIGSTOP)          # silent, connection still open
+        try:
+            aep = evaluate(layouts)
+        finally:
+            workers[0].kill()
+        np.testing.assert_array_equal(aep, localBatches(layouts, 1, wind_inst_freq, tables))
+        assert evaluate.statistics()['workers_lost'] == 1
+    workers[1].wait(30)
+
+
+def test_empty_input_returns_at_once(tables, wind_inst_freq):
+    with DistributedEvaluator(wind_inst_freq, tables) as evaluate:
+        assert evaluate(np.zeros((0, 50, 2))).shape == (0,)
+
+
+def test_no_worker_raises_after_grace(layouts, tables, wind_inst_freq):
+    with DistributedEvaluator(wind_inst_freq, tables, heartbeat=0.1,
+                              worker_grace=0.5) as evaluate:
+        start = time.monotonic()
+        with pytest.raises(RuntimeError, match='no worker'):
+            evaluate(layouts)
+        assert time.monotonic() - start < 5
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Evaluation_Server against local evaluation, and its error paths"""
+
+# Module List
+import numpy  as np
+import pytest
+
+import asyncio
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from Batch_Evaluator   import BatchEvaluator
+from Evaluation_Server import EvaluationServer, EvaluationClient, header
+
+
+class FailingEvaluator(BatchEvaluator):
+    """Raises for 3 turbine farms, as an evaluator may for bad input"""
+
+    def __call__(self, layouts):
+        if layouts.shape[1] == 3:
+            raise ValueError('three turbines')
+        return(super().__call__(layouts))
+
+
+@pytest.fixture
+def server(tmp_path, tables, wind_inst_freq):
+    path  = os.path.join(str(tmp_path), 'aep.sock')
+    ready = threading.Event()
+    evaluator = FailingEvaluator(wind_inst_freq, tables)
+    server    = EvaluationServer(evaluator, window=0.02, max_request_bytes=1 << 20)
+    threading.Thread(target=lambda: asyncio.run(server.serve(path, ready=ready)),
+                     daemon=True).start()
+    assert ready.wait(10)
+    return(path, evaluator, server)
+
+
+def test_results_match_local(server, layouts):
+    path, evaluator, _ = server
+    expected = evaluator(layouts)
+
+    def work(k):
+        client = EvaluationClient(path)
+        try:
+            return(client(layouts[k]))
+        finally:
+            client.close()
+
+    with ThreadPoolExecutor(len(layouts)) as pool:
+        got = list(pool.map(work, range(len(layouts))))
+    # batches of other sizes may change the last bit of the sums
+    np.testing.assert_allclose(got, expected, rtol=1e-12)
+
+    client = EvaluationClient(path)
+    np.testing.assert_allclose(client(layouts), expected, rtol=1e-12)
+    assert client.metrics()['layouts'] == 2*len(layouts)
+    client.close()
+
+
+def test_bad_request_fails_alone(server, layouts):
+    path, evaluator, _ = server
+    expected = evaluator(layouts)
+    start    = threading.Barrier(3)
+
+    def good():
+        client = EvaluationClient(path)
+        start.wait()
+        return(client(layouts))
+
+    def empty():
+        client = EvaluationClient(path)
+        start.wait()
+        with pytest.raises(RuntimeError, match='at least one layout'):
+            client(np.zeros((0, 50, 2)))
+        # the connection is still usable
+        return(client(layouts[:1]))
+
+    def failing():
+        client = EvaluationClient(path)
+        start.wait()
+        with pytest.raises(RuntimeError, match='three turbines'):
+            client(np.full((1, 3, 2), 1000.0))
+        return(True)
+
+    with ThreadPoolExecutor(3) as pool:
+        results = [pool.submit(f) for f in (good, empty, failing)]
+        np.testing.assert_allclose(results[0].result(), expected, rtol=1e-12)
+        np.testing.assert_allclose(results[1].result(), expected[:1], rtol=1e-12)
+        assert results[2].result()
+
+
+def test_oversized_request_is_refused(server):
+    path, evaluator, _ = server
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    sock.sendall(header.pack(b'E', 1 << 20, 50))
+    client = EvaluationClient.__new__(EvaluationClient)
+    client.sock = sock
+    with pytest.raises(RuntimeError, match='byte limit'):
+        client._answer()
+    sock.close()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Evaluator_Registry memory budget and calibration locking"""
+
+# Module List
+import numpy  as np
+
+import threading
+
+import Evaluator_Registry
+from Batch_Evaluator    import getAEPBatch
+from Evaluator_Registry import AutoEvaluator, chooseBackend, registerBackend, regime
+
+
+def test_memory_budget_reaches_the_backend(monkeypatch, layouts, tables, wind_inst_freq):
+    budgets = []
+
+    def recording(layouts, wind_inst_freq, tables, memory_budget):
+        budgets.append(memory_budget)
+        return(getAEPBatch(layouts, wind_inst_freq, tables, memory_budget))
+
+    monkeypatch.setattr(Evaluator_Registry, 'backends', dict(Evaluator_Registry.backends))
+    registerBackend('recording', recording, calibrate=False)
+    evaluate = AutoEvaluator(wind_inst_freq, tables, backend='recording', memory_budget=1 << 20)
+    np.testing.assert_allclose(evaluate(layouts), getAEPBatch(layouts, wind_inst_freq, tables),
+                               rtol=1e-12)
+    assert budgets == [1 << 20]
+
+
+def test_calibration_does_not_block_other_regimes(monkeypatch, tmp_path, tables, wind_inst_freq):
+    monkeypatch.setenv('WFLO_BACKEND_CACHE', str(tmp_path/'backends.json'))
+    monkeypatch.setattr(Evaluator_Registry, '_choices', {regime(10, 1): 'batch'})
+    monkeypatch.setattr(Evaluator_Registry, '_regime_locks', {})
+    started, release = threading.Event(), threading.Event()
+
+    def slow(n_turbs, n_layouts, wind_inst_freq, tables):
+        started.set()
+        assert release.wait(10)
+        return({'batch': 1.0})
+
+    monkeypatch.setattr(Evaluator_Registry, 'calibrate', slow)
+    results = {}
+    waiting = [threading.Thread(target=lambda k=k: results.__setitem__(
+                   k, chooseBackend(50, 64, wind_inst_freq, tables))) for k in range(2)]
+    for thread in waiting:
+        thread.start()
+    assert started.wait(10)
+    # a known regime answers while another one is being calibrated
+    assert chooseBackend(10, 1, wind_inst_freq, tables) == 'batch'
+    release.set()
+    for thread in waiting:
+        thread.join(10)
+    assert results == {0: 'batch', 1: 'batch'}
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Batched and threaded evaluators against the reference Farm_Evaluator"""
+
+# Module List
+import numpy  as np
+import pytest
+
+import os
+
+from Batch_Evaluator import getAEPBatch, farmPowerBatch, progressiveAEP, upperBoundPower, \
+                            binWindResourceData, binWindEnsemble, ensembleAEP
+from conftest        import root
+
+
+def test_batch_matches_reference(layouts, power_curve, tables, wind_inst_freq):
+    pytest.importorskip('shapely')
+    pytest.importorskip('tqdm')
+    from Farm_Evaluator import totalAEP
+
+    aep = getAEPBatch(layouts[:2], wind_inst_freq, tables)
+    for layout, value in zip(layouts[:2], aep):
+        assert value == pytest.approx(totalAEP(100, layout, power_curve, wind_inst_freq), rel=1e-5)
+
+
+def test_threaded_matches_reference(layouts, power_curve, tables, wind_inst_freq):
+    pytest.importorskip('shapely')
+    pytest.importorskip('tqdm')
+    Threaded_Evaluator = pytest.importorskip('Threaded_Evaluator')
+    from Farm_Evaluator import totalAEP
+
+    aep = Threaded_Evaluator.getAEPThreaded(layouts[:2], wind_inst_freq, tables)
+    for layout, value in zip(layouts[:2], aep):
+        assert value == pytest.approx(totalAEP(100, layout, power_curve, wind_inst_freq), rel=1e-5)
+
+
+def test_threaded_matches_batch(layouts, tables, wind_inst_freq):
+    Threaded_Evaluator = pytest.importorskip('Threaded_Evaluator')
+    batch    = getAEPBatch(layouts, wind_inst_freq, tables)
+    threaded = Threaded_Evaluator.getAEPThreaded(layouts, wind_inst_freq, tables)
+    np.testing.assert_allclose(threaded, batch, rtol=1e-5)
+
+
+def test_single_layout_and_batch_agree(layouts, tables, wind_inst_freq):
+    batch = getAEPBatch(layouts, wind_inst_freq, tables)
+    assert np.ndim(getAEPBatch(layouts[0], wind_inst_freq, tables)) == 0
+    assert getAEPBatch(layouts[0], wind_inst_freq, tables) == pytest.approx(batch[0], rel=1e-6)
+
+
+def test_memory_budget_does_not_change_results(layouts, tables, wind_inst_freq):
+    full  = getAEPBatch(layouts, wind_inst_freq, tables)
+    tiled = getAEPBatch(layouts, wind_inst_freq, tables, memory_budget=200000)
+    np.testing.assert_allclose(tiled, full, rtol=1e-6)
+
+
+def test_ensemble_matches_single_files(tables):
+    files = [os.path.join(root, 'wind_data_2007.csv'), os.path.join(root, 'wind_data_2008.csv')]
+    names, stack = binWindEnsemble(files)
+    assert names == ['wind_data_2007', 'wind_data_2008']
+    for f, rose in zip(files, stack):
+        np.testing.assert_array_equal(rose, binWindResourceData(f))
+
+
+def test_single_year_ensemble_keeps_its_year_axis(layouts, tables):
+    names, wind_stack = binWindEnsemble([os.path.join(root, 'wind_data_2007.csv')])
+    result = ensembleAEP(layouts[:3], wind_stack, tables)
+    assert result['per_year'].shape == (3, 1)
+    for k in ('mean', 'min', 'max', 'p90', 'spread'):
+        assert result[k].shape == (3,)
+    np.testing.assert_allclose(result['mean'], getAEPBatch(layouts[:3], wind_stack[0], tables),
+                               rtol=1e-12)
+
+
+@pytest.mark.parametrize('memory_budget', [None, 1e5])
+def test_no_layouts(tables, wind_inst_freq, memory_budget):
+    aep = getAEPBatch(np.zeros((0, 50, 2)), wind_inst_freq, tables, memory_budget)
+    assert aep.shape == (0,)
+
+
+@pytest.mark.parametrize('memory_budget', [1e5, 1e6, 1e7, 1e8])
+def test_peak_bytes_within_budget(layouts, tables, memory_budget):
+    power, stats = farmPowerBatch(layouts, tables, memory_budget, return_stats=True)
+    assert stats['peak_bytes'] <= memory_budget
+    np.testing.assert_allclose(power, farmPowerBatch(layouts, tables), rtol=1e-6)
+
+
+@pytest.mark.parametrize('memory_budget', [None, 1e6])
+def test_progressive_is_exact_and_rejects_only_losers(layouts, tables, wind_inst_freq,
+                                                      memory_budget):
+    full   = getAEPBatch(layouts, wind_inst_freq, tables)
+    result = progressiveAEP(layouts, np.median(full), wind_inst_freq, tables,
+                            memory_budget=memory_budget)
+    kept   = ~result['rejected']
+    assert np.all(full[result['rejected']] <= np.median(full))
+    np.testing.assert_allclose(result['aep'][kept], full[kept], rtol=1e-12)
+    np.testing.assert_allclose(result['mass'][kept], 1.0)
+
+
+@pytest.mark.parametrize('memory_budget', [1e5, 1e6, 1e7])
+def test_progressive_peak_bytes_within_budget(layouts, tables, wind_inst_freq, memory_budget):
+    result, stats = progressiveAEP(layouts, -np.inf, wind_inst_freq, tables,
+                                   memory_budget=memory_budget, return_stats=True)
+    assert stats['peak_bytes'] <= memory_budget
+    np.testing.assert_allclose(result['aep'], getAEPBatch(layouts, wind_inst_freq, tables),
+                               rtol=1e-12)
+
+
+def test_progressive_mass_covers_the_whole_rose(layouts, tables, wind_inst_freq):
+    result = progressiveAEP(layouts[0], -np.inf, wind_inst_freq, tables)
+    assert result['mass'] == pytest.approx(1.0)
+    # instances that cannot produce power are accounted for without evaluation
+    assert result['instances'] == np.count_nonzero(wind_inst_freq.ravel()*upperBoundPower(tables))
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Constraint handling of GA_Engine"""
+
+# Module List
+import numpy  as np
+
+from GA_Engine import repair, feasible_layouts, is_feasible, generate_random_locations
+
+
+def test_repair_makes_random_layouts_feasible():
+    rng     = np.random.default_rng(1)
+    layouts = rng.uniform(0, 4000, (20, 50, 2))
+    assert not np.any(feasible_layouts(layouts))
+    repaired, feasible = repair(layouts, rng=2)
+    assert np.all(feasible)
+    np.testing.assert_array_equal(feasible_layouts(repaired), feasible)
+
+
+def test_repair_leaves_feasible_layouts_alone():
+    layout = generate_random_locations(np.random.default_rng(3))
+    repaired, feasible = repair(layout)
+    assert feasible and is_feasible(repaired)
+    np.testing.assert_array_equal(repaired, layout)
+
+
+def test_repair_separates_stacked_turbines():
+    layout = np.full((10, 2), 2000.0)
+    repaired, feasible = repair(layout, rng=0)
+    assert feasible
+
+
+def test_repair_reports_impossible_layouts():
+    # 300 turbines 400 m apart don't fit in the farm
+    layouts = np.random.default_rng(4).uniform(0, 4000, (1, 300, 2))
+    repaired, feasible = repair(layouts, max_iterations=50)
+    assert not feasible[0]
+    np.testing.assert_array_equal(feasible_layouts(repaired), feasible)
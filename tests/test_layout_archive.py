@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Layout_Archive round trip and what run_ga puts in it"""
+
+# Module List
+import numpy  as np
+
+from Batch_Evaluator import BatchEvaluator
+from GA_Engine       import best_improvement, default_settings, run_ga
+from Layout_Archive  import LayoutArchive, bestLayouts, layoutHash, operator_names, \
+                            quantize, readArchive, sampleLayouts
+from Run_Controller  import RunController
+from Wind_Fidelity   import MultiFidelityEvaluator
+
+
+def test_round_trip(tmp_path, layouts):
+    file_name = str(tmp_path/'layouts.arc')
+    aep = np.linspace(500, 510, len(layouts))
+    with LayoutArchive(file_name) as archive:
+        archive.append(layouts[:3], aep[:3], 'initial')
+        archive.generation, archive.fidelity = 4, 2.5
+        archive.append(layouts[3:], aep[3:], 'crossover', parents=layouts[:3])
+
+    records = readArchive(file_name)
+    np.testing.assert_allclose(records['coords']*(4000.0/65535), layouts, atol=0.04)
+    np.testing.assert_array_equal(records['aep'], aep.astype(np.float32))
+    np.testing.assert_array_equal(records['fidelity'], [0, 0, 0, 2.5, 2.5, 2.5])
+    np.testing.assert_array_equal(records['generation'], [0, 0, 0, 4, 4, 4])
+    np.testing.assert_array_equal(records['hash'], layoutHash(quantize(layouts)))
+    np.testing.assert_array_equal(records['parent'][3:], records['hash'][:3])
+    assert [operator_names[k] for k in records['operator']] == ['initial']*3 + ['crossover']*3
+
+    # the better coarse scores are not mixed in unless asked for
+    coords, best = bestLayouts(records, 2)
+    np.testing.assert_array_equal(best, aep[[2, 1]].astype(np.float32))
+    assert bestLayouts(records, 2, max_fidelity=np.inf)[1][0] == np.float32(aep[-1])
+    assert len(sampleLayouts(records, 10, rng=0)[1]) == 3
+
+
+def test_run_archives_every_scored_layout(tmp_path, tables, wind_inst_freq):
+    settings = dict(default_settings, mu=8, c=4, iterations=6, no_retained=2)
+    evaluate = MultiFidelityEvaluator(wind_inst_freq, tables, schedule=[2, 4])
+    controller = RunController(stall_generations=1, min_improvement=1e9)
+    file_name  = str(tmp_path/'run.arc')
+    with LayoutArchive(file_name) as archive:
+        result = run_ga(settings, evaluate, rng=0, verbose=False, controller=controller,
+                        archive=archive)
+
+    records   = readArchive(file_name)
+    operators = {operator_names[k] for k in records['operator']}
+    assert {'initial', 'crossover', 'mutation', 'restart', 'rescore'} <= operators
+    assert set(np.unique(records['fidelity'])) == {r.error_bound for r in evaluate.roses}
+    # every layout scored on the full rose is there, the final population included
+    exact = records[records['fidelity'] == 0]
+    assert np.max(exact['aep']) >= np.float32(result['best_aep'])
+
+
+def test_turned_down_candidates_are_archived(tmp_path, layouts, tables, wind_inst_freq):
+    plain = BatchEvaluator(wind_inst_freq, tables)
+    aep   = plain(layouts)
+    with LayoutArchive(str(tmp_path/'moves.arc')) as archive:
+        # nothing beats the best of them, all are scored and turned down
+        found = best_improvement(lambda l: plain(l), layouts, np.max(aep),
+                                 dict(default_settings), archive, layouts[0])
+    records = readArchive(str(tmp_path/'moves.arc'))
+    assert found is None and len(records) == len(layouts)
+    assert np.all(records['parent'] == layoutHash(quantize(layouts[:1]))[0])
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Operator_Scheduler arms"""
+
+# Module List
+import numpy  as np
+
+from Batch_Evaluator    import BatchEvaluator, getAEPBatch
+from GA_Engine          import default_settings, new_population
+from Operator_Scheduler import _local_search
+
+
+def test_local_search_arm_reuses_its_aep(layouts, tables, wind_inst_freq):
+    def evaluate(layouts):
+        raise AssertionError('local search AEP re-evaluated')
+
+    settings   = dict(default_settings, mu=len(layouts), c=len(layouts))
+    aep        = getAEPBatch(layouts, wind_inst_freq, tables)
+    population = new_population(layouts.copy(), aep.copy(), settings)
+    context    = {'wind_inst_freq': wind_inst_freq, 'tables': tables, 'n_candidates': 8}
+    population = _local_search(population, settings, evaluate, np.random.default_rng(0), context)
+
+    i = int(np.argmax(population['aep'] - aep))
+    assert population['aep'][i] > aep[i]
+    assert population['aep'][i] == float(getAEPBatch(population['coords'][i], wind_inst_freq,
+                                                      tables))
+
+
+def test_local_search_arm_tracks_losses(layouts, tables, wind_inst_freq):
+    settings   = dict(default_settings, mu=len(layouts), c=len(layouts), track_loss=True)
+    evaluate   = BatchEvaluator(wind_inst_freq, tables)
+    population = new_population(layouts.copy(), evaluate(layouts), settings)
+    context    = {'wind_inst_freq': wind_inst_freq, 'tables': tables, 'n_candidates': 8}
+    population = _local_search(population, settings, evaluate, np.random.default_rng(0), context)
+
+    i = int(np.argmax(np.any(population['loss'] != 0, axis=1)))
+    np.testing.assert_allclose(population['loss'][i],
+                               evaluate.breakdown(population['coords'][i])['turbine_loss'])
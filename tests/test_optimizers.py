@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Constraint handling of the ask/tell optimizers"""
+
+# Module List
+import numpy  as np
+
+from Batch_Evaluator import BatchEvaluator
+from GA_Engine       import generate_random_locations, is_feasible
+from Optimizers      import CMAES, Optimizer, SimulatedAnnealing, run_optimizer
+
+
+def test_cmaes_never_returns_an_infeasible_best(tables, wind_inst_freq):
+    evaluate = BatchEvaluator(wind_inst_freq, tables)
+    start    = generate_random_locations(np.random.default_rng(0), 20)
+    result   = run_optimizer(CMAES(start, sigma=300, rng=0), evaluate, max_evaluations=60)
+    assert result['repaired'] > 0
+    assert is_feasible(result['best_layout'])
+
+
+def test_unrepairable_proposals_are_not_scored(tables, wind_inst_freq):
+    class Packed(Optimizer):
+        """Proposes 120 turbines, more than the farm can hold"""
+        def ask(self):
+            return(np.full((4, 120, 2), 2000.0))
+
+        def tell(self, layouts, aep):
+            self.record(layouts, aep)
+
+    calls    = []
+    evaluate = BatchEvaluator(wind_inst_freq, tables)
+    result   = run_optimizer(Packed(), lambda l: calls.append(l) or evaluate(l),
+                             max_evaluations=10, max_idle_steps=2)
+    assert calls == [] and result['rejected'] == 8
+    assert result['best_layout'] is None and result['best_aep'] == -np.inf
+
+
+def test_annealing_without_feasible_moves_stops_asking(monkeypatch):
+    import Optimizers
+    monkeypatch.setattr(Optimizers, 'feasible_positions',
+                        lambda layout, turbine, candidates: np.zeros(len(candidates), bool))
+    layout = generate_random_locations(np.random.default_rng(0), 20)
+    sa     = SimulatedAnnealing(layout, max_attempts=5, rng=0)
+    sa.current_aep = 0.0
+    proposals = sa.ask()
+    assert sa.stuck == 1 and sa.relocating is None
+    assert proposals.shape == (0, 20, 2)
+
+
+def test_stuck_annealing_steps_cost_no_evaluation(monkeypatch, tables, wind_inst_freq):
+    import Optimizers
+    monkeypatch.setattr(Optimizers, 'feasible_positions',
+                        lambda layout, turbine, candidates: np.zeros(len(candidates), bool))
+    layout   = generate_random_locations(np.random.default_rng(0), 20)
+    sa       = SimulatedAnnealing(layout, max_attempts=5, rng=0)
+    evaluate = BatchEvaluator(wind_inst_freq, tables)
+    calls    = []
+    result   = run_optimizer(sa, lambda l: calls.append(l) or evaluate(l),
+                             max_evaluations=10, max_idle_steps=3)
+    # only the starting layout is scored, and nothing is accepted
+    assert len(calls) == 1 and result['full_eval_equivalents'] == 1
+    assert sa.stuck == 3 and sa.accepted == 0 and sa.step == 3
+    assert np.array_equal(sa.current, layout)
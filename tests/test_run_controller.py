@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""RunController restarts and best tracking"""
+
+# Module List
+import numpy  as np
+
+from Batch_Evaluator import BatchEvaluator, getAEPBatch
+from GA_Engine       import default_settings, new_population, feasible_layouts, \
+                            generate_random_locations, repair
+from Run_Controller  import RunController
+from Wind_Fidelity   import MultiFidelityEvaluator
+
+
+def test_restart_newcomers_are_feasible(tables, wind_inst_freq, monkeypatch):
+    import Run_Controller
+
+    def failing_repair(layouts, rng=None):
+        # as if the first jittered elite could not be repaired
+        coords, feasible = repair(layouts, rng=rng)
+        coords[0], feasible[0] = 2000.0, False
+        return(coords, feasible)
+
+    monkeypatch.setattr(Run_Controller, 'repair', failing_repair)
+    settings   = dict(default_settings, mu=8, no_of_turbines=50)
+    rng        = np.random.default_rng(0)
+    controller = RunController(restart_fraction=1.0)
+    evaluate   = controller.wrap(BatchEvaluator(wind_inst_freq, tables))
+    coords     = np.stack([generate_random_locations(rng) for i in range(8)])
+    population = new_population(coords, evaluate(coords), settings)
+    controller.observe(population)
+    population = controller.restart(population, settings, evaluate, rng)
+    assert np.all(feasible_layouts(population['coords']))
+
+
+def test_best_is_scored_on_full_rose(tables, wind_inst_freq, layouts):
+    fidelity   = MultiFidelityEvaluator(wind_inst_freq, tables, tolerances=(0.2, 0.0))
+    controller = RunController()
+    evaluate   = controller.wrap(fidelity)
+    settings   = dict(default_settings, mu=len(layouts))
+    population = new_population(layouts, evaluate(layouts), settings)
+
+    controller.observe(population)
+    best = controller.best_aep
+    assert best == getAEPBatch(controller.best_layout, wind_inst_freq, tables)
+
+    fidelity.promote()
+    controller.rescale()
+    assert controller.best_aep == best and controller.best_layout is not None
+
+
+def test_relocations_are_counted_alike(tables, wind_inst_freq, layouts):
+    fidelity   = MultiFidelityEvaluator(wind_inst_freq, tables, tolerances=(0.0,))
+    controller = RunController()
+    evaluate   = controller.wrap(fidelity)
+    candidates = layouts[1,:10]
+    evaluate.relocation(layouts[0], 3, candidates)
+    assert fidelity.evaluations == [10/50] and controller.evaluations == 10/50
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Smoothed AEP gradient and the projected refinement"""
+
+# Module List
+import numpy  as np
+
+import Smooth_Evaluator
+from Batch_Evaluator  import getAEPBatch
+from GA_Engine        import is_feasible
+from Smooth_Evaluator import checkGradient, gradient_refinement, smoothAEP
+
+
+def test_gradient_matches_finite_differences(layouts, tables, wind_inst_freq):
+    check = checkGradient(layouts[0], wind_inst_freq, tables, rng=0)
+    assert check['max_rel_error'] < 1e-4
+
+
+def test_refinement_returns_a_feasible_layout_no_worse(layouts, tables, wind_inst_freq):
+    layout, aep, stats = gradient_refinement(layouts[0], wind_inst_freq, tables, max_iterations=10)
+    assert is_feasible(layout)
+    assert aep >= stats['start_aep']
+    assert aep == float(getAEPBatch(layout, wind_inst_freq, tables))
+    assert stats['improved'] == (aep > stats['start_aep'])
+
+
+def test_infeasible_projections_are_never_accepted(monkeypatch, layouts, tables, wind_inst_freq):
+    monkeypatch.setattr(Smooth_Evaluator, 'repair', lambda layout: (layout, False))
+    layout, aep, stats = gradient_refinement(layouts[0], wind_inst_freq, tables, max_iterations=10)
+    assert stats['infeasible'] > 0 and stats['exact_evaluations'] == 1
+    assert np.array_equal(layout, layouts[0]) and aep == stats['start_aep']
+
+
+def test_annealed_edge_agrees_with_the_exact_model(layouts, tables, wind_inst_freq):
+    gaps = [abs(smoothAEP(layouts[0], wind_inst_freq, tables, edge, return_grad=False)
+                - float(getAEPBatch(layouts[0], wind_inst_freq, tables))) for edge in (10.0, 1.0, 0.1)]
+    assert gaps[0] > gaps[1] > gaps[2] and gaps[2] < 0.1
+
+
+def test_refinement_improves_the_exact_aep_of_a_seed(layouts, tables, wind_inst_freq):
+    layout, aep, stats = gradient_refinement(layouts[1], wind_inst_freq, tables, max_iterations=10)
+    assert stats['improved'] and aep > stats['start_aep'] + 1.0
+    assert len(stats['smoothing_gap']) == 3
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Steady state GA evaluation count"""
+
+# Module List
+import numpy  as np
+import pytest
+
+from Batch_Evaluator import BatchEvaluator
+from GA_Engine       import default_settings
+from Steady_State    import run_steady_state
+
+
+class CountingEvaluator(BatchEvaluator):
+    """BatchEvaluator counting the layouts it scores"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.layouts = 0
+
+    def __call__(self, layouts):
+        self.layouts += len(layouts) if np.ndim(layouts) == 3 else 1
+        return(super().__call__(layouts))
+
+    def breakdown(self, layouts):
+        self.layouts += len(layouts)
+        return(super().breakdown(layouts))
+
+
+@pytest.mark.parametrize('mutation_mode', ['random', 'guided'])
+def test_initial_population_scored_once(tables, wind_inst_freq, mutation_mode):
+    settings = dict(default_settings, mu=6, c=3, mutation_mode=mutation_mode)
+    evaluate = CountingEvaluator(wind_inst_freq, tables)
+    result   = run_steady_state(settings, evaluate, rng=0, n_workers=2, backend='thread',
+                                max_evaluations=4, verbose=False)
+    assert result['evaluations'] == 4
+    assert evaluate.layouts == 6 + 4
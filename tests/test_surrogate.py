@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""SurrogateScreen accounting"""
+
+# Module List
+import numpy  as np
+import pytest
+
+from Surrogate import SurrogateScreen
+
+
+def test_statistics_are_net_of_the_surrogate_work(layouts, tables, wind_inst_freq):
+    surrogate = SurrogateScreen(wind_inst_freq, tables, min_samples=2)
+    surrogate.update(np.arange(3.0), layouts[:3])
+    keep = surrogate.screen(layouts, 2)
+    surrogate.update(np.arange(2.0))
+
+    stats = surrogate.statistics()
+    per_layout = (24 + 36)/540
+    assert (stats['screened'], stats['evaluated'], stats['fitted']) == (6, 2, 3)
+    assert stats['cost'] == pytest.approx((6 + 3)*per_layout)
+    assert stats['baseline'] == 6
+    assert stats['net_saved'] == pytest.approx(6 - 2 - stats['cost'])
+    assert stats['overhead'] == pytest.approx(stats['cost']/2)
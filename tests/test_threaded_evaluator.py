@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""Threaded_Evaluator shared pools"""
+
+# Module List
+import numpy  as np
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def test_pools_of_other_sizes_stay_up(layouts, tables, wind_inst_freq):
+    Threaded_Evaluator = pytest.importorskip('Threaded_Evaluator')
+    getAEPThreaded, getExecutor = Threaded_Evaluator.getAEPThreaded, Threaded_Evaluator.getExecutor
+
+    two, n_workers = getExecutor(2)
+    assert getExecutor(3)[0] is not two and getExecutor(2)[0] is two and n_workers == 2
+    assert two.submit(lambda: 1).result() == 1
+
+    expected = getAEPThreaded(layouts, wind_inst_freq, tables, max_workers=1)
+    with ThreadPoolExecutor(8) as callers:
+        results = list(callers.map(lambda k: getAEPThreaded(layouts, wind_inst_freq, tables,
+                                                            max_workers=1 + k % 4), range(32)))
+    for aep in results:
+        np.testing.assert_allclose(aep, expected, rtol=1e-12)
+
+
+def test_float64_power_curve_is_cast_for_the_kernel(layouts, tables, wind_inst_freq):
+    Threaded_Evaluator = pytest.importorskip('Threaded_Evaluator')
+    wide = tables._replace(power_curve=tables.power_curve.astype(np.float64))
+    np.testing.assert_allclose(Threaded_Evaluator.getAEPThreaded(layouts, wind_inst_freq, wide),
+                               Threaded_Evaluator.getAEPThreaded(layouts, wind_inst_freq, tables),
+                               rtol=1e-12)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""Columnar wind store against binning the csv files"""
+
+# Module List
+import numpy  as np
+
+import os
+
+from Batch_Evaluator import binWindEnsemble
+from Wind_Store      import convertWindData, binWindStore, readManifest
+from conftest        import root
+
+
+def test_store_matches_ensemble(tmp_path):
+    files = [os.path.join(root, 'wind_data_2007.csv'), os.path.join(root, 'wind_data_2009.csv')]
+    convertWindData(files, str(tmp_path))
+    names, stack = binWindStore(str(tmp_path))
+    expected_names, expected = binWindEnsemble(files)
+    assert names == expected_names
+    np.testing.assert_allclose(stack, expected, rtol=1e-6, atol=1e-12)
+
+
+def test_store_selects_years(tmp_path):
+    files = [os.path.join(root, 'wind_data_2007.csv'), os.path.join(root, 'wind_data_2009.csv')]
+    convertWindData(files, str(tmp_path))
+    assert [e['year'] for e in readManifest(str(tmp_path))['entries']] == [2007, 2009]
+    names, stack = binWindStore(str(tmp_path), years=[2009])
+    assert names == ['wind_data_2009'] and stack.shape == (1, 36, 15)